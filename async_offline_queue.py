@@ -0,0 +1,375 @@
+
+import asyncio
+import json
+import os
+import time
+import zlib
+from typing import Callable, Dict, List, Optional
+
+from compaction import CompactionPolicy
+from metrics import QueueMetrics
+from offline_queue import (
+    JOURNAL_SUFFIX, _PendingStore, _default_serial, load_record, read_queue_file, write_queue_file
+)
+from transports import InMemoryTransport, Transport
+
+
+class _AsyncShard:
+    """One sender task: its own inbox, pending payloads and ACK state"""
+
+    def __init__(self, index: int, on_drop: Callable[[str, str], None]):
+        self.index = index
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending = _PendingStore(on_drop=on_drop)
+        self.unfinished = 0
+        self.acks = 0
+        self.ack_event = asyncio.Event()
+        self.ack_started = None
+        self.task: Optional[asyncio.Task] = None
+
+
+class AsyncOfflineQueue:
+    """
+    asyncio counterpart of OfflineQueue for gateway services.
+
+    Same queue_file format (an OfflineQueue journal is replayed on load and
+    emptied by the next snapshot), dedup, sharding, TTL and compaction rules, but
+    every shard is a coroutine on the caller's event loop instead of a
+    thread: put() wakes the sender directly and ACK waits are events, so
+    nothing polls. put() returns a future per payload that resolves to True
+    once the device ACKs it and to False if it expires, is superseded or the
+    queue is cleared. Payloads reloaded from disk have no future. close()
+    keeps unsent payloads on disk for the next start and cancels their
+    futures. Transport round trips and queue_file writes run in the loop's
+    default executor, so the loop itself only does the bookkeeping.
+
+        async with AsyncOfflineQueue("pending.json", transport=t) as q:
+            delivered = await q.put({"device_status": 1, "device_data": frame})
+            await delivered
+    """
+
+    def __init__(
+        self,
+        queue_file: str,
+        on_send_success: Optional[Callable[[str], None]] = None,
+        on_send_fail: Optional[Callable[[str], None]] = None,
+        ack_timeout: float = 10.0,
+        transport: Optional[Transport] = None,
+        batch_size: int = 1,
+        retry_interval: float = 0.5,
+        shards: int = 1,
+        key: Optional[Callable[[dict], str]] = None,
+        default_ttl: Optional[float] = None,
+        compaction: Optional[CompactionPolicy] = None
+    ):
+        self.queue_file = queue_file
+        self.on_send_success = on_send_success
+        self.on_send_fail = on_send_fail
+        self.ack_timeout = ack_timeout
+        # Uses transport.publish_batch_async(); None = InMemoryTransport
+        self.transport = transport or InMemoryTransport()
+        self.batch_size = max(1, batch_size)
+        self.retry_interval = retry_interval
+        self.key = key or _default_serial
+        self.default_ttl = default_ttl
+        self.compaction = compaction or CompactionPolicy()
+        self.shard_count = max(1, shards)
+
+        self.metrics = QueueMetrics("AsyncOfflineQueue")
+        self.metrics.gauge("depth", lambda: sum(len(s.pending) + s.queue.qsize() for s in self._shards))
+        self._shards: List[_AsyncShard] = []
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._idle: Optional[asyncio.Condition] = None
+        self._save_dirty = False
+        self._save_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+    # Public API
+
+    async def start(self):
+        """Load the queue file and start one sender task per shard on the running loop"""
+        self._loop = asyncio.get_running_loop()
+        self._idle = asyncio.Condition()
+        self._shards = [_AsyncShard(i, self._on_drop) for i in range(self.shard_count)]
+        self._load_from_disk()
+        for shard in self._shards:
+            shard.task = asyncio.create_task(self._sender(shard), name=f"AsyncOfflineQueue-{shard.index}")
+
+    async def close(self):
+        for shard in self._shards:
+            if shard.task:
+                shard.task.cancel()
+        await asyncio.gather(*(s.task for s in self._shards if s.task), return_exceptions=True)
+        # Payloads still in an inbox were never stored; keep them for the next start
+        for shard in self._shards:
+            while not shard.queue.empty():
+                put_at, payload_str, expires_at, key = shard.queue.get_nowait()
+                shard.pending.append(payload_str, put_at, expires_at, key)
+            shard.unfinished = 0
+        self._save_dirty = True
+        if self._save_task is not None:
+            await asyncio.gather(self._save_task, return_exceptions=True)
+        await self._save_to_disk()
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def put(self, payload: dict, serial: Optional[str] = None, ttl: Optional[float] = None) -> asyncio.Future:
+        """Queue a payload; the returned future resolves True on ACK, False if dropped"""
+        payload_str = json.dumps(payload, separators=(',', ':'))
+        future = self._futures.get(payload_str)
+        if future is None:
+            future = self._loop.create_future()
+            self._futures[payload_str] = future
+        now = time.time()
+        if ttl is None:
+            ttl = self.compaction.ttl(payload)
+        if ttl is None:
+            ttl = self.default_ttl
+        expires_at = now + ttl if ttl is not None else None
+        shard = self._shard_for(self.key(payload) if serial is None else serial)
+        shard.unfinished += 1
+        shard.queue.put_nowait((now, payload_str, expires_at, self.compaction.supersede_key(payload)))
+        self.metrics.incr("enqueued")
+        return future
+
+    async def put_many(self, payloads: List[dict]) -> List[asyncio.Future]:
+        return [await self.put(payload) for payload in payloads]
+
+    async def acknowledge(self, count: int = 1, serial: Optional[str] = None):
+        self.acknowledge_nowait(count, serial)
+
+    def acknowledge_nowait(self, count: int = 1, serial: Optional[str] = None):
+        """Synchronous acknowledge() for callbacks already running on the loop"""
+        shard = self._shard_for(serial) if serial is not None else self._longest_waiting()
+        shard.acks += count
+        if shard.ack_started is not None:
+            waited = time.monotonic() - shard.ack_started
+            for _ in range(count):
+                self.metrics.ack_wait.record(waited)
+        shard.ack_event.set()
+
+    async def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued and pending payload is acknowledged. False on timeout."""
+        async def drained():
+            async with self._idle:
+                await self._idle.wait_for(self._is_drained)
+        try:
+            await asyncio.wait_for(drained(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def snapshot(self) -> dict:
+        snap = self.metrics.snapshot()
+        snap["shards"] = [len(s.pending) + s.queue.qsize() for s in self._shards]
+        return snap
+
+    def get_pending_count(self) -> int:
+        return sum(len(s.pending) for s in self._shards)
+
+    def get_pending(self) -> list:
+        records = [r for s in self._shards for r in s.pending.to_records()]
+        return [r["payload"] for r in sorted(records, key=lambda r: r["enqueued_at"])]
+
+    def clear(self):
+        """Clear all pending data (use with caution)"""
+        for shard in self._shards:
+            for payload_str in shard.pending.to_list():
+                self._resolve(payload_str, False)
+            shard.pending.clear()
+        for path in (self.queue_file, self.queue_file + JOURNAL_SUFFIX):
+            if os.path.exists(path):
+                os.remove(path)
+        if self._save_task is not None and not self._save_task.done():
+            # The write in flight still holds the old records
+            self._save_soon()
+        print("[AsyncOfflineQueue] Queue cleared")
+
+
+    # Internal: disk persistence
+
+    def _load_from_disk(self):
+        try:
+            for record in read_queue_file(self.queue_file):
+                load_record(self._shard_for_payload(record.get("payload", "")).pending, record)
+            print(f"[AsyncOfflineQueue] Loaded {self.get_pending_count()} pending payload(s)")
+        except Exception as e:
+            print(f"[AsyncOfflineQueue] Failed to load queue: {e}")
+            for shard in self._shards:
+                shard.pending = _PendingStore(on_drop=self._on_drop)
+
+    def _save_soon(self):
+        # Coalesce every change made while a write is in flight into the next one
+        self._save_dirty = True
+        if self._save_task is None or self._save_task.done():
+            self._save_task = self._loop.create_task(self._save_to_disk())
+
+    async def _save_to_disk(self):
+        while self._save_dirty:
+            self._save_dirty = False
+            records = []
+            for shard in self._shards:
+                records.extend(shard.pending.to_records())
+            await self._loop.run_in_executor(None, self._write_records, records)
+
+    def _write_records(self, records: list):
+        # Executor thread: sort and serialize off the loop, swap the snapshot in, empty the journal
+        try:
+            write_queue_file(self.queue_file, records)
+        except Exception as e:
+            print(f"[AsyncOfflineQueue] Failed to save queue: {e}")
+
+
+    # Internal: sharding
+
+    def _shard_for(self, serial: str) -> _AsyncShard:
+        return self._shards[zlib.crc32(str(serial).encode('utf-8')) % len(self._shards)]
+
+    def _shard_for_payload(self, payload_str: str) -> _AsyncShard:
+        if len(self._shards) == 1:
+            return self._shards[0]
+        try:
+            return self._shard_for(self.key(json.loads(payload_str)))
+        except Exception:
+            return self._shards[0]
+
+    def _longest_waiting(self) -> _AsyncShard:
+        waiting = [s for s in self._shards if s.ack_started is not None]
+        if not waiting:
+            return self._shards[0]
+        return min(waiting, key=lambda s: s.ack_started)
+
+
+    # Internal: sender tasks
+
+    async def _sender(self, shard: _AsyncShard):
+        while True:
+            if shard.pending.expire(time.time()):
+                self._save_soon()
+            batch, taken, meta = await self._collect_batch(shard)
+            ok = True
+            try:
+                if batch:
+                    ok = await self._send_batch(shard, batch, meta)
+            except asyncio.CancelledError:
+                # close() while a batch was out: it is not ACKed, keep it for the next start
+                self._store(shard, batch, meta)
+                raise
+            finally:
+                shard.unfinished -= taken
+                async with self._idle:
+                    self._idle.notify_all()
+            if not ok:
+                await asyncio.sleep(self.retry_interval)
+
+    async def _collect_batch(self, shard: _AsyncShard):
+        """Oldest pending payloads first, topped up with new ones from put()"""
+        batch = shard.pending.head(self.batch_size)
+        taken = 0
+        meta = {}        # payload_str -> (put_at, expires_at, key) for new payloads
+        while len(batch) < self.batch_size:
+            if batch and shard.queue.empty():
+                break
+            # Only suspends when there is nothing at all to send
+            put_at, payload_str, expires_at, key = await shard.queue.get()
+            taken += 1
+            if payload_str in shard.pending or payload_str in meta:
+                self.metrics.incr("deduped")
+                continue
+            if expires_at is not None and expires_at <= time.time():
+                self._on_drop("expired", payload_str)
+                continue
+            if key is not None:
+                self._supersede(shard, batch, meta, key)
+            batch.append(payload_str)
+            meta[payload_str] = (put_at, expires_at, key)
+        return batch, taken, meta
+
+    def _supersede(self, shard: _AsyncShard, batch: List[str], meta: dict, key: str):
+        for payload_str in list(batch):
+            if meta.get(payload_str, (None, None, None))[2] == key:
+                batch.remove(payload_str)
+                del meta[payload_str]
+                self._on_drop("superseded", payload_str)
+        older = shard.pending.payload_for_key(key)
+        if older in batch:
+            batch.remove(older)
+        if shard.pending.discard_key(key):
+            self._save_soon()
+
+    async def _send_batch(self, shard: _AsyncShard, batch: List[str], meta: dict) -> bool:
+        started = time.monotonic()
+        shard.acks = 0
+        shard.ack_event.clear()
+        shard.ack_started = started
+        results = await self.transport.publish_batch_async(batch)
+        self.metrics.publish_latency.record(time.monotonic() - started)
+
+        sent = [p for p, ok in zip(batch, results) if ok]
+        failed = [p for p, ok in zip(batch, results) if not ok]
+        self.metrics.incr("sent", len(sent))
+        self.metrics.incr("failed", len(failed))
+        if failed:
+            self._store(shard, failed, meta)
+            if self.on_send_fail:
+                for payload_str in failed:
+                    self.on_send_fail(payload_str)
+        if not sent:
+            shard.ack_started = None
+            return False
+
+        # ACKs arrive in publish order, so the first `acked` payloads are done
+        acked = await self._wait_for_acks(shard, len(sent))
+        self.metrics.incr("acked", acked)
+        for payload_str in sent[:acked]:
+            shard.pending.remove(payload_str)
+            self._resolve(payload_str, True)
+            if self.on_send_success:
+                self.on_send_success(payload_str)
+        if acked:
+            self._save_soon()
+        if acked < len(sent):
+            self._store(shard, sent[acked:], meta)
+            return False
+        return not failed
+
+    async def _wait_for_acks(self, shard: _AsyncShard, expected: int) -> int:
+        deadline = time.monotonic() + self.ack_timeout
+        while shard.acks < expected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(shard.ack_event.wait(), remaining)
+            except asyncio.TimeoutError:
+                break
+            shard.ack_event.clear()
+        shard.ack_started = None
+        return min(shard.acks, expected)
+
+    def _store(self, shard: _AsyncShard, payload_strs: List[str], meta: dict):
+        added = [shard.pending.append(p, *meta.get(p, (None, None, None))) for p in payload_strs]
+        if any(added):
+            self._save_soon()
+
+    def _on_drop(self, reason: str, payload_str: str):
+        self.metrics.incr(reason)
+        self._resolve(payload_str, False)
+
+    def _resolve(self, payload_str: str, delivered: bool):
+        future = self._futures.pop(payload_str, None)
+        if future is not None and not future.done():
+            future.set_result(delivered)
+
+    def _is_drained(self) -> bool:
+        return all(s.unfinished == 0 and not s.pending for s in self._shards)
@@ -0,0 +1,94 @@
+
+from typing import Callable, Iterable, Optional
+
+
+class CompactionPolicy:
+    """
+    Decides, once per payload at enqueue time, how OfflineQueue may drop it.
+
+    ttl() returns seconds after which the payload is stale (None = never).
+    supersede_key() groups payloads where only the newest one matters: when
+    a payload with the same key is queued, the older one is dropped before
+    it is replayed (None = never superseded).
+    """
+
+    def ttl(self, payload: dict) -> Optional[float]:
+        return None
+
+    def supersede_key(self, payload: dict) -> Optional[str]:
+        return None
+
+
+class KeepLatest(CompactionPolicy):
+    """Keep only the newest payload per key, e.g. KeepLatest(by_fields("serial", "mode"))"""
+
+    def __init__(self, key: Callable[[dict], Optional[str]]):
+        self.key = key
+
+    def supersede_key(self, payload: dict) -> Optional[str]:
+        return self.key(payload)
+
+
+class MaxAge(CompactionPolicy):
+    """Drop payloads older than max_age seconds unless keep(payload) is true"""
+
+    def __init__(self, max_age: float, keep: Optional[Callable[[dict], bool]] = None):
+        self.max_age = max_age
+        self.keep = keep
+
+    def ttl(self, payload: dict) -> Optional[float]:
+        if self.keep and self.keep(payload):
+            return None
+        return self.max_age
+
+
+class ChainPolicy(CompactionPolicy):
+    """Combine policies: the shortest TTL wins, the first supersede key wins"""
+
+    def __init__(self, *policies: CompactionPolicy):
+        self.policies = policies
+
+    def ttl(self, payload: dict) -> Optional[float]:
+        ttls = [t for t in (p.ttl(payload) for p in self.policies) if t is not None]
+        return min(ttls) if ttls else None
+
+    def supersede_key(self, payload: dict) -> Optional[str]:
+        for policy in self.policies:
+            key = policy.supersede_key(payload)
+            if key is not None:
+                return key
+        return None
+
+
+def by_fields(*fields: str) -> Callable[[dict], Optional[str]]:
+    """Supersede key built from payload fields; None if any of them is missing"""
+    def key(payload: dict) -> Optional[str]:
+        values = [payload.get(f) for f in fields]
+        if any(v is None for v in values):
+            return None
+        return "|".join(str(v) for v in values)
+    return key
+
+
+def is_settings_frame(payload: dict) -> bool:
+    """True for '*...#' settings frames (they carry an F or I section marker)"""
+    parts = str(payload.get("device_data", "")).strip().strip("*#").split(",")
+    return any(p.strip() in ("F", "I") for p in parts)
+
+
+def settings_frame_key(payload: dict) -> Optional[str]:
+    """Supersede key for settings frames: the serial after the F/I marker, else None"""
+    parts = [p.strip() for p in str(payload.get("device_data", "")).strip().strip("*#").split(",")]
+    for marker in ("F", "I"):
+        if marker in parts:
+            idx = parts.index(marker) + 8
+            return f"settings|{parts[idx]}" if idx < len(parts) else None
+    return None
+
+
+def telemetry_policy(max_age: float = 24 * 3600, keep_latest: Iterable[str] = ()) -> CompactionPolicy:
+    """Drop telemetry older than max_age but never settings; newest settings frame per serial wins"""
+    policies = [KeepLatest(settings_frame_key), MaxAge(max_age, keep=is_settings_frame)]
+    if keep_latest:
+        policies.insert(0, KeepLatest(by_fields(*keep_latest)))
+    return ChainPolicy(*policies)
@@ -0,0 +1,162 @@
+
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+# Connection states (also the strings emitted to the UI)
+STATE_CONNECTING = "connecting"
+STATE_CONNECTED = "connected"
+STATE_BACKOFF = "backoff"
+STATE_SUSPENDED = "suspended"
+
+
+class ConnectionBudget:
+    """
+    Token bucket limiting how often connect() may be attempted.
+
+    One budget is shared by every dashboard window in the process, so a
+    broker blip can't turn N open windows into N reconnect loops.
+    """
+
+    def __init__(self, max_attempts: int = 6, per_seconds: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_attempts = max_attempts
+        self.per_seconds = per_seconds
+        self.clock = clock
+        self._tokens = float(max_attempts)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one attempt token. Returns 0 on success, else seconds until one is available."""
+        with self._lock:
+            now = self.clock()
+            rate = self.max_attempts / self.per_seconds
+            self._tokens = min(self.max_attempts, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / rate
+
+
+default_budget = ConnectionBudget()
+
+
+class ReconnectStateMachine:
+    """
+    connecting → connected → backoff → connecting ... → suspended
+
+    Failed attempts back off with decorrelated jitter
+    (delay = min(max_delay, uniform(base_delay, 3 * previous_delay))), so clients
+    that lost the broker at the same moment don't retry in lockstep. After
+    max_failures consecutive failures the machine parks in `suspended` for
+    suspend_time. network_up() cuts any wait short. clock and rng default to
+    time.monotonic and the random module.
+    """
+
+    def __init__(
+        self,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        max_failures: int = 10,
+        suspend_time: float = 300.0,
+        budget: Optional[ConnectionBudget] = None,
+        on_transition: Optional[Callable[[str, float], None]] = None,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_failures = max_failures
+        self.suspend_time = suspend_time
+        self.budget = budget or default_budget
+        self.on_transition = on_transition
+        self.clock = clock
+        self.rng = rng or random
+
+        self.state = STATE_BACKOFF
+        self.failures = 0
+        self._delay = 0.0
+        self._next_attempt = 0.0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+
+    # Public API
+
+    def connecting(self):
+        self._transition(STATE_CONNECTING, 0.0)
+
+    def connected(self):
+        with self._lock:
+            self.failures = 0
+            self._delay = 0.0
+        self._transition(STATE_CONNECTED, 0.0)
+
+    def failed(self, error: Optional[Exception] = None) -> float:
+        """Record a failed attempt; returns the delay before the next one"""
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.max_failures:
+                state, delay = STATE_SUSPENDED, self.suspend_time
+            else:
+                upper = max(self.base_delay, self._delay * 3)
+                delay = min(self.max_delay, self.rng.uniform(self.base_delay, upper))
+                state = STATE_BACKOFF
+            self._delay = delay
+            self._next_attempt = self.clock() + delay
+        self._transition(state, delay)
+        return delay
+
+    def disconnected(self):
+        """Connection dropped from `connected`; first retry after a short jittered delay"""
+        with self._lock:
+            delay = self.rng.uniform(0, self.base_delay)
+            self._delay = delay
+            self._next_attempt = self.clock() + delay
+        self._transition(STATE_BACKOFF, delay)
+
+    def network_up(self):
+        """Network came back: resume immediately, even from `suspended`"""
+        with self._lock:
+            if self.state == STATE_CONNECTED:
+                return
+            self.failures = 0
+            self._delay = 0.0
+            self._next_attempt = 0.0
+        self._wake.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Sleep until the next attempt is due, network_up() is called or timeout
+        expires. Returns True when an attempt may start now (budget permitting).
+        """
+        deadline = None if timeout is None else self.clock() + timeout
+        while True:
+            now = self.clock()
+            remaining = max(0.0, self._next_attempt - now)
+            if remaining == 0:
+                remaining = self.budget.acquire()
+                if remaining == 0:
+                    return True
+            if deadline is not None:
+                if now >= deadline:
+                    return False
+                remaining = min(remaining, deadline - now)
+            if self._wake.wait(remaining):
+                self._wake.clear()
+
+
+    # Internal
+
+    def _transition(self, state: str, delay: float):
+        changed = state != self.state
+        self.state = state
+        if changed or state in (STATE_BACKOFF, STATE_SUSPENDED):
+            print(f"[Reconnect] {state}" + (f" (next attempt in {delay:.1f}s)" if delay else ""))
+            if self.on_transition:
+                try:
+                    self.on_transition(state, delay)
+                except Exception as e:
+                    print(f"[Reconnect] Transition callback failed: {e}")
@@ -0,0 +1,154 @@
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from metrics import LatencyHistogram
+
+
+class HasherBusy(RuntimeError):
+    """Too many password hashes already queued"""
+
+
+class PasswordHasher:
+    """
+    Runs generate_password_hash / check_password_hash (PBKDF2) on a bounded
+    worker pool instead of the request thread.
+
+    hashlib's PBKDF2 releases the GIL, so threads hash in parallel while
+    `workers` caps how many cores a login burst can take. At most
+    max_pending hashes are queued or running; beyond that callers wait up
+    to queue_timeout and then get HasherBusy. Queue wait and hash time are
+    recorded for stats().
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64, queue_timeout: float = 5.0):
+        self.workers = max(1, workers)
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="PasswordHasher")
+        self._slots = threading.BoundedSemaphore(max(self.workers, max_pending))
+        self._counters = {"hashed": 0, "checked": 0, "rejected": 0, "pending": 0}
+        self._counter_lock = threading.Lock()
+        self.queue_wait = LatencyHistogram()
+        self.hash_time = LatencyHistogram()
+
+
+    # Public API
+
+    def hash(self, password: str) -> str:
+        return self._run("hashed", generate_password_hash, password)
+
+    def check(self, pwhash: str, password: str) -> bool:
+        return self._run("checked", check_password_hash, pwhash, password)
+
+    def stats(self) -> Dict[str, object]:
+        with self._counter_lock:
+            snapshot = dict(self._counters)
+        snapshot["workers"] = self.workers
+        snapshot["queue_wait"] = self.queue_wait.snapshot()
+        snapshot["hash_time"] = self.hash_time.snapshot()
+        return snapshot
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+    # Internal
+
+    def _run(self, counter: str, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count("rejected")
+            raise HasherBusy(f"Password hashing queue full for {self.queue_timeout}s")
+        self._count("pending")
+        submitted = time.monotonic()
+
+        def task():
+            started = time.monotonic()
+            self.queue_wait.record(started - submitted)
+            try:
+                return fn(*args)
+            finally:
+                self.hash_time.record(time.monotonic() - started)
+
+        try:
+            result = self._executor.submit(task).result()
+        finally:
+            self._slots.release()
+            self._count("pending", -1)
+        self._count(counter)
+        return result
+
+    def _count(self, name: str, n: int = 1):
+        with self._counter_lock:
+            self._counters[name] += n
+
+
+class SessionTokens:
+    """
+    Signed, expiring session tokens: base64url(JSON claims) + "." + base64url(HMAC-SHA256).
+
+    verify() is a constant-time HMAC comparison plus an expiry check, so
+    authenticated calls never touch the password hash again. Without a
+    configured secret a random one is generated, which means tokens do not
+    survive a restart (or work across several processes).
+    """
+
+    def __init__(self, secret: Optional[bytes] = None, ttl: float = 12 * 3600):
+        if not secret:
+            print("[SessionTokens] No secret configured, using a random one (tokens end with this process)")
+            secret = os.urandom(32)
+        self._secret = secret if isinstance(secret, bytes) else secret.encode()
+        self.ttl = ttl
+
+
+    # Public API
+
+    def issue(self, subject: str) -> Dict[str, object]:
+        """New token for subject (the user's email) -> {"token", "expires_at"}"""
+        expires_at = int(time.time() + self.ttl)
+        claims = json.dumps({"sub": subject, "exp": expires_at}, separators=(",", ":")).encode()
+        body = _b64encode(claims)
+        return {"token": f"{body}.{self._sign(body)}", "expires_at": expires_at}
+
+    def verify(self, token: str) -> Optional[str]:
+        """Subject of a valid, unexpired token; None otherwise"""
+        try:
+            body, signature = token.split(".", 1)
+        except (AttributeError, ValueError):
+            return None
+        try:
+            # Bytes on both sides: compare_digest rejects non-ASCII str, which a client controls
+            matches = hmac.compare_digest(signature.encode(), self._sign(body).encode())
+        except UnicodeEncodeError:
+            return None
+        if not matches:
+            return None
+        try:
+            claims = json.loads(_b64decode(body))
+        except ValueError:
+            return None
+        if not isinstance(claims, dict) or claims.get("exp", 0) < time.time():
+            return None
+        return claims.get("sub")
+
+
+    # Internal
+
+    def _sign(self, body: str) -> str:
+        return _b64encode(hmac.new(self._secret, body.encode(), hashlib.sha256).digest())
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
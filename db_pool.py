@@ -0,0 +1,148 @@
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# Applied to every pooled connection when it is opened
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",          # readers don't block the writer and vice versa
+    "synchronous": "NORMAL",        # fsync at checkpoints only; safe with WAL
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -32000,           # KiB when negative: ~32 MB page cache per connection
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class PooledConnection:
+    """
+    sqlite3.Connection handed out by SQLitePool. Behaves like the real
+    connection, except close() returns it to the pool (rolling back any
+    uncommitted transaction) instead of closing it.
+    """
+
+    def __init__(self, pool: "SQLitePool", conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Same commit/rollback semantics as sqlite3.Connection as a context manager
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+
+class SQLitePool:
+    """
+    Fixed-size pool of SQLite connections opened once with WAL and tuned pragmas.
+
+    Each connection keeps sqlite3's prepared-statement cache
+    (cached_statements), so handlers that run the same SQL text skip
+    re-preparing it. acquire() blocks up to `timeout` when every connection
+    is checked out. Connections are shared across threads but only used by
+    one thread at a time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = 8,
+        pragmas: Optional[Dict[str, object]] = None,
+        cached_statements: int = 256,
+        timeout: float = 10.0
+    ):
+        self.path = path
+        self.size = max(1, size)
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+
+    # Public API
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection; close() on the result gives it back"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open_if_below_size()
+            if conn is None:
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError(f"No free connection in pool after {self.timeout}s")
+        return PooledConnection(self, conn)
+
+    @contextmanager
+    def connection(self) -> Iterator[PooledConnection]:
+        """with pool.connection() as conn: ... (commits on success, rolls back on error)"""
+        conn = self.acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        if self._closed:
+            conn.close()
+            return
+        self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "opened": self._opened, "idle": self._idle.qsize()}
+
+
+    # Internal
+
+    def _open_if_below_size(self) -> Optional[sqlite3.Connection]:
+        with self._lock:
+            if self._opened >= self.size:
+                return None
+            self._opened += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas.get("busy_timeout", 5000) / 1000,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
@@ -0,0 +1,239 @@
+"""
+Simulated ESP32 device fleet for load testing without AWS IoT.
+
+Runs a LocalBroker on localhost plus N simulated devices in one asyncio loop.
+Each device listens on its own command topic (esp32/cmd<n>), answers
+settings frames with {"acknowledgment": 1} after a configurable latency,
+jitter and loss, and publishes its own '*...#' frames on the telemetry topic.
+
+Point the apps at it with LOCAL_MQTT_BROKER=127.0.0.1:18830, e.g.
+
+    python device_simulator.py --devices 5000 --latency-ms 40 --jitter-ms 15 --loss 0.01
+    LOCAL_MQTT_BROKER=127.0.0.1:18830 python main_.py
+    LOCAL_MQTT_BROKER=127.0.0.1:18830 flask --app views run
+
+--drive RATE additionally sends RATE settings frames per second to random
+devices and reports throughput and ack latency percentiles.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from local_broker import DEFAULT_PORT, LocalBroker
+
+# Distinct prefixes: with esp32/data{n}, device 1 would also get all telemetry
+COMMAND_TOPIC = "esp32/cmd{n}"
+TELEMETRY_TOPIC = "esp32/data1"
+
+
+def make_frame(serial: str) -> str:
+    """Device frame in the shape views.on_message_received parses (serial last)"""
+    now = datetime.now()
+    day = now.strftime("%d%m%y")
+    hhmm = now.strftime("%H%M")
+    values = [random.randint(1, 9) for _ in range(9)]
+    parts = [day, day, hhmm, hhmm] + [str(v) for v in values] + ["1", "8", serial]
+    return "*," + ",".join(parts) + ",#"
+
+
+class SimulatedDevice:
+    """One ESP32: acks settings frames on its command topic and emits telemetry"""
+
+    def __init__(self, fleet: "DeviceFleet", index: int, serial: str):
+        self.fleet = fleet
+        self.index = index
+        self.serial = serial
+        self.topic = fleet.command_topic.format(n=index)
+        self.last_settings: Optional[str] = None
+
+    def on_message(self, topic: str, payload: str):
+        try:
+            message = json.loads(payload)
+        except json.JSONDecodeError:
+            message = {"device_data": payload.strip()}
+        # Skip acks and telemetry published by the fleet itself (both carry "serial")
+        if not isinstance(message, dict) or "acknowledgment" in message or "serial" in message:
+            return
+        if not str(message.get("device_data", "")).startswith("*"):
+            return
+        self.fleet.stats["frames_in"] += 1
+        if random.random() < self.fleet.loss:
+            self.fleet.stats["lost"] += 1
+            return
+        self.last_settings = message["device_data"]
+        self.fleet.loop.call_later(self.fleet.delay(), self._ack)
+
+    def _ack(self):
+        self.fleet.broker.publish(self.topic, json.dumps({"acknowledgment": 1, "serial": self.serial}))
+        self.fleet.stats["acks"] += 1
+
+    async def telemetry_loop(self):
+        interval = self.fleet.telemetry_interval
+        # Spread devices across the interval instead of bursting together
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            payload = json.dumps({"device_status": 1, "device_data": make_frame(self.serial), "serial": self.serial})
+            self.fleet.broker.publish(self.fleet.telemetry_topic, payload)
+            self.fleet.stats["frames_out"] += 1
+            await asyncio.sleep(max(0.0, random.gauss(interval, interval * 0.05)))
+
+
+class DeviceFleet:
+
+    def __init__(
+        self,
+        broker: LocalBroker,
+        devices: int,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 10.0,
+        loss: float = 0.0,
+        telemetry_interval: float = 0.0,
+        command_topic: str = COMMAND_TOPIC,
+        telemetry_topic: str = TELEMETRY_TOPIC,
+        first_serial: int = 10000000
+    ):
+        self.broker = broker
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.loss = loss
+        self.telemetry_interval = telemetry_interval
+        self.command_topic = command_topic
+        self.telemetry_topic = telemetry_topic
+        self.stats = {"frames_in": 0, "acks": 0, "lost": 0, "frames_out": 0}
+        self.loop = None
+        self.devices: List[SimulatedDevice] = [
+            SimulatedDevice(self, n, str(first_serial + n)) for n in range(devices)
+        ]
+        self._tasks = []
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        for device in self.devices:
+            self.broker.subscribe(device.topic, device.on_message)
+            if self.telemetry_interval > 0:
+                self._tasks.append(asyncio.create_task(device.telemetry_loop()))
+        print(f"[DeviceFleet] {len(self.devices)} device(s) on {self.command_topic}")
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+
+
+class LoadDriver:
+    """Sends settings frames to random devices and measures send→ack latency"""
+
+    def __init__(self, fleet: DeviceFleet, rate: float, timeout: float = 10.0):
+        self.fleet = fleet
+        self.rate = rate
+        self.timeout = timeout
+        self.sent = 0
+        self.timeouts = 0
+        self.latencies: List[float] = []
+        self._waiting: Dict[str, List[float]] = {}
+
+    def on_ack(self, topic: str, payload: str):
+        try:
+            message = json.loads(payload)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(message, dict) or message.get("acknowledgment") != 1:
+            return
+        sent_at = self._waiting.get(message.get("serial"))
+        if sent_at:
+            self.latencies.append(time.perf_counter() - sent_at.pop(0))
+
+    async def run(self):
+        for device in self.fleet.devices:
+            self.fleet.broker.subscribe(device.topic, self.on_ack)
+        interval = 1.0 / self.rate
+        next_send = time.perf_counter()
+        while True:
+            device = random.choice(self.fleet.devices)
+            frame = make_frame(device.serial)
+            self._waiting.setdefault(device.serial, []).append(time.perf_counter())
+            self.fleet.broker.publish(device.topic, json.dumps({"device_status": 1, "device_data": frame}))
+            self.sent += 1
+            next_send += interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+    def expire(self):
+        cutoff = time.perf_counter() - self.timeout
+        for serial, sent in self._waiting.items():
+            while sent and sent[0] < cutoff:
+                sent.pop(0)
+                self.timeouts += 1
+
+    def report(self) -> str:
+        self.expire()
+        window, self.latencies = sorted(self.latencies), []
+        if not window:
+            return f"sent={self.sent} acked=0 timeouts={self.timeouts}"
+
+        def pct(p):
+            return window[min(len(window) - 1, int(p * len(window)))] * 1000
+
+        return (f"sent={self.sent} acked={len(window)} timeouts={self.timeouts} "
+                f"p50={pct(0.50):.1f}ms p99={pct(0.99):.1f}ms max={window[-1] * 1000:.1f}ms")
+
+
+async def main(args):
+    broker = LocalBroker()
+    await broker.start_server(args.host, args.port)
+    fleet = DeviceFleet(
+        broker,
+        devices=args.devices,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        loss=args.loss,
+        telemetry_interval=args.telemetry_interval,
+        command_topic=args.command_topic,
+        telemetry_topic=args.telemetry_topic
+    )
+    fleet.start()
+    driver = None
+    if args.drive > 0:
+        driver = LoadDriver(fleet, args.drive)
+        asyncio.create_task(driver.run())
+
+    started = time.perf_counter()
+    last = dict(fleet.stats)
+    while args.duration <= 0 or time.perf_counter() - started < args.duration:
+        await asyncio.sleep(args.report_every)
+        rates = {k: (fleet.stats[k] - last[k]) / args.report_every for k in fleet.stats}
+        last = dict(fleet.stats)
+        line = (f"[DeviceFleet] in={rates['frames_in']:.0f}/s acks={rates['acks']:.0f}/s "
+                f"out={rates['frames_out']:.0f}/s lost={fleet.stats['lost']} "
+                f"clients={broker.stats['clients']} dropped={broker.stats['dropped']}")
+        if driver:
+            line += " | " + driver.report()
+        print(line)
+    fleet.stop()
+    await broker.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, default=1000)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--loss", type=float, default=0.0, help="probability a settings frame is never acked")
+    parser.add_argument("--telemetry-interval", type=float, default=0.0, help="seconds between device frames (0 = off)")
+    parser.add_argument("--command-topic", default=COMMAND_TOPIC)
+    parser.add_argument("--telemetry-topic", default=TELEMETRY_TOPIC)
+    parser.add_argument("--drive", type=float, default=0.0, help="settings frames per second to send (0 = off)")
+    parser.add_argument("--duration", type=float, default=0.0, help="seconds to run (0 = forever)")
+    parser.add_argument("--report-every", type=float, default=5.0)
+    try:
+        asyncio.run(main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
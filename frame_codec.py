@@ -0,0 +1,130 @@
+
+from typing import Dict, List, Optional
+
+# Section marker -> (mode name, field names in wire order). Same layout Dashboard.save_mode
+# writes and update_all_from_cloud reads; BIPAP frames use A-F, CPAP frames G-I.
+SECTION_LAYOUTS = {
+    "A": ("CPAP", ("set_pressure", "mask_type")),
+    "B": ("S", ("ipap", "epap", "start_epap", "ti_min", "ti_max", "sensitivity", "rise_time", "mask_type")),
+    "C": ("T", ("ipap", "epap", "start_epap", "resp_rate", "ti_min", "ti_max", "sensitivity", "rise_time", "mask_type")),
+    "D": ("ST", ("ipap", "epap", "start_epap", "backup_rate", "ti_min", "ti_max", "sensitivity", "rise_time", "mask_type")),
+    "E": ("VAPS", ("max_ipap", "min_ipap", "epap", "resp_rate", "ti_min", "ti_max", "sensitivity", "rise_time",
+                   "mask_type", "height", "tidal_volume")),
+    "F": ("Settings", ("ramp_time", "humidifier", "tube_type", "imode", "leak_alert", "gender", "sleep_mode")),
+    "G": ("CPAP", ("set_pressure", "mask_type")),
+    "H": ("AutoCPAP", ("start_pressure", "min_pressure", "max_pressure", "mask_type")),
+    "I": ("Settings", ("ramp_time", "humidifier", "tube_type", "imode", "leak_alert", "gender", "sleep_mode")),
+}
+BIPAP_SECTIONS = set("ABCDEF")
+SETTINGS_SECTIONS = ("F", "I")
+
+# Sent as value * 10 on the wire
+TENTHS_FIELDS = {"ti_min", "ti_max"}
+
+# Header mode string (Dashboard.get_mode_str) -> mode name
+MODE_STRINGS = {
+    "MANUALMODE": "CPAP",
+    "CPAPMODE": "CPAP",
+    "AUTOMODE": "AutoCPAP",
+    "S_MODE": "S",
+    "T_MODE": "T",
+    "ST_MODE": "ST",
+    "VAPS_MODE": "VAPS",
+}
+
+# Every typed column a section row can carry (union of the layouts), in a stable order
+SECTION_FIELDS = tuple(dict.fromkeys(f for _, fields in SECTION_LAYOUTS.values() for f in fields))
+
+# Positional telemetry frame: *,start date,end date,start time,end time,<values...>,serial,#
+# (the documented sample "*,141025,141025,1300,1400,1,1,5,8,5,4,2,9,1,8,12345678,#" has 15 fields)
+MIN_TELEMETRY_PARTS = 15
+
+
+def split_frame(device_data: str) -> List[str]:
+    return [p.strip() for p in device_data.strip().strip("*,#").split(",")]
+
+
+def decode_frame(device_data: str) -> Optional[dict]:
+    """
+    Decode a '*...#' device frame.
+
+    Settings frames -> {"kind": "settings", "serial_no", "machine_type", "date", "time",
+    "active_mode", "sections": {mode: {field: number}}}.
+    Telemetry frames -> {"kind": "telemetry", "serial_no", "start_date", "end_date",
+    "start_time", "end_time", "values": [...]}.
+    Returns None for anything else. Unparseable numbers become None.
+    """
+    if not isinstance(device_data, str) or not device_data.strip():
+        return None
+    parts = split_frame(device_data)
+    markers = [i for i, p in enumerate(parts) if p in SECTION_LAYOUTS]
+    if markers:
+        return _decode_settings(parts, markers)
+    if len(parts) >= MIN_TELEMETRY_PARTS:
+        return {
+            "kind": "telemetry",
+            "serial_no": parts[-1],
+            "start_date": parts[0],
+            "end_date": parts[1],
+            "start_time": parts[2],
+            "end_time": parts[3],
+            "values": [_number(p) for p in parts[4:-1]],
+        }
+    return None
+
+
+def section_rows(frame: Optional[dict]) -> List[Dict[str, object]]:
+    """One flat dict per settings section (mode, active flag and every SECTION_FIELDS column)"""
+    if not frame or frame.get("kind") != "settings":
+        return []
+    rows = []
+    for mode, values in frame["sections"].items():
+        row = dict.fromkeys(SECTION_FIELDS)
+        row.update(values)
+        row["mode"] = mode
+        row["active"] = 1 if mode == frame.get("active_mode") else 0
+        rows.append(row)
+    return rows
+
+
+def _decode_settings(parts: List[str], markers: List[int]) -> dict:
+    frame = {
+        "kind": "settings",
+        "serial_no": None,
+        "machine_type": "BIPAP" if any(parts[i] in BIPAP_SECTIONS for i in markers) else "CPAP",
+        "date": None,
+        "time": None,
+        "active_mode": None,
+        "sections": {},
+    }
+    header = parts[:markers[0]]
+    if len(header) >= 3 and header[0] == "S":
+        frame["date"], frame["time"] = header[1], header[2]
+    for token in header:
+        if token in MODE_STRINGS:
+            frame["active_mode"] = MODE_STRINGS[token]
+
+    for i in markers:
+        marker = parts[i]
+        mode, fields = SECTION_LAYOUTS[marker]
+        values = {}
+        for offset, field in enumerate(fields, start=1):
+            if i + offset >= len(parts):
+                break
+            value = _number(parts[i + offset])
+            if value is not None and field in TENTHS_FIELDS:
+                value = value / 10.0
+            values[field] = value
+        frame["sections"][mode] = values
+        if marker in SETTINGS_SECTIONS and i + len(fields) + 1 < len(parts):
+            frame["serial_no"] = parts[i + len(fields) + 1]
+    if frame["serial_no"] is None:
+        frame["serial_no"] = parts[-1] or None
+    return frame
+
+
+def _number(text: str) -> Optional[float]:
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
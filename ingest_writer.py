@@ -0,0 +1,178 @@
+
+import atexit
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from db_pool import SQLitePool
+
+
+class BatchedWriter:
+    """
+    Ingest stage that turns per-frame INSERTs into batched transactions.
+
+    submit() puts a parameter tuple on a bounded queue; one writer thread
+    drains it and runs executemany(sql, rows) in a single transaction once
+    max_batch rows are waiting or the oldest row has waited max_delay
+    seconds. When the queue is full submit() blocks for up to put_timeout
+    (backpressure on the producer) and then gives up, counting the row as
+    dropped.
+
+    Pass `write(conn, rows)` instead of relying on executemany(sql, rows)
+    when one row fans out into several tables; it runs inside the same
+    per-batch transaction.
+
+    If a batch fails it is retried one row per transaction, so only the rows
+    that fail on their own are dropped and counted as errors.
+
+    on_commit callbacks run only after the transaction holding their row has
+    committed, so anything acknowledged from them (e.g. the device ACK) is
+    exactly as durable as before. close() - also registered with atexit -
+    writes whatever is still queued.
+    """
+
+    def __init__(
+        self,
+        pool: SQLitePool,
+        sql: Optional[str] = None,
+        max_batch: int = 500,
+        max_delay: float = 0.05,
+        capacity: int = 10000,
+        put_timeout: float = 1.0,
+        name: str = "BatchedWriter",
+        write: Optional[Callable[[Any, List[tuple]], None]] = None
+    ):
+        if sql is None and write is None:
+            raise ValueError("BatchedWriter needs sql or write")
+        self.pool = pool
+        self.sql = sql
+        self.write = write or (lambda conn, rows: conn.executemany(self.sql, rows))
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.name = name
+
+        self._queue: queue.Queue = queue.Queue(maxsize=capacity)
+        self._counters = {"submitted": 0, "written": 0, "batches": 0, "dropped": 0, "errors": 0}
+        self._counter_lock = threading.Lock()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._writer_loop, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+
+    # Public API
+
+    def submit(self, row: Sequence[Any], on_commit: Optional[Callable[[], None]] = None) -> bool:
+        """Queue one row; blocks up to put_timeout when full. False if the row was dropped."""
+        if self._stopping:
+            return False
+        try:
+            self._queue.put((time.monotonic(), tuple(row), on_commit), timeout=self.put_timeout)
+        except queue.Full:
+            self._count("dropped")
+            print(f"[{self.name}] Queue full for {self.put_timeout}s, dropping row")
+            return False
+        self._count("submitted")
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every submitted row has been written (or failed). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Stop accepting rows and write out the rest"""
+        if self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, int]:
+        with self._counter_lock:
+            snapshot = dict(self._counters)
+        snapshot["depth"] = self._queue.qsize()
+        return snapshot
+
+
+    # Internal: writer thread
+
+    def _writer_loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                self._queue.task_done()
+                return
+            batch = [first]
+            stop = self._fill(batch)
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _fill(self, batch: List[Tuple[float, tuple, Optional[Callable]]]) -> bool:
+        """Top up the batch until it is full or the oldest row is max_delay old; True on shutdown"""
+        deadline = batch[0][0] + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 and not self._stopping else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if item is None:
+                # Shutdown marker: write what is left after it (nothing can follow)
+                return True
+            batch.append(item)
+        return False
+
+    def _write(self, batch: List[Tuple[float, tuple, Optional[Callable]]]):
+        if self._commit(batch):
+            done = batch
+        elif len(batch) > 1:
+            # Isolate the failing row(s): one transaction per row, so only they are lost
+            print(f"[{self.name}] Retrying {len(batch)} row(s) one at a time")
+            done = [item for item in batch if self._commit([item])]
+        else:
+            done = []
+        with self._counter_lock:
+            self._counters["written"] += len(done)
+            self._counters["errors"] += len(batch) - len(done)
+            self._counters["batches"] += 1
+        for _, _, on_commit in done:
+            if on_commit:
+                try:
+                    on_commit()
+                except Exception as e:
+                    print(f"[{self.name}] on_commit failed: {e}")
+
+    def _commit(self, batch: List[Tuple[float, tuple, Optional[Callable]]]) -> bool:
+        """Write rows in one transaction; False (rolled back) if anything failed"""
+        try:
+            conn = self.pool.acquire()
+        except Exception as e:
+            print(f"[{self.name}] No connection for {len(batch)} row(s): {e}")
+            return False
+        try:
+            self.write(conn, [row for _, row, _ in batch])
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            print(f"[{self.name}] Batch of {len(batch)} row(s) failed: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def _count(self, name: str, n: int = 1):
+        with self._counter_lock:
+            self._counters[name] += n
@@ -0,0 +1,287 @@
+
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Set to "host:port" to point aws_iot_loop / views.py at a LocalBroker instead of AWS IoT
+LOCAL_BROKER_ENV = "LOCAL_MQTT_BROKER"
+DEFAULT_PORT = 18830
+
+# Per-client outbound buffer above which messages to that client are dropped
+MAX_CLIENT_BUFFER = 4 * 1024 * 1024
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """MQTT topic filter match with '+' and '#' wildcards"""
+    f_parts = topic_filter.split("/")
+    t_parts = topic.split("/")
+    for i, f in enumerate(f_parts):
+        if f == "#":
+            return True
+        if i >= len(t_parts):
+            return False
+        if f != "+" and f != t_parts[i]:
+            return False
+    return len(f_parts) == len(t_parts)
+
+
+class LocalBroker:
+    """
+    In-process MQTT stand-in for load testing (not a wire-compatible broker).
+
+    In-process subscribers (e.g. simulated devices) register plain callbacks;
+    external processes connect over localhost TCP with LocalMqttConnection,
+    which exposes the subset of the awscrt connection API the app uses.
+    All routing happens on the event loop that runs start_server().
+    The wire format is one JSON object per line.
+    """
+
+    def __init__(self):
+        self._exact: Dict[str, List[Callable[[str, str], None]]] = defaultdict(list)
+        self._wildcard: List[Tuple[str, Callable[[str, str], None]]] = []
+        self.stats = {"published": 0, "delivered": 0, "dropped": 0, "clients": 0}
+        self._server = None
+
+
+    # Public API
+
+    def subscribe(self, topic_filter: str, handler: Callable[[str, str], None]):
+        if "+" in topic_filter or "#" in topic_filter:
+            self._wildcard.append((topic_filter, handler))
+        else:
+            self._exact[topic_filter].append(handler)
+
+    def unsubscribe(self, topic_filter: str, handler: Callable[[str, str], None]):
+        if (topic_filter, handler) in self._wildcard:
+            self._wildcard.remove((topic_filter, handler))
+        elif handler in self._exact.get(topic_filter, []):
+            self._exact[topic_filter].remove(handler)
+
+    def publish(self, topic: str, payload: str):
+        """Route a message to every matching subscriber (call on the broker's loop)"""
+        self.stats["published"] += 1
+        handlers = list(self._exact.get(topic, ()))
+        handlers += [h for f, h in self._wildcard if topic_matches(f, topic)]
+        for handler in handlers:
+            try:
+                handler(topic, payload)
+                self.stats["delivered"] += 1
+            except Exception as e:
+                print(f"[LocalBroker] Subscriber failed on '{topic}': {e}")
+
+    async def start_server(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+        self._server = await asyncio.start_server(self._handle_client, host, port, limit=1 << 20)
+        print(f"[LocalBroker] Listening on {host}:{port}")
+        return self._server
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+    # Internal: TCP clients
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        subscriptions = []
+        self.stats["clients"] += 1
+
+        def deliver(topic: str, payload: str):
+            if writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.stats["dropped"] += 1
+                return
+            writer.write(_encode({"op": "msg", "topic": topic, "payload": payload}))
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    frame = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                op = frame.get("op")
+                if op == "pub":
+                    self.publish(frame["topic"], frame.get("payload", ""))
+                elif op == "sub":
+                    self.subscribe(frame["topic"], deliver)
+                    subscriptions.append(frame["topic"])
+                if "id" in frame:
+                    writer.write(_encode({"op": "ok", "id": frame["id"]}))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for topic_filter in subscriptions:
+                self.unsubscribe(topic_filter, deliver)
+            self.stats["clients"] -= 1
+            writer.close()
+
+
+class LocalMqttConnection:
+    """
+    Threaded client for LocalBroker with the same call shape as an awscrt
+    mqtt.Connection: connect()/disconnect() return Futures, publish() and
+    subscribe() return (Future, packet_id), and subscription callbacks get
+    topic/payload/dup/qos/retain keyword arguments.
+
+    There is no automatic reconnect; callers reconnect explicitly, so
+    on_connection_resumed is never invoked.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        client_id: str = "",
+        on_connection_interrupted: Optional[Callable] = None,
+        on_connection_resumed: Optional[Callable] = None
+    ):
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.on_connection_interrupted = on_connection_interrupted
+        self.on_connection_resumed = on_connection_resumed
+
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._inflight: Dict[int, Tuple[Future, object]] = {}
+        self._inflight_lock = threading.Lock()
+        self._callbacks: List[Tuple[str, Callable, object]] = []
+        self._closing = False
+
+
+    # awscrt-compatible API
+
+    def connect(self) -> Future:
+        future = Future()
+        try:
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except OSError as e:
+            future.set_exception(e)
+            return future
+        self._sock = sock
+        self._closing = False
+        self._callbacks = []
+        threading.Thread(target=self._reader_loop, args=(sock,), daemon=True).start()
+        future.set_result({"session_present": False})
+        return future
+
+    def publish(self, topic: str, payload, qos=None, retain: bool = False):
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        return self._request({"op": "pub", "topic": topic, "payload": payload}, {"packet_id": None})
+
+    def subscribe(self, topic: str, qos=None, callback: Optional[Callable] = None):
+        if callback:
+            self._callbacks.append((topic, callback, qos))
+        return self._request({"op": "sub", "topic": topic}, {"topic": topic, "qos": qos})
+
+    def disconnect(self) -> Future:
+        future = Future()
+        self._closing = True
+        if self._sock:
+            try:
+                # close() alone leaves the reader's makefile() blocked on the fd
+                self._sock.shutdown(socket.SHUT_RDWR)
+                self._sock.close()
+            except OSError:
+                pass
+        future.set_result({})
+        return future
+
+
+    # Internal
+
+    def _request(self, frame: dict, result: dict):
+        packet_id = next(self._ids)
+        future = Future()
+        frame["id"] = packet_id
+        if "packet_id" in result:
+            result["packet_id"] = packet_id
+        with self._inflight_lock:
+            self._inflight[packet_id] = (future, result)
+        try:
+            with self._send_lock:
+                if not self._sock:
+                    raise ConnectionError("Not connected")
+                self._sock.sendall(_encode(frame))
+        except OSError as e:
+            with self._inflight_lock:
+                self._inflight.pop(packet_id, None)
+            future.set_exception(e)
+        return future, packet_id
+
+    def _reader_loop(self, sock: socket.socket):
+        error = None
+        try:
+            for line in sock.makefile("rb"):
+                try:
+                    frame = json.loads(line)
+                    op = frame.get("op")
+                    if op == "ok":
+                        with self._inflight_lock:
+                            future, result = self._inflight.pop(frame["id"], (None, None))
+                        if future:
+                            future.set_result(result)
+                    elif op == "msg":
+                        self._dispatch(frame["topic"], frame.get("payload", ""))
+                except (ValueError, AttributeError, KeyError, TypeError) as e:
+                    # One bad line is not a lost connection
+                    print(f"[LocalMqttConnection] Skipping malformed frame ({e}): {line[:200]!r}")
+        except OSError as e:
+            error = e
+        # Closed by disconnect(), or superseded by a later connect(): not an interruption
+        if self._closing or sock is not self._sock:
+            return
+        error = error or ConnectionError("Broker closed the connection")
+        with self._inflight_lock:
+            inflight = list(self._inflight.values())
+            self._inflight.clear()
+        for future, _ in inflight:
+            if not future.done():
+                future.set_exception(error)
+        if self.on_connection_interrupted:
+            self.on_connection_interrupted(connection=self, error=error)
+
+    def _dispatch(self, topic: str, payload: str):
+        data = payload.encode("utf-8")
+        for topic_filter, callback, qos in list(self._callbacks):
+            if topic_matches(topic_filter, topic):
+                try:
+                    callback(topic=topic, payload=data, dup=False, qos=qos, retain=False)
+                except Exception as e:
+                    print(f"[LocalMqttConnection] Callback failed: {e}")
+
+
+def local_connection_from_env(
+    client_id: str,
+    on_connection_interrupted: Optional[Callable] = None,
+    on_connection_resumed: Optional[Callable] = None
+) -> Optional[LocalMqttConnection]:
+    """Return a LocalMqttConnection when LOCAL_MQTT_BROKER is set, else None"""
+    address = os.environ.get(LOCAL_BROKER_ENV, "").strip()
+    if not address:
+        return None
+    host, _, port = address.rpartition(":")
+    print(f"[LocalBroker] Using local broker at {address} instead of AWS IoT")
+    return LocalMqttConnection(
+        host=host or "127.0.0.1",
+        port=int(port or DEFAULT_PORT),
+        client_id=client_id,
+        on_connection_interrupted=on_connection_interrupted,
+        on_connection_resumed=on_connection_resumed
+    )
+
+
+def _encode(frame: dict) -> bytes:
+    return (json.dumps(frame, separators=(",", ":")) + "\n").encode("utf-8")
@@ -1,5 +1,7 @@
 from cProfile import label
 import sys, json, os, time, threading
+import atexit
+import copy
 from functools import partial
 from tkinter.font import Font
 import requests  
@@ -10,10 +12,11 @@ from PyQt5.QtWidgets import (
     QStackedWidget, QMessageBox, QFormLayout, QFrame, QHBoxLayout, QDialog,
     QGraphicsOpacityEffect, QGraphicsDropShadowEffect, QSizePolicy, QGridLayout,
     QCalendarWidget, QDateEdit, QTableWidget, QTableWidgetItem, QFileDialog, QScrollArea,
-    QComboBox, QSpacerItem, QHeaderView, QToolTip
+    QComboBox, QSpacerItem, QHeaderView, QToolTip, QCompleter
 )
 from PyQt5.QtGui import QColor, QPainter, QPixmap, QFont, QPen, QMouseEvent, QIcon
-from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QPoint, QEventLoop, QTimer, pyqtSlot, QRect, pyqtSignal, QObject, QDate, QSize
+from PyQt5.QtCore import Qt, QPropertyAnimation, QEasingCurve, QPoint, QEventLoop, QTimer, pyqtSlot, QRect, pyqtSignal, QObject, QDate, QSize, QStringListModel
+from PyQt5.QtNetwork import QNetworkConfigurationManager
 
 # Import AWS IoT related modules
 from awscrt import io, mqtt, auth, http
@@ -22,12 +25,17 @@ from concurrent.futures import Future
 import queue  
 from datetime import datetime
 import calendar
+from send_scheduler import PrioritySendQueue, PRIORITY_INTERACTIVE, PRIORITY_BULK, PRIORITY_REPLAY
+from connection_state import ReconnectStateMachine, STATE_CONNECTING, STATE_BACKOFF, STATE_SUSPENDED
+from local_broker import local_connection_from_env
+from receive_pipeline import ReceivePipeline, FrameRouter
+from serial_index import SerialIndex, normalize_serial
 
 # Import matplotlib for pie chart
 # import matplotlib.pyplot as plt
 # from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 # from matplotlib.figure import Figure
-from collections import Counter
+from collections import Counter, deque
 # import numpy as np  # Added for pie chart colors
 
 USER_FILE = "users.json"
@@ -71,6 +79,7 @@ LOGS_FILE = "logs.json"
 # -------- Device Status Signal --------
 class DeviceStatusSignal(QObject):
     status_changed = pyqtSignal(bool)  # True = connected, False = disconnected
+    connection_state_changed = pyqtSignal(str, float)  # (state, seconds until next attempt)
 
 device_status_signal = DeviceStatusSignal()
 
@@ -225,38 +234,154 @@ def load_logs(serial_no: str = None) -> dict:
     Structure: {serial_no: {"fetched": [...], "sent": [...]}}
     Each entry: {"string": "...", "timestamp": "YYYY-MM-DD HH:MM:SS"}
     """
+    with _logs_lock:
+        all_logs = _logs_cache_locked()
+        if serial_no and serial_no in all_logs:
+            return copy.deepcopy(all_logs[serial_no])
+        elif serial_no:
+            return {"fetched": [], "sent": []}
+        else:
+            return copy.deepcopy(all_logs)
+
+
+# logs.json is owned by this process: save_log appends to an in-memory copy
+# under _logs_lock (GUI and FrameRouter threads both log) and flush_logs
+# writes it back at most every LOGS_FLUSH_DELAY seconds, via a temp file
+# and os.replace so a reader never sees a half-written file.
+LOGS_FLUSH_DELAY = 1.0
+_logs_lock = threading.RLock()
+_logs_cache = None
+_logs_dirty = False
+_logs_flush_timer = None
+
+
+def write_json_atomic(path: str, data, **dump_kwargs):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **dump_kwargs)
+    os.replace(tmp_path, path)
+
+
+def _logs_cache_locked() -> dict:
+    global _logs_cache
+    if _logs_cache is None:
+        try:
+            with open(LOGS_FILE, "r") as f:
+                _logs_cache = json.load(f)
+        except FileNotFoundError:
+            _logs_cache = {}
+        except Exception as e:
+            # Keep the unreadable file instead of overwriting it on the next flush
+            backup = f"{LOGS_FILE}.corrupt-{int(time.time())}"
+            print(f"Error reading {LOGS_FILE} ({e}); moved it to {backup}")
+            try:
+                os.replace(LOGS_FILE, backup)
+            except OSError:
+                pass
+            _logs_cache = {}
+        if not isinstance(_logs_cache, dict):
+            _logs_cache = {}
+    return _logs_cache
+
+
+def flush_logs():
+    """Write pending log entries to LOGS_FILE (no-op if nothing changed)"""
+    global _logs_dirty, _logs_flush_timer
+    with _logs_lock:
+        _logs_flush_timer = None
+        if not _logs_dirty:
+            return
+        try:
+            write_json_atomic(LOGS_FILE, _logs_cache, separators=(",", ":"))
+            _logs_dirty = False
+        except Exception as e:
+            print(f"Error saving logs: {e}")
+
+
+atexit.register(flush_logs)
+
+
+_serial_index = None
+_serial_index_lock = threading.Lock()
+# Backend listing of every serial that has sent data (GET /devices of views.py), e.g.
+# http://host:5000/devices; merged into known_serials() in the background when set
+SERIAL_SYNC_URL = os.environ.get("SERIAL_SYNC_URL", "")
+
+
+def known_serials() -> SerialIndex:
+    """
+    Process-wide index of every serial seen in settings, logs and users,
+    built on first use and kept current by save_log / serial updates.
+    Log entries count as uses, their newest timestamp as the last one.
+    With SERIAL_SYNC_URL set, the backend's serials are added by a background sync.
+    """
+    global _serial_index
+    with _serial_index_lock:
+        if _serial_index is not None:
+            return _serial_index
+        index = SerialIndex()
+        mode_keys = {"CPAP", "Settings", "S", "T", "ST", "VAPS", "AutoCPAP"}
+        for serial in load_all_settings():
+            if serial not in mode_keys:
+                index.add(serial, seen_at=0)
+        for serial, entries in load_logs().items():
+            if not isinstance(entries, dict):
+                continue
+            stamps = [e.get("timestamp", "") for kind in ("fetched", "sent") for e in entries.get(kind, [])]
+            seen_at = 0
+            if stamps:
+                try:
+                    seen_at = datetime.strptime(max(stamps), "%Y-%m-%d %H:%M:%S").timestamp()
+                except ValueError:
+                    pass
+            index.add(serial, seen_at=seen_at, count=len(stamps))
+        for data in load_users().values():
+            if isinstance(data, dict) and data.get("serial_no"):
+                index.add(data["serial_no"], seen_at=0)
+        _serial_index = index
+        if SERIAL_SYNC_URL:
+            threading.Thread(target=sync_known_serials, args=(index, SERIAL_SYNC_URL),
+                             name="SerialSync", daemon=True).start()
+        return index
+
+
+def sync_known_serials(index: SerialIndex, url: str):
+    """Add every serial listed by the backend's paged /devices endpoint, last contact as last use"""
+    after = ""
     try:
-        with open(LOGS_FILE, "r") as f:
-            all_logs = json.load(f)
-            if serial_no and serial_no in all_logs:
-                return all_logs[serial_no]
-            elif serial_no:
-                return {"fetched": [], "sent": []}
-            else:
-                return all_logs
-    except Exception:
-        return {}
+        while after is not None:
+            response = requests.get(url, params={"after": after, "limit": 5000}, timeout=10)
+            response.raise_for_status()
+            page = response.json()
+            for device in page.get("devices", []):
+                try:
+                    seen_at = datetime.strptime(device.get("last_seen") or "", "%Y-%m-%d %H:%M:%S").timestamp()
+                except ValueError:
+                    seen_at = 0
+                index.add(device["serial_no"], seen_at=seen_at, count=0)
+            after = page.get("next_after")
+    except (requests.RequestException, ValueError, KeyError, TypeError) as e:
+        print(f"Serial sync from {url} failed: {e}")
 
 
-def normalize_serial(serial: str) -> str:
+def frame_serial(device_data: str) -> str:
     """
-    Normalize a device serial number so the same physical device always uses
-    the same key everywhere (settings, logs, dashboard).
-
-    The device protocol sometimes appends a machine-type suffix to the serial
-    (e.g. '12345678B' for BIPAP, '12345678C' for CPAP). For the UI and for file
-    keys we strip this trailing type letter and only keep the numeric part,
-    so that:
-      - Logs for a device are always under '12345678'
-      - Settings are stored per base serial
-      - The type is still encoded only in the CSV / MQTT payload.
+    Best-effort (normalized) serial of a '*...#' device frame: the field 8
+    after the F or I section marker in settings frames, otherwise the last
+    long numeric field (telemetry frames end with the serial).
     """
-    if not serial:
+    if not isinstance(device_data, str):
         return ""
-    s = str(serial).strip()
-    if len(s) > 1 and s[-1] in ("B", "C") and s[:-1].isdigit():
-        return s[:-1]
-    return s
+    parts = [p.strip() for p in device_data.strip().strip("*#").split(",")]
+    for marker in ("F", "I"):
+        if marker in parts:
+            idx = parts.index(marker) + 8
+            return normalize_serial(parts[idx]) if idx < len(parts) else ""
+    for part in reversed(parts):
+        base = normalize_serial(part)
+        if base.isdigit() and len(base) >= 6:
+            return base
+    return ""
 
 
 def save_log(serial_no: str, log_type: str, data_string: str):
@@ -271,35 +396,33 @@ def save_log(serial_no: str, log_type: str, data_string: str):
     # does not get split across '12345678', '12345678B', '12345678C', etc.
     serial_key = normalize_serial(serial_no)
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    known_serials().add(serial_key)
     
-    try:
-        # Load existing logs
-        try:
-            with open(LOGS_FILE, "r") as f:
-                all_logs = json.load(f)
-        except Exception:
-            all_logs = {}
-        
+    global _logs_dirty, _logs_flush_timer
+    with _logs_lock:
+        all_logs = _logs_cache_locked()
+
         # Initialize serial entry if needed
         if serial_key not in all_logs:
             all_logs[serial_key] = {"fetched": [], "sent": []}
-        
+        entries = all_logs[serial_key].setdefault(log_type, [])
+
         # Add new log entry
-        log_entry = {
+        entries.append({
             "string": data_string,
             "timestamp": timestamp
-        }
-        all_logs[serial_key][log_type].append(log_entry)
-        
+        })
+
         # Keep only last 100 entries per type per serial (to prevent file from growing too large)
-        if len(all_logs[serial_key][log_type]) > 100:
-            all_logs[serial_key][log_type] = all_logs[serial_key][log_type][-100:]
-        
-        # Save back to file
-        with open(LOGS_FILE, "w") as f:
-            json.dump(all_logs, f, indent=2)
-    except Exception as e:
-        print(f"Error saving log: {e}")
+        if len(entries) > 100:
+            del entries[:-100]
+
+        # Written back by flush_logs, batched with whatever else arrives meanwhile
+        _logs_dirty = True
+        if _logs_flush_timer is None:
+            _logs_flush_timer = threading.Timer(LOGS_FLUSH_DELAY, flush_logs)
+            _logs_flush_timer.daemon = True
+            _logs_flush_timer.start()
  
 def load_users():
     if not os.path.exists(USER_FILE):
@@ -354,8 +477,7 @@ def load_active_users_file():
 
 def save_active_users_file(data: dict):
     try:
-        with open(ACTIVE_USERS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        write_json_atomic(ACTIVE_USERS_FILE, data, indent=2)
     except Exception as e:
         print(f"Failed to save {ACTIVE_USERS_FILE}: {e}")
 
@@ -739,6 +861,7 @@ class DeviceStatusIndicator(QFrame):
         
         # Connect to device status signal
         device_status_signal.status_changed.connect(self.update_status)
+        device_status_signal.connection_state_changed.connect(self.update_connection_state)
     
     def init_ui(self):
         layout = QHBoxLayout(self)
@@ -858,8 +981,24 @@ class DeviceStatusIndicator(QFrame):
                 }
             """)
 
+    def update_connection_state(self, state, delay):
+        """Show reconnect progress while disconnected"""
+        if self.is_connected:
+            return
+        if state == STATE_CONNECTING:
+            self.status_label.setText("Connecting...")
+        elif state == STATE_BACKOFF:
+            self.status_label.setText(f"Device Disconnected – retrying in {delay:.0f}s")
+        elif state == STATE_SUSPENDED:
+            self.status_label.setText("Device Offline – waiting for network")
+
 # ---------------- Dashboard ----------------
 class Dashboard(QWidget):
+    # Emitted from the receive workers; delivered on the GUI thread
+    recent_serial_received = pyqtSignal(str)
+    cloud_frame_received = pyqtSignal(object)
+    activity_counts_ready = pyqtSignal()
+
     def __init__(self, user_name="Sample User", machine_serial="SN123456", login_window=None, user_data=None):
         super().__init__()
         self.setWindowFlags(Qt.Window)
@@ -1095,8 +1234,32 @@ class Dashboard(QWidget):
         self.stats_timer.start(1000)
 
         # AWS IoT Integration
-        self.aws_send_queue = queue.Queue()
-        self.aws_receive_queue = queue.Queue()
+        self.reconnect_state = ReconnectStateMachine(
+            on_transition=device_status_signal.connection_state_changed.emit
+        )
+        self.network_monitor = QNetworkConfigurationManager(self)
+        self.network_monitor.onlineStateChanged.connect(
+            lambda online: self.reconnect_state.network_up() if online else None
+        )
+        self.recent_serial_received.connect(self.update_recent_serial)
+        self.cloud_frame_received.connect(self.apply_cloud_frame)
+        # Month -> frames counted off the GUI thread, folded into ACTIVE_USERS_FILE on it
+        self._pending_activity = Counter()
+        self._pending_activity_lock = threading.Lock()
+        self.activity_counts_ready.connect(self.flush_activity_counts)
+        self.aws_send_queue = PrioritySendQueue()
+        # Bounded; FrameRouter drops the oldest frame when a flood outpaces the consumer
+        self.aws_receive_queue = queue.Queue(maxsize=1000)
+        self.frame_router = FrameRouter(
+            self.aws_receive_queue,
+            routes=[
+                ("ui", self.route_frame_to_ui),
+                ("log", self.route_frame_to_log),
+                ("activity", self.route_frame_to_activity),
+            ],
+            serial_of=lambda message: frame_serial(message.get("device_data")),
+            name="AwsFrames"
+        )
         self.aws_thread = threading.Thread(target=self.aws_iot_loop)
         self.aws_thread.daemon = True
         self.aws_thread.start()
@@ -1159,6 +1322,7 @@ class Dashboard(QWidget):
 
         # Set as current machine serial
         self.machine_serial = base_serial
+        known_serials().add(base_serial)
 
         # Keep all key UI elements in sync
         self.serial_input.setText(base_serial)
@@ -1185,6 +1349,23 @@ class Dashboard(QWidget):
 
         QMessageBox.information(self, "Serial Updated", f"Active device serial updated to: {base_serial}")
 
+    def attach_serial_completer(self, line_edit):
+        """Ranked prefix / fuzzy suggestions from known_serials() while a serial is typed"""
+        model = QStringListModel(line_edit)
+        completer = QCompleter(model, line_edit)
+        # The index already filters and ranks; show its list as-is
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setCaseSensitivity(Qt.CaseInsensitive)
+        line_edit.setCompleter(completer)
+
+        def refresh(text):
+            suggestions = known_serials().suggest(text) if text.strip() else []
+            model.setStringList(suggestions)
+            if suggestions:
+                completer.complete()
+
+        line_edit.textEdited.connect(refresh)
+
     def record_login_search(self):
         """Records a login search event for monthly active users."""
         current_month_abbr = calendar.month_abbr[datetime.now().month]
@@ -1584,6 +1765,7 @@ class Dashboard(QWidget):
         
         self.logs_serial_input = QLineEdit()
         self.logs_serial_input.setPlaceholderText("Enter Serial Number...")
+        self.attach_serial_completer(self.logs_serial_input)
         self.logs_serial_input.setFixedWidth(200)
         self.logs_serial_input.setFixedHeight(45)
         self.logs_serial_input.setStyleSheet("""
@@ -2555,7 +2737,31 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
             if serial_key:
                 save_log(serial_key, "fetched", device_data)
             
-            QMessageBox.information(self, "Success", "Settings loaded from cloud into UI!")
+            if not getattr(self, "_suppress_cloud_message", False):
+                QMessageBox.information(self, "Success", "Settings loaded from cloud into UI!")
+
+    # --- Received frame routes (FrameRouter consumer thread) ---
+
+    def route_frame_to_ui(self, serial, message):
+        """Frames for the device on screen are applied to the UI on the GUI thread."""
+        if serial and serial == normalize_serial(self.machine_serial):
+            self.cloud_frame_received.emit(message)
+
+    def route_frame_to_log(self, serial, message):
+        # update_all_from_cloud already logs frames for the device on screen
+        if serial and serial != normalize_serial(self.machine_serial):
+            save_log(serial, "fetched", message["device_data"])
+
+    def route_frame_to_activity(self, serial, message):
+        self.extract_date_and_update_user_count(message["device_data"])
+
+    def apply_cloud_frame(self, message):
+        """Apply a streamed device frame without the per-fetch success popup."""
+        self._suppress_cloud_message = True
+        try:
+            self.update_all_from_cloud(message)
+        finally:
+            self._suppress_cloud_message = False
             
     def update_stats(self):
         elapsed = time.time() - self.start_time
@@ -2646,39 +2852,18 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
             date_match = re.search(r'\b(\d{2})(\d{2})(\d{2})\b', device_data_str)
             
             if date_match:
-                day = int(date_match.group(1))
                 month = int(date_match.group(2))
-                year = int(date_match.group(3))
-                
-                # Convert 2-digit year to 4-digit (assuming 2000s)
-                full_year = 2000 + year if year < 100 else year
-                
+
                 # Get month abbreviation
                 month_abbr = calendar.month_abbr[month]
-                
-                # Load current active users data
-                data = load_active_users_file()
-            
-                
-                # Increment count for this month
-                current_count = data.get(month_abbr, 0)
-                data[month_abbr] = current_count + 1
-                
-                # Save updated data
-                save_active_users_file(data)
-                
-                # Emit signal to notify about data change
-                if hasattr(self, 'active_users_data_changed'):
-                    self.active_users_data_changed.emit()
-                
-                # Update local active_users
-                self.active_users = data
-                
-                # Update pie chart
-                # self.update_pie_chart()
-                
-                print(f"Updated user count for {month_abbr} {full_year}: {current_count + 1}")
-                
+
+                # Runs on the FrameRouter thread: only count here, the file and
+                # self.active_users are updated by flush_activity_counts on the GUI thread
+                with self._pending_activity_lock:
+                    first = not self._pending_activity
+                    self._pending_activity[month_abbr] += 1
+                if first:
+                    self.activity_counts_ready.emit()
                 return True
             else:
                 print("No date found in device data")
@@ -2688,6 +2873,25 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
             print(f"Error extracting date and updating user count: {e}")
             return False
 
+    def flush_activity_counts(self):
+        """Fold the month counts queued by extract_date_and_update_user_count into ACTIVE_USERS_FILE (GUI thread)."""
+        with self._pending_activity_lock:
+            counts, self._pending_activity = self._pending_activity, Counter()
+        if not counts:
+            return
+        data = load_active_users_file()
+        for month_abbr, n in counts.items():
+            data[month_abbr] = data.get(month_abbr, 0) + n
+        save_active_users_file(data)
+
+        # Emit signal to notify about data change
+        if hasattr(self, 'active_users_data_changed'):
+            self.active_users_data_changed.emit()
+
+        # Update local active_users
+        self.active_users = data
+        print("Updated user counts: " + ", ".join(f"{m} {data[m]}" for m in counts))
+
     def update_total_active_devices_kpi(self):
         """Updates the 'Total Active Devices' KPI card with the latest count."""
         total_devices = get_total_active_devices()
@@ -3264,7 +3468,7 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
 
         return card
     
-    def save_mode(self, mode_name, send_to_cloud=False):
+    def save_mode(self, mode_name, send_to_cloud=False, priority=PRIORITY_INTERACTIVE):
         print("save_mode called") 
         now_time = time.time()
         payload_placeholder = json.dumps({
@@ -3546,7 +3750,7 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
                 "device_status": 1,
                 "device_data": csv_line
             }
-            self.aws_send_queue.put(json.dumps(payload))
+            self.aws_send_queue.put(json.dumps(payload), priority)
             # 5. Log the sent string against the base serial, so all history for a
             # device is grouped together regardless of type suffix.
             base_serial_for_log = normalize_serial(self.machine_serial)
@@ -3618,8 +3822,16 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
         pending_messages = []
         is_connected = False
         self.ack_received = True
+        # Published messages still waiting for their ACK, oldest first: (priority, data, published_at).
+        # ACKs carry no message id but come back in publish order, so each one settles the head.
+        awaiting_ack = deque()
+        acks_arrived = 0
+        ack_lock = threading.Lock()
+        ack_event = threading.Event()
+        ack_timeout = 10
         pending_send_hold = 5  
         connection_time = None
+        replay_scheduled = False
         mqtt_connection = None
         
         def load_pending():
@@ -3680,77 +3892,133 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
             return False
 
         def on_message_received(topic, payload, dup, qos, retain, **kwargs):
-            try:
-                print(f"\nReceived message from topic '{topic}':")
-                text = payload.decode('utf-8', errors='replace')
-           
+            # Runs on the awscrt event-loop thread: hand off and return immediately.
+            # ACKs are tiny and gate the send loop, so they skip the buffer.
+            if len(payload) < 128 and b"acknowledgment" in payload:
                 try:
-                    message = json.loads(text)
-                except json.JSONDecodeError:
-                    
-                    stripped = text.strip()
-                    if stripped.startswith("*") and stripped.endswith("#"):
-                        message = {"device_status": None, "device_data": stripped}
-                    else:
-                        
-                        message = {"raw_payload": stripped}
-
-                print(f"Message content: {json.dumps(message, indent=2)}")
-                if topic == ACK_TOPIC and message.get("acknowledgment") == 1:
-                    print("Acknowledgment received")
-                    self.ack_received = True
-                elif "device_data" in message:
-                  
-                    if isinstance(message.get("device_data"), str):
-                        device_data = message["device_data"]
-                        
-                        # Extract date and update user count for pie chart
-                        # self.extract_date_and_update_user_count(device_data)
-                        
-                        # Also check if this is a serial number search and update recent serial
-                        if "S," in device_data:
-                            # Try to extract serial number from the data
-                            parts = device_data.strip("*#").split(",")
-                            if len(parts) > 1:
-                                # The first part after "S" might be the date, but we can check for serial
-                                # Look for an 8-digit number (typical serial format)
-                                for part in parts:
-                                    if part.isdigit() and len(part) >= 6:
-                                        serial_num = part
-                                        self.update_recent_serial(serial_num)
-                                        break
-                        
-                        self.aws_receive_queue.put(message)
-                    else: 
-                               print("Ignored device_data: not a string")
+                    if topic == ACK_TOPIC and json.loads(payload).get("acknowledgment") == 1:
+                        ack_arrived()
+                        return
+                except (ValueError, AttributeError):
+                    pass
+            receive_pipeline.submit(topic, payload)
+
+        def handle_message(topic, payload):
+            """Parse and route one received message (receive_pipeline worker thread)."""
+            text = payload.decode('utf-8', errors='replace')
+            try:
+                message = json.loads(text)
+            except json.JSONDecodeError:
+                stripped = text.strip()
+                if stripped.startswith("*") and stripped.endswith("#"):
+                    message = {"device_status": None, "device_data": stripped}
                 else:
-                
-                    print("Received non-device payload; stored for inspection.")
-                print("Message received successfully!")
-            except Exception as e:
-                print(f"Error processing received message: {e}")
+                    message = {"raw_payload": stripped}
+            if not isinstance(message, dict):
+                message = {"raw_payload": message}
+
+            if topic == ACK_TOPIC and message.get("acknowledgment") == 1:
+                print("Acknowledgment received")
+                ack_arrived()
+            elif "device_data" in message:
+                if isinstance(message.get("device_data"), str):
+                    device_data = message["device_data"]
+
+                    # Also check if this is a serial number search and update recent serial
+                    if "S," in device_data:
+                        # Look for an 8-digit number (typical serial format)
+                        parts = device_data.strip("*#").split(",")
+                        for part in parts if len(parts) > 1 else []:
+                            if part.isdigit() and len(part) >= 6:
+                                # Widgets may only be touched on the GUI thread
+                                self.recent_serial_received.emit(part)
+                                break
+
+                    self.frame_router.offer(message)
+                else:
+                    print("Ignored device_data: not a string")
+            else:
+                print(f"Received non-device payload on '{topic}' ({len(payload)} bytes).")
+
+        receive_pipeline = ReceivePipeline(handle_message, name="AwsReceive")
+        self.receive_pipeline = receive_pipeline
 
         def on_connection_interrupted(connection, error, **kwargs):
             nonlocal is_connected
+            nonlocal replay_scheduled
             is_connected = False
             self.is_connected = False
+            # Replay items are still in pending_messages; re-schedule them after reconnect
+            self.aws_send_queue.discard(PRIORITY_REPLAY)
+            replay_scheduled = False
+            forget_awaiting_acks()
             device_status_signal.status_changed.emit(False)  # Emit RED status
+            self.reconnect_state.disconnected()
             print(f"Connection interrupted. Error: {error}. Device is now DISCONNECTED.")
 
         def on_connection_resumed(connection, return_code, session_present, **kwargs):
             nonlocal is_connected
             nonlocal connection_time
+            nonlocal replay_scheduled
+            self.aws_send_queue.discard(PRIORITY_REPLAY)
+            replay_scheduled = False
+            forget_awaiting_acks()
             is_connected = True
             self.is_connected = True
+            self.reconnect_state.connected()
             device_status_signal.status_changed.emit(True)  # Emit GREEN status
-            self.ack_received = True  
             print(f"Connection resumed. Return code: {return_code}, Session present: {session_present}. Device is now CONNECTED.")
             load_pending()
             if not session_present:
                 subscribe_to_topics(connection)
             connection_time = time.time()
                 
-        def send_data(data, connection):
+        def ack_arrived():
+            # awscrt / receive_pipeline thread: only count it, the send loop settles it
+            nonlocal acks_arrived
+            with ack_lock:
+                acks_arrived += 1
+            ack_event.set()
+
+        def forget_awaiting_acks():
+            # A new session: ACKs for messages published before it never arrive
+            nonlocal acks_arrived
+            with ack_lock:
+                awaiting_ack.clear()
+                acks_arrived = 0
+            self.ack_received = True
+
+        def settle_acks():
+            """
+            Send loop: match arrived ACKs to published messages in order. A replayed
+            message leaves the backlog once it is ACKed or its ACK timed out.
+            """
+            nonlocal acks_arrived
+            settled = []
+            now = time.time()
+            with ack_lock:
+                while awaiting_ack and (acks_arrived or now - awaiting_ack[0][2] >= ack_timeout):
+                    priority, data, _ = awaiting_ack.popleft()
+                    settled.append((priority, data, acks_arrived > 0))
+                    acks_arrived = max(0, acks_arrived - 1)
+                acks_arrived = 0  # ACKs with nothing awaiting them
+                self.ack_received = not awaiting_ack
+            for priority, data, acked in settled:
+                if priority != PRIORITY_REPLAY or data not in pending_messages:
+                    continue
+                if acked:
+                    print("Message acknowledged, removing from queue")
+                    pending_messages.remove(data)
+                    save_pending()
+                else:
+                    print("No acknowledgment received within timeout. Proceeding to next message (fallback).")
+                    pending_messages.remove(data)
+
+        def replay_in_flight():
+            with ack_lock:
+                return any(priority == PRIORITY_REPLAY for priority, _, _ in awaiting_ack)
+
+        def send_data(data, connection, priority=PRIORITY_INTERACTIVE):
             print(f"Publishing message to topic '{TOPIC}':\n{data}")
             try:
                 publish_future, packet_id = connection.publish(
@@ -3761,7 +4029,9 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
                 publish_future.result(timeout=10)
                 print("Data sent to AWS IoT Core! Waiting for acknowledgment...")
                 print(f"Packet ID: {packet_id}")
-                self.ack_received = False
+                with ack_lock:
+                    awaiting_ack.append((priority, data, time.time()))
+                    self.ack_received = False
                 return True
                 
             except Exception as e:
@@ -3769,33 +4039,42 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
                 return False
 
         def send_pending(connection):
-            nonlocal pending_messages
-            nonlocal connection_time
-            print(f"send_pending: ack_received={self.ack_received}, pending_messages_count={len(pending_messages)}")
+            """Feed the pending backlog into the replay lane of aws_send_queue (once per connection)."""
+            nonlocal replay_scheduled
             if not is_connected:
                 print("Cannot send pending messages: Device is DISCONNECTED.")
                 return
-       
+            if replay_scheduled and not self.aws_send_queue.has_pending(PRIORITY_REPLAY):
+                # Previous replay pass drained; pick up whatever is still pending
+                replay_scheduled = False
+            if replay_scheduled or not pending_messages:
+                return
             if connection_time is None or time.time() - connection_time < pending_send_hold:
                 print(f"Deferring pending sends for {pending_send_hold} seconds after connect...")
                 return
-            if pending_messages and self.ack_received:
-                data = pending_messages[0]
-                print(f"Attempting to send pending message: {data}")
-                if send_data(data, connection):
-                    start_time = time.time()
-                    while not self.ack_received and time.time() - start_time < 10:
-                        time.sleep(0.1)
-                    if self.ack_received:
-                        print("Message acknowledged, removing from queue")
-                        pending_messages.pop(0)
-                        
-                        save_pending()
-                    else:
-                        print("No acknowledgment received within timeout. Proceeding to next message (fallback).")
-                        pending_messages.pop(0)
-                else:
-                    print("Failed to send pending message.")
+            print(f"send_pending: scheduling {len(pending_messages)} pending message(s) for replay")
+            for data in list(pending_messages):
+                self.aws_send_queue.put(data, PRIORITY_REPLAY)
+            replay_scheduled = True
+
+        def send_replay(data, connection, enqueued_at):
+            """Replay one backlog message; yields to interactive sends and never waits for its ACK."""
+            if data not in pending_messages:
+                return
+            if self.aws_send_queue.has_pending(PRIORITY_INTERACTIVE):
+                # A save is waiting; it goes out first and replay order (and age) stays intact
+                self.aws_send_queue.put_front(data, PRIORITY_REPLAY, enqueued_at)
+                return
+            if replay_in_flight():
+                # One replayed message at a time; wake on its ACK, or sooner for a new save
+                self.aws_send_queue.put_front(data, PRIORITY_REPLAY, enqueued_at)
+                ack_event.wait(0.1)
+                ack_event.clear()
+                return
+            print(f"Attempting to send pending message: {data}")
+            if not send_data(data, connection, PRIORITY_REPLAY):
+                print("Failed to send pending message.")
+            # settle_acks() removes it from pending_messages once it is ACKed (or times out)
 
         def subscribe_to_topics(connection):
             nonlocal is_connected
@@ -3837,32 +4116,37 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
         client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
         
         
-        missing_files = [p for p in (PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA) if not os.path.isfile(p)]
-        if missing_files:
+        # LOCAL_MQTT_BROKER=host:port swaps AWS IoT for device_simulator.py's broker
+        mqtt_connection = local_connection_from_env(CLIENT_ID, on_connection_interrupted, on_connection_resumed)
+        if mqtt_connection is None:
+            missing_files = [p for p in (PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA) if not os.path.isfile(p)]
+            if missing_files:
             
-            alt_base = os.path.join(os.getcwd(), 'Aws')
-            alt_paths = [os.path.join(alt_base, os.path.basename(p)) for p in (PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA)]
-            if all(os.path.isfile(p) for p in alt_paths):
-                PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA = alt_paths
-                print("Found TLS files in local 'Aws' folder; updated paths.")
-            else:
-                print(f"MQTT TLS files missing: {missing_files}. Aborting AWS IoT connection loop.")
-                return
+                alt_base = os.path.join(os.getcwd(), 'Aws')
+                alt_paths = [os.path.join(alt_base, os.path.basename(p)) for p in (PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA)]
+                if all(os.path.isfile(p) for p in alt_paths):
+                    PATH_TO_CERTIFICATE, PATH_TO_PRIVATE_KEY, PATH_TO_AMAZON_ROOT_CA = alt_paths
+                    print("Found TLS files in local 'Aws' folder; updated paths.")
+                else:
+                    print(f"MQTT TLS files missing: {missing_files}. Aborting AWS IoT connection loop.")
+                    return
             
-        mqtt_connection = mqtt_connection_builder.mtls_from_path(
-            endpoint=ENDPOINT,
-            cert_filepath=PATH_TO_CERTIFICATE,
-            pri_key_filepath=PATH_TO_PRIVATE_KEY,
-            client_bootstrap=client_bootstrap,
-            ca_filepath=PATH_TO_AMAZON_ROOT_CA,
-            on_connection_interrupted=on_connection_interrupted,
-            on_connection_resumed=on_connection_resumed,
-            client_id=CLIENT_ID,
-            clean_session=False,
-            keep_alive_secs=1200
-        )
+            mqtt_connection = mqtt_connection_builder.mtls_from_path(
+                endpoint=ENDPOINT,
+                cert_filepath=PATH_TO_CERTIFICATE,
+                pri_key_filepath=PATH_TO_PRIVATE_KEY,
+                client_bootstrap=client_bootstrap,
+                ca_filepath=PATH_TO_AMAZON_ROOT_CA,
+                on_connection_interrupted=on_connection_interrupted,
+                on_connection_resumed=on_connection_resumed,
+                client_id=CLIENT_ID,
+                clean_session=False,
+                keep_alive_secs=1200
+            )
         load_pending()
         while not is_connected:
+            self.reconnect_state.wait()
+            self.reconnect_state.connecting()
             print(f"Connecting to {ENDPOINT} with client ID '{CLIENT_ID}'...")
             try:
                 connect_future: Future = mqtt_connection.connect()
@@ -3870,53 +4154,62 @@ I,RAMPTIME,HUMIDIFIER,TUBETYPE,IMODE,LEAKALERT,GENDER,SLEEPMODE,SERIALNO
                 is_connected = True
                 self.is_connected = True
                 connection_time = time.time()
+                self.reconnect_state.connected()
                 device_status_signal.status_changed.emit(True)  # Emit GREEN status on first connect
                 print("Connected successfully to AWS IoT Core! Device is now CONNECTED.")
                 subscribe_to_topics(mqtt_connection)
                 
             except Exception as e:
-                print(f"Connection failed: {e}. Device is DISCONNECTED. Retrying in 1 second...")
-                time.sleep(1)
+                delay = self.reconnect_state.failed(e)
+                print(f"Connection failed: {e}. Device is DISCONNECTED. Retrying in {delay:.1f} seconds...")
 
         try:
             print("\nKeeping connection alive to receive messages and check for pending data...")
             while True:
                 print(f"Device connection status: {'CONNECTED' if is_connected else 'DISCONNECTED'}")
                 if is_connected:
-                    if pending_messages and self.ack_received:
-                        send_pending(mqtt_connection)
+                    settle_acks()
+                    send_pending(mqtt_connection)
                     try:
-                        new_data = self.aws_send_queue.get_nowait()
-                        if not is_duplicate_sample(new_data):
-                            if not send_data(new_data, mqtt_connection):
-                                pending_messages.append(new_data)
-                                save_pending()
+                        # Blocks at most one tick, but wakes as soon as a save is queued
+                        priority, new_data, enqueued_at = self.aws_send_queue.get_entry(timeout=0.5)
                     except queue.Empty:
-                        pass
+                        continue
+                    if priority == PRIORITY_REPLAY:
+                        send_replay(new_data, mqtt_connection, enqueued_at)
+                    elif not is_duplicate_sample(new_data):
+                        if not send_data(new_data, mqtt_connection):
+                            pending_messages.append(new_data)
+                            save_pending()
+                    continue
                 else:
-                    print("Connection lost! Attempting immediate reconnection...")
-                    try:
-                        connect_future: Future = mqtt_connection.connect()
-                        connect_future.result(timeout=10)
-                        is_connected = True 
-                        self.is_connected = True
-                        connection_time = time.time()
-                        device_status_signal.status_changed.emit(True)  # Emit GREEN status
-                        print("Reconnected successfully to AWS IoT Core! Device is now CONNECTED.")
-                        subscribe_to_topics(mqtt_connection)
-                        send_pending(mqtt_connection)
-                    except Exception as e:
-                        print(f"Reconnection failed: {e}. Retrying immediately...")
+                    # Paces the loop: returns after 1 s, when the backoff delay is up,
+                    # or straight away on a network-up event
+                    if self.reconnect_state.wait(timeout=1.0):
+                        print("Connection lost! Attempting reconnection...")
+                        self.reconnect_state.connecting()
+                        try:
+                            connect_future: Future = mqtt_connection.connect()
+                            connect_future.result(timeout=10)
+                            is_connected = True 
+                            self.is_connected = True
+                            connection_time = time.time()
+                            self.reconnect_state.connected()
+                            device_status_signal.status_changed.emit(True)  # Emit GREEN status
+                            print("Reconnected successfully to AWS IoT Core! Device is now CONNECTED.")
+                            subscribe_to_topics(mqtt_connection)
+                            send_pending(mqtt_connection)
+                        except Exception as e:
+                            delay = self.reconnect_state.failed(e)
+                            print(f"Reconnection failed: {e}. Next attempt in {delay:.1f} seconds...")
                     try:
-                        new_data = self.aws_send_queue.get_nowait()
-                        if not is_duplicate_sample(new_data):
+                        priority, new_data = self.aws_send_queue.get_nowait()
+                        if priority != PRIORITY_REPLAY and not is_duplicate_sample(new_data):
                             pending_messages.append(new_data)
                             save_pending()
                         print("New data queued to pending_data.json since device is DISCONNECTED.")
                     except queue.Empty: 
                         pass
-                # Minimal sleep to keep connection alive and responsive
-                time.sleep(0.5 if is_connected else 1)
         except KeyboardInterrupt:
             print("\nDisconnecting from AWS IoT Core...")
         
@@ -3977,6 +4270,7 @@ class AdminDashboard(Dashboard):
         lbl_s = QLabel("Serial No")
         self.serial_input = QLineEdit(self.machine_serial)
         self.serial_input.setPlaceholderText("Enter Serial Number")
+        self.attach_serial_completer(self.serial_input)
         self.serial_input.setFixedHeight(36)
         lbl_t = QLabel("Machine Type")
         self.machine_type_combo = QComboBox()
@@ -4228,7 +4522,7 @@ class AdminDashboard(Dashboard):
             for s in unique_serials:
                 try:
                     self.machine_serial = s
-                    self.save_mode(self.current_mode)
+                    self.save_mode(self.current_mode, send_to_cloud=True, priority=PRIORITY_BULK)
                     success += 1
                 except Exception as e:
                     failed.append((s, str(e)))
@@ -4271,6 +4565,7 @@ class AdminDashboard(Dashboard):
         
         self.serial_input = QLineEdit(self.machine_serial)
         self.serial_input.setPlaceholderText("Enter Machine Serial Number")
+        self.attach_serial_completer(self.serial_input)
         self.serial_input.setFixedHeight(50)
         self.serial_input.setMinimumWidth(150)
         self.serial_input.setMaxLength(20)
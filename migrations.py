@@ -0,0 +1,81 @@
+
+import sqlite3
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# (version, description, statements or a callable taking the connection)
+Migration = Tuple[int, str, Union[Sequence[str], Callable[[sqlite3.Connection], None]]]
+
+
+class QueryPlanError(RuntimeError):
+    """A hot query would scan a table or index instead of searching an index"""
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations: List[Migration]) -> int:
+    """
+    Apply every migration newer than PRAGMA user_version, in order.
+
+    Each migration runs in its own transaction together with the
+    user_version bump, so a failure leaves the schema at the last good
+    version. Returns the resulting version.
+    """
+    current = schema_version(conn)
+    for version, description, steps in sorted(migrations, key=lambda m: m[0]):
+        if version <= current:
+            continue
+        print(f"[migrations] Applying {version}: {description}")
+        try:
+            conn.execute("BEGIN")
+            if callable(steps):
+                steps(conn)
+            else:
+                for statement in steps:
+                    conn.execute(statement)
+            # PRAGMA does not accept parameters; version is an int from our own list
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        current = version
+    return current
+
+
+def query_plan(conn, sql: str, params: Sequence = ()) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for sql"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+
+def check_query_plans(
+    conn,
+    queries: Dict[str, Tuple[str, Sequence]],
+    allowed_scans: Optional[Dict[str, Sequence[str]]] = None
+) -> Dict[str, List[str]]:
+    """
+    Run EXPLAIN QUERY PLAN on every named (sql, params) and raise
+    QueryPlanError unless each one SEARCHes an index. Any SCAN counts as a
+    regression, including full index scans ("SCAN t USING INDEX i" or
+    "USING COVERING INDEX"), unless allowed_scans[name] lists a prefix of
+    that plan line. Sorting through a temp b-tree is only reported, since
+    small result sets sort cheaply.
+    """
+    allowed_scans = allowed_scans or {}
+    plans = {}
+    problems = []
+    for name, (sql, params) in queries.items():
+        plan = query_plan(conn, sql, params)
+        plans[name] = plan
+        allowed = tuple(allowed_scans.get(name, ()))
+        for detail in plan:
+            if detail.startswith("SCAN") and not (allowed and detail.startswith(allowed)):
+                problems.append(f"{name}: {detail}")
+            elif "TEMP B-TREE" in detail:
+                print(f"[migrations] {name} sorts with a temp b-tree: {detail}")
+        if not allowed and not any(detail.startswith("SEARCH") for detail in plan):
+            problems.append(f"{name}: no index SEARCH in plan {plan}")
+    if problems:
+        raise QueryPlanError("Hot queries not served by an index search: " + "; ".join(problems))
+    return plans
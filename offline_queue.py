@@ -1,160 +1,642 @@
 
 
+import hashlib
+import heapq
 import json
 import os
 import queue
 import threading
 import time
+import zlib
+from collections import deque
 from datetime import datetime
-from typing import Callable, Optional, Any
+from typing import Callable, Iterator, List, Optional, Any
+
+from compaction import CompactionPolicy
+from metrics import QueueMetrics
+from transports import InMemoryTransport, Transport
+
+# The journal is folded into a new snapshot once it has this many lines
+# and more than twice as many as there are pending payloads
+JOURNAL_COMPACT_MIN_LINES = 1000
+JOURNAL_SUFFIX = ".journal"
+
+
+class _PendingStore:
+    """
+    Insertion-ordered set of payload strings backing OfflineQueue._pending.
+
+    A deque keeps the order and a hash index (payload digest → sequence
+    number, payload, enqueue time, expiry and supersede key) answers
+    membership, so dedup, append and popleft are O(1). remove() is O(1) too:
+    it only drops the index entry, and the stale deque slot is skipped later
+    (and compacted away once they pile up).
+
+    Payloads with an expiry also go on a heap so expire() can drop them a
+    few at a time; a payload with a supersede key replaces the pending one
+    with the same key. on_drop("expired" / "superseded", payload_str) is
+    called for each.
+    """
+
+    def __init__(self, payloads=(), on_drop: Optional[Callable[[str, str], None]] = None):
+        self._order = deque()     # (seq, digest)
+        self._index = {}          # digest -> (seq, payload_str, enqueued_at, expires_at, key)
+        self._by_key = {}         # supersede key -> digest
+        self._expiry = []         # heap of (expires_at, seq, digest)
+        self._seq = 0
+        self.on_drop = on_drop
+        for payload_str in payloads:
+            self.append(payload_str)
+
+    @staticmethod
+    def _digest(payload_str: str) -> bytes:
+        return hashlib.blake2b(payload_str.encode('utf-8'), digest_size=16).digest()
+
+    def __contains__(self, payload_str: str) -> bool:
+        return self._digest(payload_str) in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[str]:
+        for seq, digest in list(self._order):
+            entry = self._index.get(digest)
+            if entry and entry[0] == seq:
+                yield entry[1]
+
+    def append(
+        self,
+        payload_str: str,
+        enqueued_at: Optional[float] = None,
+        expires_at: Optional[float] = None,
+        key: Optional[str] = None
+    ) -> bool:
+        """Add to the tail; returns False if the payload (or a newer one with its key) is already pending"""
+        digest = self._digest(payload_str)
+        if digest in self._index:
+            return False
+        enqueued_at = enqueued_at or time.time()
+        if key is not None:
+            older = self._by_key.get(key)
+            if older is not None and self._index[older][2] > enqueued_at:
+                self._dropped("superseded", payload_str)
+                return False
+            self.discard_key(key)
+            self._by_key[key] = digest
+        self._seq += 1
+        self._index[digest] = (self._seq, payload_str, enqueued_at, expires_at, key)
+        self._order.append((self._seq, digest))
+        if expires_at is not None:
+            heapq.heappush(self._expiry, (expires_at, self._seq, digest))
+        return True
+
+    def payload_for_key(self, key: str) -> Optional[str]:
+        digest = self._by_key.get(key)
+        return self._index[digest][1] if digest is not None else None
+
+    def discard_key(self, key: str) -> bool:
+        """Drop the pending payload with this supersede key, if any"""
+        digest = self._by_key.pop(key, None)
+        entry = self._index.get(digest) if digest is not None else None
+        if entry is None or not self._drop(digest):
+            return False
+        self._dropped("superseded", entry[1])
+        return True
+
+    def expire(self, now: float, limit: int = 256) -> int:
+        """Drop up to `limit` payloads whose expiry has passed; returns how many"""
+        dropped = 0
+        while self._expiry and self._expiry[0][0] <= now and dropped < limit:
+            _, seq, digest = heapq.heappop(self._expiry)
+            entry = self._index.get(digest)
+            if entry and entry[0] == seq:
+                self._drop(digest)
+                self._dropped("expired", entry[1])
+                dropped += 1
+        return dropped
+
+    def head(self, n: int) -> List[str]:
+        """First n payloads in order (without removing them)"""
+        out = []
+        for payload_str in self:
+            if len(out) >= n:
+                break
+            out.append(payload_str)
+        return out
+
+    def peek(self) -> Optional[str]:
+        self._drop_stale_head()
+        if not self._order:
+            return None
+        return self._index[self._order[0][1]][1]
+
+    def popleft(self) -> str:
+        self._drop_stale_head()
+        _, digest = self._order.popleft()
+        payload_str = self._index[digest][1]
+        self._drop(digest)
+        return payload_str
+
+    def remove(self, payload_str: str) -> bool:
+        return self._drop(self._digest(payload_str))
+
+    def clear(self):
+        self._order.clear()
+        self._index.clear()
+        self._by_key.clear()
+        self._expiry.clear()
+
+    def oldest_enqueued_at(self) -> Optional[float]:
+        self._drop_stale_head()
+        if not self._order:
+            return None
+        return self._index[self._order[0][1]][2]
+
+    def to_list(self) -> list:
+        return list(self)
+
+    def to_records(self) -> list:
+        records = []
+        for seq, digest in list(self._order):
+            entry = self._index.get(digest)
+            if entry and entry[0] == seq:
+                records.append({"payload": entry[1], "enqueued_at": entry[2],
+                                "expires_at": entry[3], "key": entry[4]})
+        return records
+
+    def _drop(self, digest: bytes) -> bool:
+        entry = self._index.pop(digest, None)
+        if entry is None:
+            return False
+        if entry[4] is not None and self._by_key.get(entry[4]) == digest:
+            del self._by_key[entry[4]]
+        if len(self._order) > 2 * len(self._index) + 64:
+            self._compact()
+        if len(self._expiry) > 2 * len(self._index) + 64:
+            self._expiry = [e for e in self._expiry if e[2] in self._index and self._index[e[2]][0] == e[1]]
+            heapq.heapify(self._expiry)
+        return True
+
+    def _dropped(self, reason: str, payload_str: str):
+        if self.on_drop:
+            self.on_drop(reason, payload_str)
+
+    def _drop_stale_head(self):
+        while self._order:
+            seq, digest = self._order[0]
+            entry = self._index.get(digest)
+            if entry and entry[0] == seq:
+                return
+            self._order.popleft()
+
+    def _compact(self):
+        self._order = deque((seq, d) for seq, d in self._order
+                            if d in self._index and self._index[d][0] == seq)
+
+
+def read_queue_file(queue_file: str) -> list:
+    """
+    Pending records of a queue file: the snapshot with queue_file + JOURNAL_SUFFIX
+    replayed on top ("add" lines appended, "del" lines removed by payload digest).
+    Raises if the snapshot cannot be read.
+    """
+    records = {}          # payload digest -> record, in queue order
+    if os.path.exists(queue_file):
+        with open(queue_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for record in data if isinstance(data, list) else []:
+            _add_record(records, record)
+    journal_file = queue_file + JOURNAL_SUFFIX
+    if os.path.exists(journal_file):
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue      # torn last line after a crash
+                if isinstance(entry, dict) and entry.get("op") == "del":
+                    records.pop(bytes.fromhex(entry["digest"]), None)
+                else:
+                    _add_record(records, entry)
+    return list(records.values())
+
+
+def write_queue_file(queue_file: str, records: list):
+    """Replace the snapshot with records (oldest first) and empty the journal it supersedes"""
+    records = sorted(records, key=lambda r: r["enqueued_at"])
+    tmp_file = queue_file + ".tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(records, f, separators=(',', ':'))
+    os.replace(tmp_file, queue_file)
+    # Journal entries are idempotent on top of the new snapshot, so a crash before this is harmless
+    open(queue_file + JOURNAL_SUFFIX, 'w', encoding='utf-8').close()
+
+
+def _add_record(records: dict, record):
+    # On disk: {"payload": ..., "enqueued_at": ...}; older files hold bare strings
+    if not isinstance(record, dict):
+        record = {"payload": record}
+    records.setdefault(_PendingStore._digest(record.get("payload", "")), record)
+
+
+def load_record(store: _PendingStore, record: dict) -> bool:
+    """Add one record returned by read_queue_file() to a pending store"""
+    return store.append(record.get("payload", ""), record.get("enqueued_at"), record.get("expires_at"),
+                        record.get("key"))
+
+
+class _Shard:
+    """One OfflineQueue worker: its own inbox, pending payloads and ACK state"""
+
+    def __init__(self, index: int, on_drop: Optional[Callable[[str, str], None]] = None):
+        self.index = index
+        self.queue = queue.Queue()
+        self.pending = _PendingStore(on_drop=on_drop)
+        self.acks = 0
+        self.ack_cond = threading.Condition()
+        self.ack_started = None
+        self.worker = None
+
+
+def _default_serial(payload: dict) -> str:
+    return str(payload.get("serial") or payload.get("serial_no") or "")
+
 
 class OfflineQueue:
-   
+    """
+    Durable send queue with device ACKs, sharded by device serial.
+
+    Payloads are routed to one of `shards` workers by a stable hash of their
+    serial (`key(payload)`, or the serial passed to put()). Each shard sends
+    in order and waits for its own ACKs, so a slow device only holds up the
+    devices that share its shard. All shards persist to the same queue_file.
+
+    Stale payloads are dropped instead of replayed: each one may carry a TTL
+    (put(ttl=...), default_ttl, or the compaction policy's ttl()), and a
+    payload with the same compaction.supersede_key() as an older one
+    replaces it. Expired payloads are removed a few at a time by the workers.
+
+    On disk, queue_file is a snapshot and queue_file + ".journal" gets one
+    JSON line per payload stored or removed since, so an ACK costs one
+    append. Once the journal outgrows the pending set it is folded into a
+    new snapshot (written to a temp file and renamed into place).
+    """
+
     def __init__(
         self,
         queue_file: str,
         on_send_success: Optional[Callable[[str], None]] = None,
         on_send_fail: Optional[Callable[[str], None]] = None,
         max_retries: int = 3,
-        ack_timeout: float = 10.0
+        ack_timeout: float = 10.0,
+        transport: Optional[Transport] = None,
+        batch_size: int = 1,
+        retry_interval: float = 0.5,
+        metrics_file: Optional[str] = None,
+        metrics_interval: float = 60.0,
+        shards: int = 1,
+        key: Optional[Callable[[dict], str]] = None,
+        default_ttl: Optional[float] = None,
+        compaction: Optional[CompactionPolicy] = None
     ):
         self.queue_file = queue_file
         self.on_send_success = on_send_success
         self.on_send_fail = on_send_fail
         self.max_retries = max_retries
         self.ack_timeout = ack_timeout
+        # transports.MqttTransport / HttpTransport; None = InMemoryTransport (accepts every
+        # publish, ACKs still come from acknowledge())
+        self.transport = transport or InMemoryTransport()
+        # Payloads published per round trip (the device ACKs each one)
+        self.batch_size = max(1, batch_size)
+        self.retry_interval = retry_interval
+        # Serial of a payload dict; decides which shard (and ordering domain) it joins
+        self.key = key or _default_serial
+        # Seconds a payload stays worth sending (None = forever); see compaction.py
+        self.default_ttl = default_ttl
+        self.compaction = compaction or CompactionPolicy()
 
-        self._queue = queue.Queue()           
-        self._pending = []                   
-        self._ack_received = threading.Event()
-        self._ack_received.set()         
+        self.metrics = QueueMetrics()
+        self._shards = [_Shard(i, on_drop=self._on_drop) for i in range(max(1, shards))]
+        self._idle = threading.Condition()
         self._lock = threading.Lock()
+        self.journal_file = queue_file + JOURNAL_SUFFIX
+        self._journal = None          # append handle; None while loading
+        self._journal_lines = 0
+
+        self.metrics.gauge("depth", lambda: sum(len(s.pending) + s.queue.qsize() for s in self._shards))
+        self.metrics.gauge("oldest_age_s", self._oldest_age)
+        if metrics_file:
+            self.metrics.start_dump(metrics_file, metrics_interval)
 
         self._load_from_disk()
-        self._start_worker()
+        self._start_workers()
 
 
     # Public API
-    
-    def put(self, payload: dict):
-        """Add a new payload from UI (thread-safe)"""
+
+    def put(self, payload: dict, serial: Optional[str] = None, ttl: Optional[float] = None):
+        """Add a new payload from UI (thread-safe); ttl overrides default_ttl and the policy"""
         payload_str = json.dumps(payload, separators=(',', ':'))
-        self._queue.put(payload_str)
+        shard = self._shard_for(self.key(payload) if serial is None else serial)
+        now = time.time()
+        if ttl is None:
+            ttl = self.compaction.ttl(payload)
+        if ttl is None:
+            ttl = self.default_ttl
+        expires_at = now + ttl if ttl is not None else None
+        shard.queue.put((now, payload_str, expires_at, self.compaction.supersede_key(payload)))
+        self.metrics.incr("enqueued")
+
+    def put_many(self, payloads: List[dict]):
+        """Add several payloads at once; they are published in batches of batch_size"""
+        for payload in payloads:
+            self.put(payload)
+
+    def acknowledge(self, count: int = 1, serial: Optional[str] = None):
+        """
+        Call this when ACK is received from device (once per acknowledged payload).
+        Pass the device serial when running more than one shard; without it the
+        ACK goes to the shard that has been waiting longest.
+        """
+        shard = self._shard_for(serial) if serial is not None else self._longest_waiting()
+        with shard.ack_cond:
+            shard.acks += count
+            if shard.ack_started is not None:
+                waited = time.monotonic() - shard.ack_started
+                for _ in range(count):
+                    self.metrics.ack_wait.record(waited)
+            shard.ack_cond.notify_all()
 
-    def acknowledge(self):
-        """Call this when ACK is received from device"""
-        self._ack_received.set()
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued and pending payload is acknowledged. False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while not self._is_drained():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining if remaining is not None else 1.0)
+        return True
+
+    async def flush_async(self, timeout: Optional[float] = None) -> bool:
+        """Awaitable flush() for asyncio callers"""
+        import asyncio
+        return await asyncio.get_running_loop().run_in_executor(None, self.flush, timeout)
+
+    def snapshot(self) -> dict:
+        """Counters, depth/oldest-age gauges, publish/ACK latency histograms and per-shard depth"""
+        snap = self.metrics.snapshot()
+        snap["shards"] = [len(s.pending) + s.queue.qsize() for s in self._shards]
+        return snap
 
     def is_connected(self) -> bool:
         """For external use – check if AWS thread is alive"""
-        return self._worker.is_alive()
-        
+        return all(s.worker.is_alive() for s in self._shards)
+
 
     # Internal: disk persistence
-   
+
     def _load_from_disk(self):
-        if not os.path.exists(self.queue_file):
-            self._pending = []
-            return
         try:
-            with open(self.queue_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self._pending = data if isinstance(data, list) else []
-            print(f"[OfflineQueue] Loaded {len(self._pending)} pending payload(s)")
+            for record in read_queue_file(self.queue_file):
+                self._load_record(record)
+            print(f"[OfflineQueue] Loaded {self.get_pending_count()} pending payload(s)")
         except Exception as e:
             print(f"[OfflineQueue] Failed to load queue: {e}")
-            self._pending = []
-            self.pending (),
-            
-    def _save_to_disk(self):
+            for shard in self._shards:
+                shard.pending = _PendingStore(on_drop=self._on_drop)
+        with self._lock:
+            self._compact_disk()
+
+    def _load_record(self, record: dict):
+        load_record(self._shard_for_payload(record.get("payload", "")).pending, record)
+
+    def _store(self, shard: _Shard, payload_strs: List[str], meta: dict):
+        """Add payloads to shard.pending and the journal; callers hold self._lock"""
+        for payload_str in payload_strs:
+            put_at, expires_at, key = meta.get(payload_str, (None, None, None))
+            put_at = put_at or time.time()
+            if shard.pending.append(payload_str, put_at, expires_at, key):
+                self._write_journal({"op": "add", "payload": payload_str, "enqueued_at": put_at,
+                                     "expires_at": expires_at, "key": key})
+
+    def _journal_removed(self, payload_strs: List[str]):
+        for payload_str in payload_strs:
+            self._write_journal({"op": "del", "digest": _PendingStore._digest(payload_str).hex()})
+
+    def _write_journal(self, entry: dict):
+        # Callers hold self._lock
+        if self._journal is None:
+            return
         try:
-            with open(self.queue_file, 'w', encoding='utf-8') as f:
-                json.dump(self._pending, f, indent=2)
+            self._journal.write(json.dumps(entry, separators=(',', ':')) + "\n")
+            self._journal.flush()
+            self._journal_lines += 1
+        except Exception as e:
+            print(f"[OfflineQueue] Failed to write journal: {e}")
+        if self._journal_lines > max(JOURNAL_COMPACT_MIN_LINES, 2 * self.get_pending_count()):
+            self._compact_disk()
+
+    def _compact_disk(self):
+        """Write every shard's pending payloads to a fresh snapshot and empty the journal; callers hold self._lock"""
+        records = []
+        for shard in self._shards:
+            records.extend(shard.pending.to_records())
+        try:
+            if self._journal is not None:
+                self._journal.close()
+            write_queue_file(self.queue_file, records)
+            self._journal_lines = 0
         except Exception as e:
             print(f"[OfflineQueue] Failed to save queue: {e}")
+        self._journal = open(self.journal_file, 'a', encoding='utf-8')
+
 
-    
-    # Internal: worker thread
-    
-    def _start_worker(self):
-        self._worker = threading.Thread(target=self._worker_loop, daemon=True)
-        self._worker.start()
+    # Internal: sharding
 
-    def _worker_loop(self):
+    def _shard_for(self, serial: str) -> _Shard:
+        # crc32 rather than hash(): stable across restarts, so reloads keep their shard
+        return self._shards[zlib.crc32(str(serial).encode('utf-8')) % len(self._shards)]
+
+    def _shard_for_payload(self, payload_str: str) -> _Shard:
+        if len(self._shards) == 1:
+            return self._shards[0]
+        try:
+            return self._shard_for(self.key(json.loads(payload_str)))
+        except Exception:
+            return self._shards[0]
+
+    def _longest_waiting(self) -> _Shard:
+        waiting = [s for s in self._shards if s.ack_started is not None]
+        if not waiting:
+            return self._shards[0]
+        return min(waiting, key=lambda s: s.ack_started)
+
+
+    # Internal: worker threads
+
+    def _start_workers(self):
+        for shard in self._shards:
+            shard.worker = threading.Thread(
+                target=self._worker_loop, args=(shard,), name=f"OfflineQueue-{shard.index}", daemon=True
+            )
+            shard.worker.start()
+
+    def _worker_loop(self, shard: _Shard):
         while True:
-        
+            self._expire(shard)
+            batch, taken, meta = self._collect_batch(shard)
+            ok = True
             try:
-                payload_str = self._queue.get(timeout=1)
-                if payload_str in self._pending:
-                    print("[OfflineQueue] Duplicate ignored")
-                    continue
-                self._try_send(payload_str)
+                if batch:
+                    ok = self._send_batch(shard, batch, meta)
+            finally:
+                # New payloads count as unfinished until sent, ACKed or stored offline
+                for _ in range(taken):
+                    shard.queue.task_done()
+                with self._idle:
+                    self._idle.notify_all()
+            if not ok:
+                time.sleep(self.retry_interval)
+
+    def _expire(self, shard: _Shard):
+        """Incremental TTL sweep: at most a few hundred payloads per pass"""
+        with self._lock:
+            # Removals are journaled by _on_drop
+            shard.pending.expire(time.time())
+
+    def _collect_batch(self, shard: _Shard):
+        """Oldest pending payloads first, topped up with new ones from put()"""
+        with self._lock:
+            batch = shard.pending.head(self.batch_size)
+        taken = 0
+        meta = {}        # payload_str -> (put_at, expires_at, key) for new payloads
+        while len(batch) < self.batch_size:
+            try:
+                # Only block when there is nothing at all to send
+                item = shard.queue.get(timeout=1) if not batch else shard.queue.get_nowait()
             except queue.Empty:
-                pass
+                break
+            taken += 1
+            put_at, payload_str, expires_at, key = item
+            if payload_str in shard.pending or payload_str in meta:
+                print("[OfflineQueue] Duplicate ignored")
+                self.metrics.incr("deduped")
+                continue
+            if expires_at is not None and expires_at <= time.time():
+                self.metrics.incr("expired")
+                continue
+            if key is not None:
+                self._supersede(shard, batch, meta, key)
+            batch.append(payload_str)
+            meta[payload_str] = (put_at, expires_at, key)
+        return batch, taken, meta
 
-            # 2. Retry pending if ready
-            if self._ack_received.is_set() and self._pending:
-                self._try_send(self._pending[0])
+    def _supersede(self, shard: _Shard, batch: List[str], meta: dict, key: str):
+        """A newer payload with `key` arrived: drop the older one from the batch and the store"""
+        for payload_str in list(batch):
+            if meta.get(payload_str, (None, None, None))[2] == key:
+                batch.remove(payload_str)
+                del meta[payload_str]
+                self.metrics.incr("superseded")
+        with self._lock:
+            older = shard.pending.payload_for_key(key)
+            if older in batch:
+                batch.remove(older)
+            shard.pending.discard_key(key)
 
-            time.sleep(0.5)
+    def _send_batch(self, shard: _Shard, batch: List[str], meta: dict) -> bool:
+        print(f"[OfflineQueue] Shard {shard.index} sending {len(batch)} payload(s): {batch[0][:80]}...")
 
-    def _try_send(self, payload_str: str):
-        print(f"[OfflineQueue] Sending: {payload_str[:80]}...")
+        started = time.monotonic()
+        with shard.ack_cond:
+            shard.acks = 0
+            shard.ack_started = started
+        results = self.transport.publish_batch(batch)
+        self.metrics.publish_latency.record(time.monotonic() - started)
 
-        # Simulate network send
-        success = self._simulate_publish(payload_str)
+        sent = [p for p, ok in zip(batch, results) if ok]
+        failed = [p for p, ok in zip(batch, results) if not ok]
+        self.metrics.incr("sent", len(sent))
+        self.metrics.incr("failed", len(failed))
+        if failed:
+            self._handle_send_fail(shard, failed, meta)
+        if not sent:
+            shard.ack_started = None
+            return False
 
-        if success:
-            self._ack_received.clear()
-            if self._wait_for_ack():
-                with self._lock:
-                    if self._pending and self._pending[0] == payload_str:
-                        self._pending.pop(0)
-                    self._save_to_disk()
-                if self.on_send_success:
+        # ACKs arrive in publish order, so the first `acked` payloads are done
+        acked = self._wait_for_acks(shard, len(sent))
+        self.metrics.incr("acked", acked)
+        if acked:
+            with self._lock:
+                removed = [p for p in sent[:acked] if shard.pending.remove(p)]
+                self._journal_removed(removed)
+            if self.on_send_success:
+                for payload_str in sent[:acked]:
                     self.on_send_success(payload_str)
-                print("[OfflineQueue] ACK received → removed from queue")
-            else:
-                self._handle_no_ack(payload_str)
-        else:
-            self._handle_send_fail(payload_str)
-
-    def _simulate_publish(self, payload_str: str) -> bool:
-    
-    
-        import random
-        return random.random() < 0.8
-
-    def _wait_for_ack(self) -> bool:
-        return self._ack_received.wait(timeout=self.ack_timeout)
-
-    def _handle_no_ack(self, payload_str: str):
-        print("[OfflineQueue] No ACK in time → keeping in queue")
-        if payload_str not in self._pending:
-            self._pending.append(payload_str)
-            self._save_to_disk()
-
-    def _handle_send_fail(self, payload_str: str):
-        print("[OfflineQueue] Send failed → storing offline")
-        if payload_str not in self._pending:
-            self._pending.append(payload_str)
-            self._save_to_disk()
+            print(f"[OfflineQueue] ACK received for {acked} payload(s) → removed from queue")
+        if acked < len(sent):
+            self._handle_no_ack(shard, sent[acked:], meta)
+            return False
+        return not failed
+
+    def _wait_for_acks(self, shard: _Shard, expected: int) -> int:
+        deadline = time.monotonic() + self.ack_timeout
+        with shard.ack_cond:
+            while shard.acks < expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                shard.ack_cond.wait(remaining)
+            shard.ack_started = None
+            return min(shard.acks, expected)
+
+    def _handle_no_ack(self, shard: _Shard, payload_strs: List[str], meta: Optional[dict] = None):
+        print(f"[OfflineQueue] No ACK in time for {len(payload_strs)} payload(s) → keeping in queue")
+        with self._lock:
+            self._store(shard, payload_strs, meta or {})
+
+    def _handle_send_fail(self, shard: _Shard, payload_strs: List[str], meta: Optional[dict] = None):
+        print(f"[OfflineQueue] Send failed for {len(payload_strs)} payload(s) → storing offline")
+        with self._lock:
+            self._store(shard, payload_strs, meta or {})
         if self.on_send_fail:
-            self.on_send_fail(payload_str)
+            for payload_str in payload_strs:
+                self.on_send_fail(payload_str)
+
+    def _on_drop(self, reason: str, payload_str: str):
+        # Expired / superseded: called by _PendingStore with self._lock held
+        self.metrics.incr(reason)
+        self._journal_removed([payload_str])
+
+    def _oldest_age(self) -> float:
+        with self._lock:
+            times = [s.pending.oldest_enqueued_at() for s in self._shards]
+        times = [t for t in times if t]
+        return round(time.time() - min(times), 3) if times else 0.0
+
+    def _is_drained(self) -> bool:
+        return all(s.queue.unfinished_tasks == 0 and not s.pending for s in self._shards)
+
 
- 
     # Utility
 
     def clear(self):
         """Clear all pending data (use with caution)"""
         with self._lock:
-            self._pending = []
+            for shard in self._shards:
+                shard.pending.clear()
+            self._compact_disk()
             if os.path.exists(self.queue_file):
                 os.remove(self.queue_file)
         print("[OfflineQueue] Queue cleared")
 
     def get_pending_count(self) -> int:
-        return len(self._pending)
+        return sum(len(s.pending) for s in self._shards)
 
     def get_pending(self) -> list:
-        return self._pending.copy()
\ No newline at end of file
+        with self._lock:
+            records = [r for s in self._shards for r in s.pending.to_records()]
+        return [r["payload"] for r in sorted(records, key=lambda r: r["enqueued_at"])]
\ No newline at end of file
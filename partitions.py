@@ -0,0 +1,252 @@
+
+import gzip
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, List, Optional, Sequence
+
+from db_pool import SQLitePool
+
+COLUMNS = ("id", "serial_no", "timestamp", "device_status", "device_data", "parsed_data")
+
+
+class MonthlyPartitions:
+    """
+    device_data split into one table per month (device_data_YYYYMM) behind a
+    UNION ALL view that keeps the old name, so ad-hoc and background reads
+    work unchanged.
+
+    A row goes to the partition of its timestamp's month. Ids come from one
+    sequence shared by all partitions, so (timestamp, id) stays a global
+    order: partitions sorted by month and read in turn give the same result
+    as one big table. Hot paths use tables() to touch only the partitions
+    their time bound can reach.
+    """
+
+    def __init__(self, view: str = "device_data"):
+        self.view = view
+        self.prefix = f"{view}_"
+        self.sequence = f"{view}_seq"
+        self._name = re.compile(re.escape(self.prefix) + r"(\d{6})$")
+
+
+    # Public API
+
+    def month_key(self, timestamp) -> str:
+        """'YYYYMM' of a datetime or 'YYYY-MM-DD ...' string ('000000' if it has no month)"""
+        key = str(timestamp)[:7].replace("-", "")
+        return key if len(key) == 6 and key.isdigit() else "000000"
+
+    def table_for(self, timestamp) -> str:
+        return self.prefix + self.month_key(timestamp)
+
+    def month_key_of_table(self, table: str) -> str:
+        return table[len(self.prefix):]
+
+    def tables(self, conn, newest_first: bool = False, start=None, end=None) -> List[str]:
+        """Existing partitions whose month lies between start and end (timestamps, both optional)"""
+        low = self.month_key(start) if start else "000000"
+        high = self.month_key(end) if end else "999999"
+        names = []
+        for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?",
+                                    (self.prefix + "%",)):
+            match = self._name.match(name)
+            if match and low <= match.group(1) <= high:
+                names.append(name)
+        return sorted(names, reverse=newest_first)
+
+    def ensure(self, conn, table: str, refresh_view: bool = True) -> bool:
+        """Create a partition (and re-point the view at it) if it is missing; True if created"""
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+            return False
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                id INTEGER PRIMARY KEY,
+                serial_no TEXT NOT NULL,
+                timestamp DATETIME NOT NULL,
+                device_status INTEGER,
+                device_data TEXT,
+                parsed_data JSON
+            )
+        ''')
+        conn.execute(f"CREATE INDEX {table}_serial_ts ON {table} (serial_no, timestamp)")
+        if refresh_view:
+            self.refresh_view(conn)
+        return True
+
+    def refresh_view(self, conn):
+        tables = self.tables(conn)
+        if not tables:
+            # ensure() comes back here once the table exists
+            self.ensure(conn, self.table_for(datetime.now()))
+            return
+        columns = ", ".join(COLUMNS)
+        conn.execute(f"DROP VIEW IF EXISTS {self.view}")
+        conn.execute(f"CREATE VIEW {self.view} AS " + " UNION ALL ".join(
+            f"SELECT {columns} FROM {table}" for table in tables
+        ))
+
+    def insert(self, conn, rows: Sequence[tuple]) -> List[int]:
+        """
+        Insert (serial_no, timestamp, device_status, device_data, parsed_data) rows
+        inside the caller's transaction; returns their ids in the same order.
+        """
+        if not rows:
+            return []
+        # UPDATE first: it takes the write lock, so no other writer can hand out the same ids
+        conn.execute(f"UPDATE {self.sequence} SET next_id = next_id + ?", (len(rows),))
+        last = conn.execute(f"SELECT next_id FROM {self.sequence}").fetchone()[0]
+        ids = list(range(last - len(rows), last))
+        by_table = defaultdict(list)
+        for row_id, row in zip(ids, rows):
+            by_table[self.table_for(row[1])].append((row_id,) + tuple(row))
+        for table, params in by_table.items():
+            self.ensure(conn, table)
+            conn.executemany(f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)", params)
+        return ids
+
+    def migrate_table(self, conn):
+        """Migration step: move rows of the single device_data table into partitions, then replace it with the view"""
+        next_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {self.view}").fetchone()[0]
+        sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (self.view,)).fetchone()
+        if sequence:
+            next_id = max(next_id, sequence[0] + 1)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {self.sequence} (next_id INTEGER NOT NULL)")
+        conn.execute(f"INSERT INTO {self.sequence} (next_id) VALUES (?)", (next_id,))
+
+        # The view can only take the name once the table is gone
+        columns = ", ".join(COLUMNS)
+        months = [row[0] for row in conn.execute(f"SELECT DISTINCT substr(timestamp, 1, 7) FROM {self.view}")]
+        for month in months:
+            table = self.table_for(month)
+            self.ensure(conn, table, refresh_view=False)
+            conn.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {self.view} "
+                         f"WHERE substr(timestamp, 1, 7) IS ?", (month,))
+        conn.execute(f"DROP TABLE {self.view}")
+        self.ensure(conn, self.table_for(datetime.now()), refresh_view=False)
+        self.refresh_view(conn)
+
+
+class PartitionRetention:
+    """
+    Background maintenance of MonthlyPartitions.
+
+    Partitions older than keep_months (0 keeps everything) are dumped to
+    <archive_dir>/<table>.<unix time>.jsonl.gz from a WAL read snapshot,
+    so ingest keeps running, and dropped only if no row arrived in between.
+    on_drop(conn, table) runs in the dropping transaction, before the DROP, so
+    tables that point at the partition's ids can be cleaned up atomically. Afterwards only the current (hot) partition is ANALYZEd; pages freed by
+    dropped partitions go to SQLite's freelist and are reused by new rows.
+    """
+
+    def __init__(
+        self,
+        pool: SQLitePool,
+        partitions: MonthlyPartitions,
+        archive_dir: str,
+        keep_months: int = 0,
+        interval: float = 24 * 3600,
+        on_drop: Optional[Callable[[object, str], None]] = None
+    ):
+        self.pool = pool
+        self.partitions = partitions
+        self.archive_dir = os.path.abspath(archive_dir)
+        self.keep_months = keep_months
+        self.interval = interval
+        self.on_drop = on_drop
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+
+    # Public API
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="PartitionRetention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self, now: Optional[datetime] = None) -> dict:
+        """Archive expired partitions and analyze the hot one; returns what was done"""
+        now = now or datetime.now()
+        archived = []
+        for table in self.expired(now):
+            path = self.archive(table)
+            if path:
+                archived.append(path)
+        hot = self.partitions.table_for(now)
+        with self.pool.connection() as conn:
+            if self.partitions.tables(conn, start=now, end=now):
+                conn.execute(f"ANALYZE {hot}")
+        return {"archived": archived, "analyzed": hot}
+
+    def expired(self, now: datetime) -> List[str]:
+        """Partitions of months before the last keep_months (the current month included)"""
+        if self.keep_months <= 0:
+            return []
+        month = now.year * 12 + now.month - self.keep_months
+        oldest_kept = f"{month // 12:04d}{month % 12 + 1:02d}"
+        conn = self.pool.acquire()
+        try:
+            return [t for t in self.partitions.tables(conn) if self.partitions.month_key_of_table(t) < oldest_kept]
+        finally:
+            conn.close()
+
+    def archive(self, table: str) -> Optional[str]:
+        """Dump one partition to a gzip JSON-lines file and drop it; None if it changed meanwhile"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        path = os.path.join(self.archive_dir, f"{table}.{int(time.time())}.jsonl.gz")
+        tmp_path = path + ".tmp"
+        conn = self.pool.acquire()
+        try:
+            dumped = 0
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as out:
+                cursor = conn.execute(f"SELECT {', '.join(COLUMNS)} FROM {table} ORDER BY id")
+                while True:
+                    rows = cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    for row in rows:
+                        out.write(json.dumps(dict(zip(COLUMNS, row)), default=str) + "\n")
+                    dumped += len(rows)
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] != dumped:
+                conn.rollback()
+                os.remove(tmp_path)
+                print(f"[PartitionRetention] {table} changed while archiving, retrying next run")
+                return None
+            if self.on_drop:
+                self.on_drop(conn, table)
+            conn.execute(f"DROP TABLE {table}")
+            self.partitions.refresh_view(conn)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"[PartitionRetention] Archiving {table} failed: {e}")
+            return None
+        finally:
+            conn.close()
+        # Publish the archive only once the drop is committed; a crash in between leaves the
+        # complete dump in tmp_path instead of an archive of rows that are still in the database
+        os.replace(tmp_path, path)
+        print(f"[PartitionRetention] Archived {dumped} row(s) of {table} to {path}")
+        return path
+
+
+    # Internal
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[PartitionRetention] Maintenance run failed: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,247 @@
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class StageMetrics:
+    """Count and latency (avg/max, milliseconds) of one pipeline stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self._total = 0.0
+        self._max = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self._total += seconds
+            if seconds > self._max:
+                self._max = seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            avg = self._total / self.count if self.count else 0.0
+            return {"count": self.count, "avg_ms": round(avg * 1000, 3), "max_ms": round(self._max * 1000, 3)}
+
+
+def frame_key(topic: str, payload: bytes) -> bytes:
+    """
+    Cheap per-device partition key: the last field before a frame's closing '#'
+    (telemetry and settings frames both end with the serial). Messages without
+    a frame fall back to their topic.
+    """
+    end = payload.rfind(b"#")
+    if end < 0:
+        return topic.encode()
+    head = payload[:end].rstrip(b", ")
+    return head[head.rfind(b",") + 1:]
+
+
+class _Ring:
+    """Fixed-capacity FIFO that overwrites its oldest entry when full"""
+
+    def __init__(self, capacity: int):
+        self.items = deque()
+        self.capacity = capacity
+        self.cond = threading.Condition()
+
+
+class ReceivePipeline:
+    """
+    Hand-off between the awscrt event-loop thread and a small worker pool.
+
+    submit() only appends the raw (topic, payload) to a bounded ring buffer and
+    returns, so a flood of device frames can never stall the MQTT event loop.
+    When the buffer is full the oldest frame is overwritten and counted as
+    dropped. Parsing and routing happen in the workers via `handler`.
+
+    Messages with the same key always go to the same worker, so their
+    relative order is preserved. The default key is the device serial
+    (frame_key()); every device publishes on the same topic, so keying by
+    topic would put all frames on one worker.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, bytes], None],
+        capacity: int = 4096,
+        workers: int = 2,
+        key: Optional[Callable[[str, bytes], str]] = None,
+        name: str = "ReceivePipeline"
+    ):
+        self.handler = handler
+        self.key = key or frame_key
+        self.name = name
+
+        per_worker = max(1, capacity // max(1, workers))
+        self._rings = [_Ring(per_worker) for _ in range(max(1, workers))]
+        self._counters = {"received": 0, "processed": 0, "dropped": 0, "errors": 0, "high_water": 0}
+        self._counter_lock = threading.Lock()
+        self.wait_metrics = StageMetrics()
+        self.handle_metrics = StageMetrics()
+        self._running = True
+        self._threads = []
+        for i, ring in enumerate(self._rings):
+            t = threading.Thread(target=self._worker_loop, args=(ring,), name=f"{name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+
+    # Public API
+
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Queue a raw message; never blocks. Returns False if an older message was dropped."""
+        ring = self._rings[hash(self.key(topic, payload)) % len(self._rings)]
+        with ring.cond:
+            dropped = len(ring.items) >= ring.capacity
+            if dropped:
+                ring.items.popleft()
+            ring.items.append((time.monotonic(), topic, payload))
+            depth = len(ring.items)
+            ring.cond.notify()
+        with self._counter_lock:
+            self._counters["received"] += 1
+            if depth > self._counters["high_water"]:
+                self._counters["high_water"] = depth
+            if dropped:
+                self._counters["dropped"] += 1
+                total = self._counters["dropped"]
+        if dropped and (total == 1 or total % 1000 == 0):
+            print(f"[{self.name}] Buffer full, dropping oldest frames ({total} dropped so far)")
+        return not dropped
+
+    def depth(self) -> int:
+        return sum(len(ring.items) for ring in self._rings)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            snapshot = dict(self._counters)
+        snapshot["depth"] = self.depth()
+        snapshot["wait"] = self.wait_metrics.snapshot()
+        snapshot["handle"] = self.handle_metrics.snapshot()
+        return snapshot
+
+    def stop(self, timeout: float = 2.0):
+        """Stop the workers after they drain what is already buffered"""
+        self._running = False
+        for ring in self._rings:
+            with ring.cond:
+                ring.cond.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+
+
+    # Internal: workers
+
+    def _worker_loop(self, ring: _Ring):
+        while True:
+            with ring.cond:
+                while not ring.items and self._running:
+                    ring.cond.wait()
+                if not ring.items:
+                    return
+                queued_at, topic, payload = ring.items.popleft()
+            started = time.monotonic()
+            self.wait_metrics.observe(started - queued_at)
+            try:
+                self.handler(topic, payload)
+                outcome = "processed"
+            except Exception as e:
+                print(f"[{self.name}] Handler failed: {e}")
+                outcome = "errors"
+            self.handle_metrics.observe(time.monotonic() - started)
+            with self._counter_lock:
+                self._counters[outcome] += 1
+
+
+class FrameRouter:
+    """
+    Consumer stage for parsed device frames (the Dashboard's aws_receive_queue).
+
+    offer() never blocks: when the bounded queue is full the oldest frame is
+    discarded. A single consumer thread resolves each frame's serial with
+    `serial_of` and passes it to every route in order, e.g. UI, log store
+    and activity aggregator. Queue wait and per-route latency are tracked.
+    """
+
+    def __init__(
+        self,
+        source: queue.Queue,
+        routes: List[Tuple[str, Callable[[str, dict], None]]],
+        serial_of: Callable[[dict], str],
+        name: str = "FrameRouter"
+    ):
+        self.source = source
+        self.routes = routes
+        self.serial_of = serial_of
+        self.name = name
+
+        self.dropped = 0
+        self._counter_lock = threading.Lock()   # offer() runs on several pipeline workers
+        self.wait_metrics = StageMetrics()
+        self.route_metrics = {route_name: StageMetrics() for route_name, _ in routes}
+        self._thread = threading.Thread(target=self._consume_loop, name=name, daemon=True)
+        self._thread.start()
+
+
+    # Public API
+
+    def offer(self, message: dict) -> bool:
+        """Queue a frame for routing. Returns False if an older frame had to be dropped."""
+        item = (time.monotonic(), message)
+        try:
+            self.source.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        try:
+            self.source.get_nowait()
+        except queue.Empty:
+            pass
+        with self._counter_lock:
+            self.dropped += 1
+            total = self.dropped
+        if total == 1 or total % 1000 == 0:
+            print(f"[{self.name}] Queue full, dropping oldest frames ({total} dropped so far)")
+        try:
+            self.source.put_nowait(item)
+        except queue.Full:
+            pass
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            dropped = self.dropped
+        snapshot = {
+            "depth": self.source.qsize(),
+            "capacity": self.source.maxsize,
+            "dropped": dropped,
+            "wait": self.wait_metrics.snapshot(),
+        }
+        for route_name, metrics in self.route_metrics.items():
+            snapshot[route_name] = metrics.snapshot()
+        return snapshot
+
+
+    # Internal: consumer
+
+    def _consume_loop(self):
+        while True:
+            queued_at, message = self.source.get()
+            self.wait_metrics.observe(time.monotonic() - queued_at)
+            try:
+                serial = self.serial_of(message)
+            except Exception as e:
+                print(f"[{self.name}] Could not resolve serial: {e}")
+                serial = ""
+            for route_name, route in self.routes:
+                started = time.monotonic()
+                try:
+                    route(serial, message)
+                except Exception as e:
+                    print(f"[{self.name}] Route '{route_name}' failed: {e}")
+                self.route_metrics[route_name].observe(time.monotonic() - started)
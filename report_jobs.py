@@ -0,0 +1,232 @@
+
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from fpdf import FPDF
+
+from db_pool import SQLitePool
+
+# Bump when the report layout changes so cached PDFs are re-rendered
+REPORT_TEMPLATE_VERSION = 1
+
+ROWS_PER_FETCH = 500
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class ReportJob:
+
+    def __init__(self, job_id: str, serial_no: str, max_id: int, path: str):
+        self.job_id = job_id
+        self.serial_no = serial_no
+        self.max_id = max_id
+        self.path = path
+        self.status = JOB_QUEUED
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "serial_no": self.serial_no,
+            "status": self.status,
+            "error": self.error,
+            "rows_up_to_id": self.max_id,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class _DeviceReport(FPDF):
+    """Paginated device data report: title + column header on every page, page numbers in the footer"""
+
+    COLUMNS = (("Timestamp", 50), ("Status", 18), ("Device data", 122))
+
+    def __init__(self, serial_no: str):
+        super().__init__()
+        self.serial_no = serial_no
+        self.set_auto_page_break(auto=True, margin=15)
+
+    def header(self):
+        self.set_font("Arial", "B", 12)
+        self.cell(0, 10, txt=f"Device Data Report for Serial: {self.serial_no}", ln=1, align='C')
+        self.set_font("Arial", "B", 9)
+        for title, width in self.COLUMNS:
+            self.cell(width, 7, txt=title, border=1)
+        self.ln()
+        self.set_font("Arial", size=8)
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font("Arial", size=8)
+        self.cell(0, 8, txt=f"Page {self.page_no()}", align='C')
+
+    def add_row(self, timestamp, device_status, device_data):
+        values = (str(timestamp)[:19], "" if device_status is None else str(device_status), device_data or "")
+        for (_, width), value in zip(self.COLUMNS, values):
+            # Core fonts are latin-1 only; clip long frames to the column
+            text = _latin1(value)
+            while text and self.get_string_width(text) > width - 2:
+                text = text[:-1]
+            self.cell(width, 6, txt=text, border=1)
+        self.ln()
+
+
+def render_device_report(conn, serial_no: str, max_id: int, path: str):
+    """Render rows of serial_no with id <= max_id to path, streaming them from the cursor"""
+    pdf = _DeviceReport(serial_no)
+    pdf.add_page()
+    cursor = conn.execute('''
+        SELECT timestamp, device_status, device_data FROM device_data
+        WHERE serial_no = ? AND id <= ?
+        ORDER BY timestamp
+    ''', (serial_no, max_id))
+    while True:
+        rows = cursor.fetchmany(ROWS_PER_FETCH)
+        if not rows:
+            break
+        for row in rows:
+            pdf.add_row(*row)
+    pdf.output(path)
+
+
+class ReportJobs:
+    """
+    Background PDF rendering with an on-disk artifact cache.
+
+    A report is identified by (serial, device_latest.max_id, template
+    version); submit() returns a finished job straight away when that PDF is
+    already in cache_dir, joins an identical job that is still running, and
+    otherwise queues a render on the worker pool. Requests never render.
+    """
+
+    def __init__(
+        self,
+        pool: SQLitePool,
+        cache_dir: str,
+        workers: int = 2,
+        render: Callable = render_device_report,
+        template_version: int = REPORT_TEMPLATE_VERSION,
+        keep_jobs_for: float = 3600.0
+    ):
+        self.pool = pool
+        # Absolute, since Flask resolves relative send_file paths against the app root
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.render = render
+        self.template_version = template_version
+        self.keep_jobs_for = keep_jobs_for
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ReportJobs")
+        self._jobs: Dict[str, ReportJob] = {}
+        self._by_artifact: Dict[str, ReportJob] = {}
+        self._lock = threading.Lock()
+
+
+    # Public API
+
+    def submit(self, serial_no: str) -> Optional[ReportJob]:
+        """Job for the current report of serial_no, or None if the device has no data"""
+        max_id = self._max_id(serial_no)
+        if max_id is None:
+            return None
+        path = self.artifact_path(serial_no, max_id)
+        with self._lock:
+            self._prune()
+            running = self._by_artifact.get(path)
+            if running and running.status in (JOB_QUEUED, JOB_RUNNING):
+                return running
+            job = ReportJob(uuid.uuid4().hex, serial_no, max_id, path)
+            self._jobs[job.job_id] = job
+            self._by_artifact[path] = job
+            if os.path.exists(path):
+                job.status = JOB_DONE
+                job.finished = time.time()
+                return job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cached(self, serial_no: str) -> Optional[str]:
+        """Path of an up-to-date cached report, if there is one"""
+        max_id = self._max_id(serial_no)
+        if max_id is None:
+            return None
+        path = self.artifact_path(serial_no, max_id)
+        return path if os.path.exists(path) else None
+
+    def artifact_path(self, serial_no: str, max_id: int) -> str:
+        return os.path.join(self.cache_dir, f"{self._safe(serial_no)}_{max_id}_v{self.template_version}.pdf")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+    # Internal
+
+    def _run(self, job: ReportJob):
+        job.status = JOB_RUNNING
+        tmp_path = f"{job.path}.{job.job_id}.tmp"
+        conn = self.pool.acquire()
+        try:
+            self.render(conn, job.serial_no, job.max_id, tmp_path)
+            os.replace(tmp_path, job.path)
+            job.status = JOB_DONE
+            self._drop_stale_artifacts(job)
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            print(f"[ReportJobs] Report for {job.serial_no} failed: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        finally:
+            conn.close()
+            job.finished = time.time()
+
+    def _max_id(self, serial_no: str) -> Optional[int]:
+        # Kept by the ingest writer: one primary-key lookup, not MAX(id) over every partition
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute("SELECT max_id FROM device_latest WHERE serial_no = ?", (serial_no,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _drop_stale_artifacts(self, job: ReportJob):
+        """Older reports of the same serial can never be requested again"""
+        pattern = re.compile(re.escape(self._safe(job.serial_no)) + r"_\d+_v\d+\.pdf$")
+        keep = os.path.basename(job.path)
+        for name in os.listdir(self.cache_dir):
+            if pattern.match(name) and name != keep:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _prune(self):
+        cutoff = time.time() - self.keep_jobs_for
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished < cutoff:
+                del self._jobs[job_id]
+                if self._by_artifact.get(job.path) is job:
+                    del self._by_artifact[job.path]
+
+    @staticmethod
+    def _safe(serial_no: str) -> str:
+        return re.sub(r"[^A-Za-z0-9_-]", "_", serial_no)
+
+
+def _latin1(text: str) -> str:
+    return str(text).encode("latin-1", "replace").decode("latin-1")
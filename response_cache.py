@@ -0,0 +1,106 @@
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class CachedBody:
+
+    def __init__(self, body: bytes, headers: Dict[str, str], tag: str, expires_at: float):
+        self.body = body
+        self.headers = headers
+        self.tag = tag
+        self.expires_at = expires_at
+        # Content hash: identical bodies keep the same strong ETag across cache refills
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """
+    Bounded in-process cache of serialized response bodies (TTL + LRU).
+
+    Every entry belongs to one tag (e.g. "settings:<email>"); invalidate(tag)
+    drops all of its entries. A fill that started before an invalidation of
+    its tag is discarded, so a slow reader cannot put a stale body back.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, CachedBody]" = OrderedDict()
+        self._by_tag: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0  # bumped by clear()
+        self._counters = {"hits": 0, "misses": 0, "evicted": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+
+
+    # Public API
+
+    def get(self, key: str) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry
+
+    def generation(self, tag: str) -> Tuple[int, int]:
+        """Take before building a body; pass to put() to detect invalidations in between"""
+        with self._lock:
+            return self._epoch, self._generations.get(tag, 0)
+
+    def put(self, key: str, body: bytes, tag: str, generation: Tuple[int, int],
+            headers: Optional[Dict[str, str]] = None) -> CachedBody:
+        """Store body unless tag was invalidated since `generation`; returns the entry either way"""
+        entry = CachedBody(body, dict(headers or {}), tag, time.monotonic() + self.ttl)
+        with self._lock:
+            if (self._epoch, self._generations.get(tag, 0)) != generation:
+                return entry
+            self._remove(key)
+            self._entries[key] = entry
+            self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._counters["evicted"] += 1
+        return entry
+
+    def invalidate(self, tag: str):
+        with self._lock:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in self._by_tag.pop(tag, ()):
+                if self._entries.pop(key, None) is not None:
+                    self._counters["invalidated"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot["entries"] = len(self._entries)
+        return snapshot
+
+
+    # Internal
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._by_tag.get(entry.tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_tag[entry.tag]
@@ -0,0 +1,232 @@
+
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from frame_codec import decode_frame
+
+# Bucket name -> (prefix length of 'YYYY-MM-DD HH:MM:SS' kept, suffix that completes the start time)
+BUCKETS = {
+    "hour": (13, ":00:00"),
+    "day": (10, " 00:00:00"),
+    "month": (7, "-01 00:00:00"),
+}
+UNKNOWN_MODE = "unknown"
+REBUILD_CHUNK_ROWS = 1000
+
+ROLLUP_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS device_rollups (
+        serial_no TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        frames INTEGER NOT NULL DEFAULT 0,
+        settings_frames INTEGER NOT NULL DEFAULT 0,
+        settings_changes INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (serial_no, bucket, bucket_start)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS device_mode_rollups (
+        serial_no TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        bucket_start TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        frames INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (serial_no, bucket, bucket_start, mode)
+    ) WITHOUT ROWID
+    ''',
+    # Last settings seen per serial, so a batch can tell whether a frame changed them
+    '''
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        serial_no TEXT PRIMARY KEY,
+        settings_signature TEXT,
+        active_mode TEXT
+    ) WITHOUT ROWID
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_device_rollups_fleet ON device_rollups (bucket, bucket_start)",
+    "CREATE INDEX IF NOT EXISTS idx_device_mode_rollups_fleet ON device_mode_rollups (bucket, bucket_start)",
+]
+
+SQL_UPSERT_ROLLUP = '''
+    INSERT INTO device_rollups (serial_no, bucket, bucket_start, frames, settings_frames, settings_changes,
+                                first_seen, last_seen)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (serial_no, bucket, bucket_start) DO UPDATE SET
+        frames = frames + excluded.frames,
+        settings_frames = settings_frames + excluded.settings_frames,
+        settings_changes = settings_changes + excluded.settings_changes,
+        first_seen = MIN(first_seen, excluded.first_seen),
+        last_seen = MAX(last_seen, excluded.last_seen)
+'''
+SQL_UPSERT_MODE_ROLLUP = '''
+    INSERT INTO device_mode_rollups (serial_no, bucket, bucket_start, mode, frames)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (serial_no, bucket, bucket_start, mode) DO UPDATE SET frames = frames + excluded.frames
+'''
+SQL_UPSERT_STATE = '''
+    INSERT INTO rollup_state (serial_no, settings_signature, active_mode) VALUES (?, ?, ?)
+    ON CONFLICT (serial_no) DO UPDATE SET
+        settings_signature = excluded.settings_signature,
+        active_mode = excluded.active_mode
+'''
+
+# Newest buckets first; callers reverse them into chronological order
+SQL_SERIAL_ROLLUPS = '''
+    SELECT bucket_start, frames, settings_frames, settings_changes, first_seen, last_seen
+    FROM device_rollups
+    WHERE serial_no = ? AND bucket = ? AND bucket_start >= ? AND bucket_start < ?
+    ORDER BY bucket_start DESC LIMIT ?
+'''
+SQL_SERIAL_MODE_ROLLUPS = '''
+    SELECT bucket_start, mode, frames FROM device_mode_rollups
+    WHERE serial_no = ? AND bucket = ? AND bucket_start >= ? AND bucket_start < ?
+'''
+SQL_FLEET_ROLLUPS = '''
+    SELECT bucket_start, COUNT(*), SUM(frames), SUM(settings_frames), SUM(settings_changes),
+           SUM(settings_changes > 0)
+    FROM device_rollups
+    WHERE bucket = ? AND bucket_start >= ? AND bucket_start < ?
+    GROUP BY bucket_start ORDER BY bucket_start DESC LIMIT ?
+'''
+SQL_FLEET_MODE_ROLLUPS = '''
+    SELECT bucket_start, mode, SUM(frames) FROM device_mode_rollups
+    WHERE bucket = ? AND bucket_start >= ? AND bucket_start < ?
+    GROUP BY bucket_start, mode
+'''
+
+
+def bucket_start(timestamp, bucket: str) -> str:
+    """Start of the bucket holding timestamp (datetime or 'YYYY-MM-DD HH:MM:SS...' string)"""
+    keep, suffix = BUCKETS[bucket]
+    return str(timestamp)[:keep] + suffix
+
+
+def settings_signature(frame: dict) -> str:
+    return json.dumps(frame.get("sections"), sort_keys=True, separators=(",", ":"))
+
+
+def update_rollups(conn, frames: Iterable[Tuple[str, object, Optional[dict]]]):
+    """
+    Fold one ingest batch of (serial_no, timestamp, decoded frame) into the
+    rollup tables, inside the caller's transaction. Counts are added to the
+    existing buckets, never recomputed. A settings frame counts as a change
+    when its sections differ from the previous settings frame of that
+    serial; telemetry frames are attributed to the last active mode.
+    """
+    frames = list(frames)
+    if not frames:
+        return
+    state = _load_state(conn, {serial_no for serial_no, _, _ in frames})
+    touched = set()
+    # (serial, bucket, start) -> [frames, settings_frames, settings_changes, first_seen, last_seen]
+    totals: Dict[tuple, list] = {}
+    modes: Dict[tuple, int] = defaultdict(int)
+
+    for serial_no, timestamp, frame in frames:
+        seen = str(timestamp)[:19]
+        signature, active_mode = state.get(serial_no, (None, None))
+        is_settings = bool(frame) and frame.get("kind") == "settings"
+        changed = 0
+        if is_settings:
+            new_signature = settings_signature(frame)
+            changed = int(signature is not None and new_signature != signature)
+            active_mode = frame.get("active_mode") or active_mode
+            state[serial_no] = (new_signature, active_mode)
+            touched.add(serial_no)
+        for bucket in BUCKETS:
+            start = bucket_start(seen, bucket)
+            total = totals.get((serial_no, bucket, start))
+            if total is None:
+                total = totals[(serial_no, bucket, start)] = [0, 0, 0, seen, seen]
+            total[0] += 1
+            total[1] += int(is_settings)
+            total[2] += changed
+            total[3] = min(total[3], seen)
+            total[4] = max(total[4], seen)
+            modes[(serial_no, bucket, start, active_mode or UNKNOWN_MODE)] += 1
+
+    conn.executemany(SQL_UPSERT_ROLLUP, [key + tuple(total) for key, total in totals.items()])
+    conn.executemany(SQL_UPSERT_MODE_ROLLUP, [key + (count,) for key, count in modes.items()])
+    conn.executemany(SQL_UPSERT_STATE, [(serial_no,) + state[serial_no] for serial_no in touched])
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup from device_data (migration backfill / repair)"""
+    for table in ("device_rollups", "device_mode_rollups", "rollup_state"):
+        conn.execute(f"DELETE FROM {table}")
+    cursor = conn.execute("SELECT serial_no, timestamp, device_data FROM device_data ORDER BY id")
+    while True:
+        rows = cursor.fetchmany(REBUILD_CHUNK_ROWS)
+        if not rows:
+            break
+        update_rollups(conn, [(serial_no, timestamp, decode_frame(data)) for serial_no, timestamp, data in rows])
+
+
+def read_rollups(conn, serial_no: str, bucket: str, lower: str, upper: str, limit: int) -> List[dict]:
+    """Up to `limit` most recent buckets of serial_no overlapping [lower, upper), oldest first"""
+    lower = bucket_start(lower, bucket) if lower else lower
+    rows = conn.execute(SQL_SERIAL_ROLLUPS, (serial_no, bucket, lower, upper, limit)).fetchall()
+    if not rows:
+        return []
+    lower = rows[-1][0]
+    modes = _modes_by_bucket(conn.execute(SQL_SERIAL_MODE_ROLLUPS, (serial_no, bucket, lower, upper)))
+    return [
+        {
+            "bucket_start": start,
+            "frames": frames,
+            "settings_frames": settings_frames,
+            "telemetry_frames": frames - settings_frames,
+            "settings_changes": changes,
+            "first_seen": first_seen,
+            "last_seen": last_seen,
+            "modes": modes.get(start, {}),
+        }
+        for start, frames, settings_frames, changes, first_seen, last_seen in reversed(rows)
+    ]
+
+
+def read_fleet_rollups(conn, bucket: str, lower: str, upper: str, limit: int) -> List[dict]:
+    """Fleet totals per bucket (active and changed device counts included), oldest first"""
+    lower = bucket_start(lower, bucket) if lower else lower
+    rows = conn.execute(SQL_FLEET_ROLLUPS, (bucket, lower, upper, limit)).fetchall()
+    if not rows:
+        return []
+    lower = rows[-1][0]
+    modes = _modes_by_bucket(conn.execute(SQL_FLEET_MODE_ROLLUPS, (bucket, lower, upper)))
+    return [
+        {
+            "bucket_start": start,
+            "active_devices": devices,
+            "changed_devices": changed_devices,
+            "frames": frames,
+            "settings_frames": settings_frames,
+            "telemetry_frames": frames - settings_frames,
+            "settings_changes": changes,
+            "modes": modes.get(start, {}),
+        }
+        for start, devices, frames, settings_frames, changes, changed_devices in reversed(rows)
+    ]
+
+
+def _load_state(conn, serials) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    state = {}
+    serials = list(serials)
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(serials), 500):
+        chunk = serials[i:i + 500]
+        marks = ", ".join("?" for _ in chunk)
+        for serial_no, signature, active_mode in conn.execute(
+            f"SELECT serial_no, settings_signature, active_mode FROM rollup_state WHERE serial_no IN ({marks})", chunk
+        ):
+            state[serial_no] = (signature, active_mode)
+    return state
+
+
+def _modes_by_bucket(rows) -> Dict[str, Dict[str, int]]:
+    modes: Dict[str, Dict[str, int]] = defaultdict(dict)
+    for start, mode, frames in rows:
+        modes[start][mode] = frames
+    return modes
@@ -0,0 +1,163 @@
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+# Priority classes for the AWS send pipeline
+PRIORITY_INTERACTIVE = "interactive"   # clinician pressed Save on a mode page
+PRIORITY_BULK = "bulk"                 # admin fleet apply across many serials
+PRIORITY_REPLAY = "replay"             # pendingfiles.json backlog after reconnect
+
+DEFAULT_WEIGHTS = {
+    PRIORITY_INTERACTIVE: 8,
+    PRIORITY_BULK: 3,
+    PRIORITY_REPLAY: 1,
+}
+
+# Oldest item a lane may hold before it is served regardless of weights (seconds)
+DEFAULT_MAX_WAIT = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_BULK: 15.0,
+    PRIORITY_REPLAY: 30.0,
+}
+
+
+class PrioritySendQueue:
+    """
+    Drop-in replacement for the queue.Queue behind `aws_send_queue`.
+
+    Items are kept in one FIFO lane per priority class. Interactive sends
+    always go next; bulk and replay lanes share the remaining capacity with
+    smooth weighted round-robin. A lane whose head has waited longer than
+    its max_wait is served first (starvation protection), so a steady stream
+    of interactive saves can't park a fleet apply or the backlog forever.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, int]] = None,
+        max_wait: Optional[Dict[str, float]] = None
+    ):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.max_wait = dict(DEFAULT_MAX_WAIT if max_wait is None else max_wait)
+
+        self._lanes = {name: deque() for name in self.weights}
+        self._credit = {name: 0 for name in self.weights}
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+
+
+    # Public API
+
+    def put(self, item: Any, priority: str = PRIORITY_INTERACTIVE):
+        """Queue an item in the given priority lane (thread-safe)"""
+        if priority not in self._lanes:
+            raise ValueError(f"Unknown send priority: {priority}")
+        with self._not_empty:
+            self._lanes[priority].append((time.monotonic(), item))
+            self._not_empty.notify()
+
+    def get_nowait(self) -> Tuple[str, Any]:
+        """Return (priority, item) for the next item to send, or raise queue.Empty"""
+        return self.get_entry_nowait()[:2]
+
+    def get(self, timeout: Optional[float] = None) -> Tuple[str, Any]:
+        """Blocking variant of get_nowait()"""
+        return self.get_entry(timeout)[:2]
+
+    def get_entry_nowait(self) -> Tuple[str, Any, float]:
+        """(priority, item, enqueued_at) of the next item; enqueued_at goes back to put_front()"""
+        with self._lock:
+            return self._pop_next()
+
+    def get_entry(self, timeout: Optional[float] = None) -> Tuple[str, Any, float]:
+        """Blocking variant of get_entry_nowait()"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._not_empty:
+            while not self._has_items():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+            return self._pop_next()
+
+    def put_front(self, item: Any, priority: str, enqueued_at: Optional[float] = None):
+        """
+        Return an item to the head of its lane (e.g. a replay send that was preempted).
+        Pass the enqueued_at get_entry() returned so the item keeps its age for max_wait.
+        """
+        with self._not_empty:
+            self._lanes[priority].appendleft((time.monotonic() if enqueued_at is None else enqueued_at, item))
+            self._not_empty.notify()
+
+    def has_pending(self, priority: str) -> bool:
+        with self._lock:
+            return bool(self._lanes.get(priority))
+
+    def discard(self, priority: str) -> int:
+        """Drop everything queued in one lane, e.g. replay items after a disconnect"""
+        with self._lock:
+            dropped = len(self._lanes[priority])
+            self._lanes[priority].clear()
+            self._credit[priority] = 0
+            return dropped
+
+    def qsize(self) -> int:
+        with self._lock:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def depths(self) -> Dict[str, int]:
+        with self._lock:
+            return {name: len(lane) for name, lane in self._lanes.items()}
+
+
+    # Internal: scheduling
+
+    def _has_items(self) -> bool:
+        return any(self._lanes.values())
+
+    def _pop_next(self):
+        active = [name for name, lane in self._lanes.items() if lane]
+        if not active:
+            raise queue.Empty
+
+        # Starvation protection: serve the lane whose head is most overdue
+        now = time.monotonic()
+        overdue = None
+        overdue_by = 0.0
+        for name in active:
+            limit = self.max_wait.get(name, 0.0)
+            if limit <= 0:
+                continue
+            late = now - self._lanes[name][0][0] - limit
+            if late > overdue_by:
+                overdue, overdue_by = name, late
+        if overdue is not None:
+            return self._pop_from(overdue)
+
+        # Otherwise interactive work is never held back by weights
+        if PRIORITY_INTERACTIVE in active:
+            return self._pop_from(PRIORITY_INTERACTIVE)
+
+        # Smooth weighted round-robin across the remaining lanes
+        total = 0
+        best = None
+        for name in active:
+            weight = self.weights.get(name, 1)
+            self._credit[name] += weight
+            total += weight
+            if best is None or self._credit[name] > self._credit[best]:
+                best = name
+        self._credit[best] -= total
+        return self._pop_from(best)
+
+    def _pop_from(self, name: str):
+        enqueued_at, item = self._lanes[name].popleft()
+        if not self._lanes[name]:
+            self._credit[name] = 0
+        return name, item, enqueued_at
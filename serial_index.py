@@ -0,0 +1,149 @@
+
+import bisect
+import heapq
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+# Substrings up to this length are indexed; longer queries intersect their GRAM_SIZE-grams
+GRAM_SIZE = 3
+
+
+def normalize_serial(serial: str) -> str:
+    """
+    Normalize a device serial number so the same physical device always uses
+    the same key everywhere (settings, logs, dashboard).
+
+    The device protocol sometimes appends a machine-type suffix to the serial
+    (e.g. '12345678B' for BIPAP, '12345678C' for CPAP). For the UI and for file
+    keys we strip this trailing type letter and only keep the numeric part,
+    so that:
+      - Logs for a device are always under '12345678'
+      - Settings are stored per base serial
+      - The type is still encoded only in the CSV / MQTT payload.
+    """
+    if not serial:
+        return ""
+    s = str(serial).strip()
+    if len(s) > 1 and s[-1] in ("B", "C") and s[:-1].isdigit():
+        return s[:-1]
+    return s
+
+
+class _SerialStats:
+
+    __slots__ = ("count", "last_seen")
+
+    def __init__(self):
+        self.count = 0
+        self.last_seen = 0.0
+
+
+class SerialIndex:
+    """
+    Type-ahead index over known (normalized) serial numbers.
+
+    Keys are kept sorted, so a prefix is one bisect range. When the prefix
+    matches fewer than `limit` serials, substring matches (e.g. the last
+    digits, found through an n-gram map) and serials one edit away (typos, via a deletion-neighbourhood
+    map) are appended. Each tier is ranked by frecency: log-scaled use
+    count plus a recency bonus that halves every half_life_days.
+    '12345678B' and '12345678C' are both stored and searched as '12345678'.
+    """
+
+    def __init__(self, half_life_days: float = 7.0):
+        self.half_life = half_life_days * 86400
+        self._keys: List[str] = []
+        self._stats: Dict[str, _SerialStats] = {}
+        self._deletes: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, serial: str) -> bool:
+        return self._key(serial) in self._stats
+
+
+    # Public API
+
+    def add(self, serial: str, seen_at: Optional[float] = None, count: int = 1):
+        """Record `count` uses of serial, the latest at seen_at (epoch seconds, default now)"""
+        key = self._key(serial)
+        if not key:
+            return
+        seen_at = time.time() if seen_at is None else seen_at
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = _SerialStats()
+                bisect.insort(self._keys, key)
+                for variant in self._deletions(key):
+                    self._deletes.setdefault(variant, set()).add(key)
+                for gram in self._substrings(key):
+                    self._grams.setdefault(gram, set()).add(key)
+            stats.count += max(0, count)
+            stats.last_seen = max(stats.last_seen, seen_at)
+
+    def suggest(self, text: str, limit: int = 8, now: Optional[float] = None) -> List[str]:
+        """Best matching serials for what has been typed so far"""
+        query = self._key(text)
+        if not query:
+            return self.most_used(limit, now)
+        now = time.time() if now is None else now
+        with self._lock:
+            start = bisect.bisect_left(self._keys, query)
+            end = bisect.bisect_left(self._keys, query + "\uffff", start)
+            results = self._ranked(self._keys[start:end], now, limit)
+            if len(results) < limit:
+                taken = set(results)
+                contains = [k for k in self._containing(query) if k not in taken]
+                results += self._ranked(contains, now, limit - len(results))
+            if len(results) < limit and len(query) >= 4:
+                taken = set(results)
+                near = set()
+                for variant in self._deletions(query) | {query}:
+                    near |= self._deletes.get(variant, set())
+                    if variant in self._stats:
+                        near.add(variant)
+                results += self._ranked([k for k in near if k not in taken], now, limit - len(results))
+        return results
+
+    def most_used(self, limit: int = 8, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._ranked(self._keys, now, limit)
+
+
+    # Internal
+
+    def _containing(self, query: str) -> Set[str]:
+        """Keys that contain query, without looking at keys that lack one of its grams"""
+        if len(query) <= GRAM_SIZE:
+            return self._grams.get(query, set())
+        grams = sorted((self._grams.get(query[i:i + GRAM_SIZE], set())
+                        for i in range(len(query) - GRAM_SIZE + 1)), key=len)
+        return {k for k in grams[0].intersection(*grams[1:]) if query in k}
+
+    def _ranked(self, keys: List[str], now: float, limit: int) -> List[str]:
+        """Top `limit` keys by score (ties alphabetical) without sorting them all"""
+        return heapq.nsmallest(limit, keys, key=lambda k: (-self._score(k, now), k))
+
+    def _score(self, key: str, now: float) -> float:
+        stats = self._stats[key]
+        age = max(0.0, now - stats.last_seen)
+        return math.log1p(stats.count) + 2.0 * 0.5 ** (age / self.half_life)
+
+    @staticmethod
+    def _key(serial: str) -> str:
+        return normalize_serial(str(serial or "").strip().upper())
+
+    @staticmethod
+    def _substrings(key: str) -> Set[str]:
+        return {key[i:i + n] for n in range(1, GRAM_SIZE + 1) for i in range(len(key) - n + 1)}
+
+    @staticmethod
+    def _deletions(key: str) -> Set[str]:
+        return {key[:i] + key[i + 1:] for i in range(len(key))}
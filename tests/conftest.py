@@ -0,0 +1,22 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client(tmp_path_factory):
+    """Flask test client of views, on a fresh bipap_backend.db in a temporary directory"""
+    pytest.importorskip("flask")
+    pytest.importorskip("awsiot")
+    # views opens DB_FILE relative to the working directory, also for connections opened later
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("views"))
+    try:
+        yield importlib.import_module("views").app.test_client()
+    finally:
+        os.chdir(cwd)
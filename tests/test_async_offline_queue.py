@@ -0,0 +1,51 @@
+import asyncio
+import json
+import time
+
+from async_offline_queue import AsyncOfflineQueue
+from offline_queue import OfflineQueue
+from transports import InMemoryTransport
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reads_what_offline_queue_left_in_its_journal(tmp_path):
+    queue_file = str(tmp_path / "q.json")
+    q = OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), batch_size=8, retry_interval=60)
+    q.put_many([{"serial": "1", "n": n} for n in range(3)])
+    wait_for(lambda: q.get_pending_count() == 3)
+    assert json.loads((tmp_path / "q.json").read_text()) == []
+
+    async def drain():
+        holder = []
+        transport = InMemoryTransport(on_publish=lambda payload_str: holder[0].acknowledge_nowait())
+        async with AsyncOfflineQueue(queue_file, transport=transport, batch_size=8, ack_timeout=5) as aq:
+            holder.append(aq)
+            assert aq.get_pending_count() == 3
+            assert await aq.flush(timeout=5)
+        return transport.sent
+
+    sent = asyncio.run(drain())
+    assert sorted(json.loads(p)["n"] for p in sent) == [0, 1, 2]
+    # The snapshot written on close supersedes the journal, so nothing is replayed again
+    assert (tmp_path / "q.json.journal").read_text() == ""
+    assert OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), retry_interval=60).get_pending_count() == 0
+
+
+def test_close_keeps_unsent_payloads_for_the_sync_queue(tmp_path):
+    queue_file = str(tmp_path / "q.json")
+
+    async def fill():
+        async with AsyncOfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0),
+                                     retry_interval=60) as aq:
+            await aq.put_many([{"serial": "1", "n": n} for n in range(2)])
+            await asyncio.sleep(0.05)
+
+    asyncio.run(fill())
+    q = OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), retry_interval=60)
+    assert sorted(json.loads(p)["n"] for p in q.get_pending()) == [0, 1]
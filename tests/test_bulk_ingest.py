@@ -0,0 +1,54 @@
+import json
+
+TELEMETRY = "*,141025,141025,{time},1400,1,4,5,8,5,4,2,9,1,8,7,3,9,3,5,2,1,2,3,{serial},#"
+URL = "/device_data/bulk"
+
+
+def frame(serial, time="1300"):
+    return TELEMETRY.format(serial=serial, time=time)
+
+
+def statuses(response):
+    assert response.status_code == 200
+    return [r["status"] for r in response.get_json()["results"]]
+
+
+def test_duplicates_within_the_request(client):
+    entries = [frame("10000001"), frame("10000001"), {"device_data": frame("10000001"), "timestamp": "2025-01-02T03:04:05"}]
+    assert statuses(client.post(URL, json=entries)) == ["inserted", "duplicate", "inserted"]
+
+
+def test_replay_without_timestamps_is_idempotent(client):
+    backlog = [frame("10000002", "1300"), json.dumps({"device_status": 1, "device_data": frame("10000002", "1301")})]
+    assert statuses(client.post(URL, json=backlog)) == ["inserted", "inserted"]
+    assert statuses(client.post(URL, json=backlog + [frame("10000002", "1302")])) == \
+        ["duplicate", "duplicate", "inserted"]
+
+
+def test_replay_with_timestamps_is_idempotent(client):
+    entries = [{"device_data": frame("10000003"), "timestamp": 1735790400}]
+    assert statuses(client.post(URL, json=entries)) == ["inserted"]
+    assert statuses(client.post(URL, json=entries)) == ["duplicate"]
+    entries[0]["timestamp"] = 1735790401
+    assert statuses(client.post(URL, json=entries)) == ["inserted"]
+
+
+def test_offline_queue_records_are_unwrapped(client):
+    record = {"payload": json.dumps({"device_status": 1, "device_data": frame("10000004")}), "enqueued_at": 1735790400.5}
+    assert statuses(client.post(URL, json=[record])) == ["inserted"]
+    assert statuses(client.post(URL, json=[record])) == ["duplicate"]
+
+
+def test_bad_entries_are_reported_not_fatal(client):
+    entries = [
+        {"device_data": frame("10000005"), "timestamp": 1e20},
+        {"device_data": frame("10000005"), "timestamp": "yesterday"},
+        {"device_status": 1},
+        "*,1,2,#",
+        frame("10000005"),
+    ]
+    assert statuses(client.post(URL, json=entries)) == ["invalid", "invalid", "invalid", "invalid", "inserted"]
+
+
+def test_empty_request_is_rejected(client):
+    assert client.post(URL, json=[]).status_code == 400
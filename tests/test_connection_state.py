@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from connection_state import (
+    STATE_BACKOFF, STATE_CONNECTED, STATE_CONNECTING, STATE_SUSPENDED, ConnectionBudget, ReconnectStateMachine
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def machine(clock, budget=None, **kwargs):
+    transitions = []
+    sm = ReconnectStateMachine(budget=budget or ConnectionBudget(1000, 1, clock=clock), clock=clock,
+                               rng=random.Random(42), on_transition=lambda s, d: transitions.append((s, d)),
+                               **kwargs)
+    return sm, transitions
+
+
+def test_backoff_delay_stays_within_base_and_cap(clock):
+    sm, _ = machine(clock, base_delay=1.0, max_delay=20.0, max_failures=1000)
+    delays = [sm.failed() for _ in range(200)]
+    assert all(1.0 <= d <= 20.0 for d in delays)
+    assert max(delays) == 20.0   # decorrelated growth reaches the cap
+
+
+def test_state_transitions(clock):
+    sm, transitions = machine(clock, base_delay=1.0, max_delay=10.0, max_failures=3, suspend_time=300.0)
+    sm.connecting()
+    sm.failed()
+    sm.connecting()
+    sm.failed()
+    sm.connecting()
+    assert sm.failed() == 300.0
+    assert [s for s, _ in transitions] == [STATE_CONNECTING, STATE_BACKOFF, STATE_CONNECTING, STATE_BACKOFF,
+                                           STATE_CONNECTING, STATE_SUSPENDED]
+
+    sm.connected()
+    assert (sm.state, sm.failures) == (STATE_CONNECTED, 0)
+    sm.disconnected()
+    state, delay = transitions[-1]
+    assert state == STATE_BACKOFF and 0.0 <= delay <= 1.0
+
+
+def test_wait_is_due_only_after_the_delay_or_network_up(clock):
+    sm, _ = machine(clock, base_delay=5.0, max_delay=5.0)
+    assert sm.failed() == 5.0
+    assert not sm.wait(timeout=0)
+    clock.advance(5.0)
+    assert sm.wait(timeout=0)
+
+    sm.failed()
+    sm.network_up()
+    assert sm.failures == 0 and sm.wait(timeout=0)
+
+
+def test_budget_blocks_when_exhausted_and_refills_over_time(clock):
+    budget = ConnectionBudget(max_attempts=3, per_seconds=30.0, clock=clock)
+    assert [budget.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert budget.acquire() == pytest.approx(10.0)
+    clock.advance(4.0)
+    assert budget.acquire() == pytest.approx(6.0)
+    clock.advance(6.0)
+    assert budget.acquire() == 0.0
+    assert budget.acquire() > 0
+    clock.advance(300.0)   # refills only up to max_attempts
+    assert [budget.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert budget.acquire() > 0
+
+
+def test_exhausted_budget_holds_back_a_due_attempt(clock):
+    budget = ConnectionBudget(max_attempts=1, per_seconds=10.0, clock=clock)
+    sm, _ = machine(clock, budget=budget)
+    assert sm.wait(timeout=0)
+    assert not sm.wait(timeout=0)
+    clock.advance(10.0)
+    assert sm.wait(timeout=0)
@@ -0,0 +1,39 @@
+import time
+
+import pytest
+
+pytest.importorskip("werkzeug")
+
+from credentials import SessionTokens
+
+
+@pytest.fixture
+def tokens():
+    return SessionTokens(b"test-secret", ttl=60)
+
+
+def test_issued_token_verifies(tokens):
+    issued = tokens.issue("user@example.com")
+    assert tokens.verify(issued["token"]) == "user@example.com"
+    assert issued["expires_at"] >= time.time()
+
+
+def test_tampered_signature_is_rejected(tokens):
+    body, signature = tokens.issue("user@example.com")["token"].split(".")
+    forged = signature[:-1] + ("A" if signature[-1] != "A" else "B")
+    assert tokens.verify(f"{body}.{forged}") is None
+
+
+def test_other_secret_is_rejected(tokens):
+    token = SessionTokens(b"other-secret").issue("user@example.com")["token"]
+    assert tokens.verify(token) is None
+
+
+def test_expired_token_is_rejected():
+    tokens = SessionTokens(b"test-secret", ttl=-1)
+    assert tokens.verify(tokens.issue("user@example.com")["token"]) is None
+
+
+@pytest.mark.parametrize("token", [None, "", "no-dot", "é.é", "abc.ÿþ", "\ud800.x", "abc.\ud800"])
+def test_malformed_tokens_are_rejected(tokens, token):
+    assert tokens.verify(token) is None
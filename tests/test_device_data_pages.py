@@ -0,0 +1,53 @@
+import base64
+import json
+
+SERIAL = "20000001"
+TELEMETRY = "*,141025,141025,{time},1400,1,4,5,8,5,4,2,9,1,8,7,3,9,3,5,2,1,2,3,{serial},#"
+
+
+def seed(client, serial, timestamps):
+    entries = [{"device_data": TELEMETRY.format(time=f"{n:04d}", serial=serial), "timestamp": ts}
+               for n, ts in enumerate(timestamps)]
+    assert client.post("/device_data/bulk", json=entries).get_json()["inserted"] == len(timestamps)
+
+
+def test_pages_walk_every_partition_newest_first(client):
+    # Two months (two partitions) and a timestamp tie that only the id breaks
+    timestamps = ["2025-01-31T23:00:00", "2025-02-01T00:00:00", "2025-02-01T00:00:00",
+                  "2025-02-02T00:00:00", "2025-01-15T00:00:00"]
+    seed(client, SERIAL, timestamps)
+    seen, cursor = [], None
+    while True:
+        response = client.get(f"/device_data/{SERIAL}", query_string={"limit": 2, "fields": "id,timestamp",
+                                                                    **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        seen += response.get_json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    keys = [(row["timestamp"], row["id"]) for row in seen]
+    assert len(keys) == 5 and keys == sorted(keys, reverse=True)
+
+
+def test_since_returns_only_newer_rows_oldest_first(client):
+    serial = "20000002"
+    seed(client, serial, ["2025-03-01T00:00:00", "2025-03-02T00:00:00"])
+    first = client.get(f"/device_data/{serial}", query_string={"limit": 10})
+    latest = first.headers["X-Latest-Cursor"]
+    assert client.get(f"/device_data/{serial}", query_string={"since": latest}).get_json() == []
+    seed(client, serial, ["2025-04-01T00:00:00", "2025-04-02T00:00:00"])
+    newer = client.get(f"/device_data/{serial}", query_string={"since": latest, "fields": "timestamp"})
+    assert [row["timestamp"][:10] for row in newer.get_json()] == ["2025-04-01", "2025-04-02"]
+    assert newer.headers["X-Latest-Cursor"] != latest
+
+
+def test_field_projection_and_bad_input(client):
+    serial = "20000003"
+    seed(client, serial, ["2025-05-01T00:00:00"])
+    [row] = client.get(f"/device_data/{serial}", query_string={"fields": "device_status"}).get_json()
+    assert row == {"device_status": None}
+    assert client.get(f"/device_data/{serial}", query_string={"fields": "password"}).status_code == 400
+    assert client.get(f"/device_data/{serial}", query_string={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/device_data/no-such-serial").status_code == 404
+    cursor = base64.urlsafe_b64encode(json.dumps(["2025-05-02 00:00:00", 0]).encode()).decode()
+    assert len(client.get(f"/device_data/{serial}", query_string={"cursor": cursor}).get_json()) == 1
@@ -0,0 +1,59 @@
+from frame_codec import SECTION_FIELDS, decode_frame, section_rows, split_frame
+
+TELEMETRY = "*,141025,141025,1300,1400,1,4,5,8,5,4,2,9,1,8,7,3,9,3,5,2,1,2,3,12345678,#"
+# S header, active mode, ST section (ti_min/ti_max in tenths), then the settings section and serial
+SETTINGS = "*,S,141025,1300,ST_MODE,D,20,6,4,12,8,30,3,2,1,F,1,2,3,4,5,6,7,12345678B,#"
+
+
+def test_split_frame_strips_markers_and_spaces():
+    assert split_frame(" *, a ,b,# ") == ["a", "b"]
+
+
+def test_telemetry_frame():
+    frame = decode_frame(TELEMETRY)
+    assert frame["kind"] == "telemetry"
+    assert frame["serial_no"] == "12345678"
+    assert (frame["start_date"], frame["end_date"], frame["start_time"], frame["end_time"]) == \
+        ("141025", "141025", "1300", "1400")
+    assert frame["values"][:3] == [1.0, 4.0, 5.0]
+
+
+def test_settings_frame():
+    frame = decode_frame(SETTINGS)
+    assert frame["kind"] == "settings"
+    assert frame["machine_type"] == "BIPAP"
+    assert (frame["date"], frame["time"]) == ("141025", "1300")
+    assert frame["active_mode"] == "ST"
+    assert frame["serial_no"] == "12345678B"
+    st = frame["sections"]["ST"]
+    assert st["ipap"] == 20.0 and st["backup_rate"] == 12.0
+    assert st["ti_min"] == 0.8 and st["ti_max"] == 3.0
+    assert frame["sections"]["Settings"]["sleep_mode"] == 7.0
+
+
+def test_cpap_sections_and_unparseable_numbers():
+    frame = decode_frame("*,H,4,x,12,1,I,1,2,3,4,5,6,7,87654321C,#")
+    assert frame["machine_type"] == "CPAP"
+    assert frame["sections"]["AutoCPAP"] == {"start_pressure": 4.0, "min_pressure": None,
+                                             "max_pressure": 12.0, "mask_type": 1.0}
+
+
+def test_truncated_section_keeps_what_is_there():
+    frame = decode_frame("*,A,10,#")
+    assert frame["sections"]["CPAP"] == {"set_pressure": 10.0}
+    assert frame["serial_no"] == "10"
+
+
+def test_section_rows_flatten_every_mode():
+    rows = section_rows(decode_frame(SETTINGS))
+    assert {row["mode"] for row in rows} == {"ST", "Settings"}
+    for row in rows:
+        assert set(SECTION_FIELDS) <= set(row)
+        assert row["active"] == (1 if row["mode"] == "ST" else 0)
+    assert section_rows(decode_frame(TELEMETRY)) == []
+    assert section_rows(None) == []
+
+
+def test_not_a_frame():
+    for text in (None, "", "   ", "*,1,2,3,#", 42):
+        assert decode_frame(text) is None
@@ -0,0 +1,57 @@
+import pytest
+
+from db_pool import SQLitePool
+from ingest_writer import BatchedWriter
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "ingest.db"), size=2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE frames (serial_no TEXT NOT NULL, n INTEGER CHECK (n >= 0))")
+    yield pool
+    pool.close()
+
+
+def stored(pool):
+    with pool.connection() as conn:
+        return sorted(n for (n,) in conn.execute("SELECT n FROM frames"))
+
+
+def test_rows_are_written_in_batches_and_acked_after_commit(pool):
+    acked = []
+    writer = BatchedWriter(pool, "INSERT INTO frames (serial_no, n) VALUES (?, ?)", max_batch=100, max_delay=1)
+    for n in range(10):
+        assert writer.submit(("1", n), on_commit=lambda n=n: acked.append(n))
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert stored(pool) == list(range(10))
+    assert sorted(acked) == list(range(10))
+    assert writer.stats()["written"] == 10 and writer.stats()["batches"] == 1
+
+
+def test_a_bad_row_only_loses_itself(pool):
+    acked = []
+    writer = BatchedWriter(pool, "INSERT INTO frames (serial_no, n) VALUES (?, ?)", max_batch=100, max_delay=1)
+    for n in (0, 1, -1, 2, 3):
+        writer.submit(("1", n), on_commit=lambda n=n: acked.append(n))
+    writer.submit((None, 4), on_commit=lambda: acked.append(4))
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert stored(pool) == [0, 1, 2, 3]
+    assert sorted(acked) == [0, 1, 2, 3]
+    stats = writer.stats()
+    assert (stats["written"], stats["errors"]) == (4, 2)
+
+
+def test_write_callback_fans_out_in_one_transaction(pool):
+    def write(conn, rows):
+        conn.executemany("INSERT INTO frames (serial_no, n) VALUES (?, ?)", rows)
+        conn.executemany("INSERT INTO frames (serial_no, n) VALUES (?, ?)", [(s, n + 100) for s, n in rows])
+
+    writer = BatchedWriter(pool, write=write, max_batch=10, max_delay=1)
+    writer.submit(("1", 1))
+    writer.submit(("1", -200))   # its fan-out row is fine, the row itself is not: both roll back
+    assert writer.flush(timeout=5)
+    writer.close()
+    assert stored(pool) == [1, 101]
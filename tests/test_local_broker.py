@@ -0,0 +1,42 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from local_broker import LocalBroker, LocalMqttConnection
+
+
+@pytest.fixture
+def broker_port():
+    loop = asyncio.new_event_loop()
+    broker = LocalBroker()
+    server = loop.run_until_complete(broker.start_server(port=0))
+    port = server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield port
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+
+def test_reconnect_does_not_report_the_old_reader_as_interrupted(broker_port):
+    interrupted = []
+    conn = LocalMqttConnection(port=broker_port, on_connection_interrupted=lambda **kw: interrupted.append(kw))
+    conn.connect().result(timeout=5)
+    old_sock = conn._sock
+    conn.disconnect().result()
+    conn.connect().result(timeout=5)
+    # The old reader finishing only now, after connect() reset the closing flag
+    conn._reader_loop(old_sock)
+    assert interrupted == []
+
+    received = []
+    future, _ = conn.subscribe("esp32/cmd1", callback=lambda topic, payload, **kw: received.append(payload))
+    future.result(timeout=5)
+    conn.publish("esp32/cmd1", "hello")[0].result(timeout=5)
+    deadline = time.time() + 5
+    while not received and time.time() < deadline:
+        time.sleep(0.01)
+    assert received == [b"hello"]
+    conn.disconnect()
@@ -0,0 +1,36 @@
+import json
+
+from metrics import LatencyHistogram, QueueMetrics
+
+
+def test_histogram_percentiles_within_bucket_error():
+    histogram = LatencyHistogram()
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+    assert histogram.count == 1000
+    assert abs(histogram.percentile(0.5) - 0.5) / 0.5 < 0.04
+    assert abs(histogram.percentile(0.99) - 0.99) / 0.99 < 0.04
+    assert histogram.percentile(1.0) == 1.0
+    snapshot = histogram.snapshot()
+    assert snapshot["min_ms"] == 1.0 and snapshot["max_ms"] == 1000.0
+    assert LatencyHistogram().percentile(0.5) == 0.0
+
+
+def test_bucket_bounds_cover_every_value():
+    histogram = LatencyHistogram()
+    for value in (0, 1, 31, 32, 33, 1000, 123456, 10 ** 9):
+        assert histogram._upper(histogram._index(value)) >= value
+
+
+def test_snapshot_and_dump(tmp_path):
+    metrics = QueueMetrics("test")
+    metrics.incr("sent", 3)
+    metrics.gauge("pending", lambda: 7)
+    metrics.gauge("broken", lambda: 1 / 0)
+    path = tmp_path / "metrics.jsonl"
+    metrics.dump(str(path))
+    [line] = path.read_text().splitlines()
+    snapshot = json.loads(line)
+    assert snapshot["queue"] == "test"
+    assert snapshot["counters"]["sent"] == 3
+    assert snapshot["gauges"] == {"pending": 7}
@@ -0,0 +1,89 @@
+import json
+import time
+
+import pytest
+
+from offline_queue import OfflineQueue, _PendingStore
+from transports import InMemoryTransport, Transport
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_pending_store_dedups_and_keeps_order():
+    store = _PendingStore(["a", "b"])
+    assert not store.append("a")
+    assert store.append("c")
+    assert list(store) == ["a", "b", "c"]
+    assert store.remove("b") and not store.remove("b")
+    assert store.popleft() == "a"
+    assert store.head(5) == ["c"] and len(store) == 1
+
+
+def test_pending_store_supersedes_and_expires():
+    dropped = []
+    store = _PendingStore(on_drop=lambda reason, payload: dropped.append((reason, payload)))
+    store.append("old", enqueued_at=1, key="serial:mode")
+    store.append("new", enqueued_at=2, key="serial:mode")
+    assert list(store) == ["new"]
+    assert not store.append("older", enqueued_at=0.5, key="serial:mode")
+    store.append("short", enqueued_at=3, expires_at=10)
+    assert store.expire(now=11) == 1
+    assert list(store) == ["new"]
+    assert dropped == [("superseded", "old"), ("superseded", "older"), ("expired", "short")]
+
+
+def test_drain_acks_everything_and_leaves_nothing_on_disk(tmp_path):
+    holder = []
+    transport = InMemoryTransport(on_publish=lambda payload_str: holder[0].acknowledge())
+    queue_file = str(tmp_path / "queue.json")
+    q = OfflineQueue(queue_file, transport=transport, batch_size=8, ack_timeout=5)
+    holder.append(q)
+    q.put_many([{"serial": "1", "n": n} for n in range(50)])
+    assert q.flush(timeout=10)
+    assert len(transport.sent) == 50
+    assert OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), retry_interval=60).get_pending_count() == 0
+
+
+def test_unacked_payloads_survive_a_restart(tmp_path):
+    queue_file = str(tmp_path / "queue.json")
+    q = OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), batch_size=8, retry_interval=60)
+    q.put_many([{"serial": "1", "n": n} for n in range(3)])
+    wait_for(lambda: q.get_pending_count() == 3)
+    reloaded = OfflineQueue(queue_file, transport=InMemoryTransport(fail_rate=1.0), retry_interval=60)
+    assert sorted(json.loads(p)["n"] for p in reloaded.get_pending()) == [0, 1, 2]
+
+
+def test_journal_is_replayed_on_top_of_the_snapshot(tmp_path):
+    queue_file = tmp_path / "queue.json"
+    queue_file.write_text(json.dumps([{"payload": "a", "enqueued_at": 1}, {"payload": "b", "enqueued_at": 2}]))
+    journal = [
+        {"op": "add", "payload": "c", "enqueued_at": 3, "expires_at": None, "key": None},
+        {"op": "del", "digest": _PendingStore._digest("a").hex()},
+    ]
+    (tmp_path / "queue.json.journal").write_text(
+        "".join(json.dumps(entry) + "\n" for entry in journal) + '{"op": "add", "payl')  # torn last line
+    q = OfflineQueue(str(queue_file), transport=InMemoryTransport(fail_rate=1.0), retry_interval=60)
+    assert q.get_pending() == ["b", "c"]
+    # Loading folds the journal into a fresh snapshot
+    assert [r["payload"] for r in json.loads(queue_file.read_text())] == ["b", "c"]
+    assert (tmp_path / "queue.json.journal").read_text() == ""
+
+
+def test_transport_must_implement_publish():
+    with pytest.raises(TypeError):
+        Transport()
+
+
+def test_default_transport_waits_for_real_acks(tmp_path):
+    q = OfflineQueue(str(tmp_path / "queue.json"), ack_timeout=5)
+    q.put({"serial": "1", "n": 1})
+    wait_for(lambda: q.transport.sent)
+    assert not q.flush(timeout=0.05)
+    q.acknowledge()
+    assert q.flush(timeout=5)
+    assert q.transport.sent == ['{"serial":"1","n":1}']
@@ -0,0 +1,82 @@
+import gzip
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from db_pool import SQLitePool
+from partitions import MonthlyPartitions, PartitionRetention
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(str(tmp_path / "test.db"), size=2)
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def partitions(pool):
+    partitions = MonthlyPartitions("device_data")
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE device_data (id INTEGER PRIMARY KEY AUTOINCREMENT, serial_no TEXT, "
+                     "timestamp DATETIME, device_status INTEGER, device_data TEXT, parsed_data JSON)")
+        partitions.migrate_table(conn)
+    return partitions
+
+
+def insert(pool, partitions, *rows):
+    with pool.connection() as conn:
+        return partitions.insert(conn, [(serial, ts, 1, "*frame#", "{}") for serial, ts in rows])
+
+
+def test_rows_go_to_their_month_and_ids_stay_global(pool, partitions):
+    ids = insert(pool, partitions, ("A", "2025-01-15 10:00:00"), ("A", "2025-02-01 00:00:00"), ("B", "2025-01-20 08:00:00"))
+    assert ids == sorted(ids) and len(set(ids)) == 3
+    with pool.connection() as conn:
+        tables = partitions.tables(conn, start="2025-01-01", end="2025-02-28")
+        assert tables == ["device_data_202501", "device_data_202502"]
+        assert conn.execute("SELECT COUNT(*) FROM device_data_202501").fetchone()[0] == 2
+        assert [r[0] for r in conn.execute("SELECT id FROM device_data ORDER BY id")] == ids
+
+
+def test_expired_keeps_the_last_months(pool, partitions):
+    insert(pool, partitions, ("A", "2025-01-15"), ("A", "2025-05-15"), ("A", "2025-06-15"))
+    retention = PartitionRetention(pool, partitions, "unused", keep_months=2)
+    assert retention.expired(datetime(2025, 6, 20)) == ["device_data_202501"]
+    assert PartitionRetention(pool, partitions, "unused").expired(datetime(2025, 6, 20)) == []
+
+
+def test_archive_dumps_drops_and_runs_on_drop(pool, partitions, tmp_path):
+    ids = insert(pool, partitions, ("A", "2025-01-15 10:00:00"), ("A", "2025-06-15 10:00:00"))
+    seen = []
+
+    def on_drop(conn, table):
+        seen.append((table, [r[0] for r in conn.execute(f"SELECT id FROM {table}")]))
+
+    retention = PartitionRetention(pool, partitions, str(tmp_path / "archive"), keep_months=1, on_drop=on_drop)
+    result = retention.run_once(datetime(2025, 6, 20))
+
+    assert seen == [("device_data_202501", [ids[0]])]
+    [path] = result["archived"]
+    assert os.listdir(tmp_path / "archive") == [os.path.basename(path)]
+    with gzip.open(path, "rt", encoding="utf-8") as archived:
+        assert [json.loads(line)["id"] for line in archived] == [ids[0]]
+    with pool.connection() as conn:
+        assert "device_data_202501" not in partitions.tables(conn)
+        assert [r[0] for r in conn.execute("SELECT id FROM device_data")] == [ids[1]]
+
+
+def test_failing_on_drop_keeps_the_partition_and_publishes_nothing(pool, partitions, tmp_path):
+    insert(pool, partitions, ("A", "2025-01-15 10:00:00"), ("A", "2025-06-15 10:00:00"))
+
+    def on_drop(conn, table):
+        raise RuntimeError("boom")
+
+    retention = PartitionRetention(pool, partitions, str(tmp_path / "archive"), keep_months=1, on_drop=on_drop)
+    assert retention.run_once(datetime(2025, 6, 20))["archived"] == []
+    assert os.listdir(tmp_path / "archive") == []
+    with pool.connection() as conn:
+        assert partitions.tables(conn, end="2025-06-30")[0] == "device_data_202501"
+        assert conn.execute("SELECT COUNT(*) FROM device_data").fetchone()[0] == 2
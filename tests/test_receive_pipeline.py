@@ -0,0 +1,59 @@
+import queue
+import threading
+import time
+
+from receive_pipeline import FrameRouter, ReceivePipeline, frame_key
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_frame_key_is_the_serial():
+    assert frame_key("t", b'{"device_data": "*,141025,1300,1,2,12345678,#"}') == b"12345678"
+    assert frame_key("t", b"*,S,141025,1300,A,10,1,87654321#") == b"87654321"
+    assert frame_key("esp32/ack", b'{"acknowledgment": 1}') == b"esp32/ack"
+
+
+def test_frames_spread_over_workers_and_keep_per_device_order():
+    seen = []
+    lock = threading.Lock()
+
+    def handler(topic, payload):
+        with lock:
+            seen.append((threading.current_thread().name, payload))
+
+    pipeline = ReceivePipeline(handler, workers=4, name="Test")
+    frames = [f"*,{n},{serial},#".encode() for n in range(50) for serial in range(10000001, 10000009)]
+    for payload in frames:
+        pipeline.submit("esp32/data", payload)
+    wait_for(lambda: pipeline.stats()["processed"] == len(frames))
+    pipeline.stop()
+
+    assert len({worker for worker, _ in seen}) > 1
+    for serial in range(10000001, 10000009):
+        tail = f",{serial},#".encode()
+        mine = [p for _, p in seen if p.endswith(tail)]
+        assert mine == [p for p in frames if p.endswith(tail)]
+        assert len({w for w, p in seen if p.endswith(tail)}) == 1
+
+
+def test_router_counts_drops_from_concurrent_offers():
+    blocked = threading.Event()
+    router = FrameRouter(queue.Queue(maxsize=1), [("block", lambda serial, message: blocked.wait())],
+                         serial_of=lambda message: "")
+    rejected = []
+
+    def offer_many():
+        rejected.append(sum(not router.offer({"n": n}) for n in range(2000)))
+
+    threads = [threading.Thread(target=offer_many) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    blocked.set()
+    assert router.stats()["dropped"] == sum(rejected) > 0
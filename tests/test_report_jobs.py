@@ -0,0 +1,98 @@
+import importlib
+import threading
+import time
+
+import pytest
+
+TELEMETRY = "*,141025,141025,{time},1400,1,4,5,8,5,4,2,9,1,8,7,3,9,3,5,2,1,2,3,{serial},#"
+
+
+@pytest.fixture
+def report_jobs(client, monkeypatch):
+    """views.report_jobs with a render that counts calls and can be held or made to fail"""
+    jobs = importlib.import_module("views").report_jobs
+    original = jobs.render
+    control = {"calls": 0, "release": threading.Event(), "error": None}
+    control["release"].set()
+
+    def render(conn, serial_no, max_id, path):
+        control["calls"] += 1
+        assert control["release"].wait(5)
+        if control["error"]:
+            raise control["error"]
+        original(conn, serial_no, max_id, path)
+
+    monkeypatch.setattr(jobs, "render", render)
+    return control
+
+
+def seed(client, serial, count=1, first=0):
+    entries = [{"device_data": TELEMETRY.format(time=f"{n:04d}", serial=serial), "timestamp": f"2025-06-01T00:{n:02d}:00"}
+               for n in range(first, first + count)]
+    assert client.post("/device_data/bulk", json=entries).get_json()["inserted"] == count
+
+
+def finished(client, job_id):
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        body = client.get(f"/export_pdf/jobs/{job_id}").get_json()
+        if body["status"] not in ("queued", "running"):
+            return body
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_goes_from_pending_to_done_and_is_then_served_from_cache(client, report_jobs):
+    serial = "40000001"
+    seed(client, serial, 3)
+    report_jobs["release"].clear()
+    response = client.post(f"/export_pdf/{serial}")
+    assert response.status_code == 202
+    job = response.get_json()
+    assert job["status"] in ("queued", "running") and "download_url" not in job
+    assert client.get(f"/export_pdf/jobs/{job['job_id']}/download").status_code == 202
+    # An identical request joins the running job instead of rendering again
+    assert client.post(f"/export_pdf/{serial}").get_json()["job_id"] == job["job_id"]
+
+    report_jobs["release"].set()
+    done = finished(client, job["job_id"])
+    assert done["status"] == "done" and done["download_url"].endswith("/download")
+    download = client.get(done["download_url"])
+    assert download.status_code == 200 and download.data.startswith(b"%PDF")
+
+    cached = client.get(f"/export_pdf/{serial}")
+    assert cached.status_code == 200 and cached.data == download.data
+    again = client.post(f"/export_pdf/{serial}")
+    assert again.status_code == 200 and again.get_json()["status"] == "done"
+    assert report_jobs["calls"] == 1
+
+    # New rows make the cached report stale
+    seed(client, serial, first=3)
+    stale = client.get(f"/export_pdf/{serial}")
+    assert stale.status_code == 202
+    assert finished(client, stale.get_json()["job_id"])["status"] == "done"
+    assert report_jobs["calls"] == 2
+
+
+def test_failed_render_reports_the_error(client, report_jobs):
+    serial = "40000002"
+    seed(client, serial)
+    report_jobs["error"] = RuntimeError("disk full")
+    job = client.post(f"/export_pdf/{serial}").get_json()
+    failed = finished(client, job["job_id"])
+    assert (failed["status"], failed["error"]) == ("failed", "disk full")
+    assert client.get(f"/export_pdf/jobs/{job['job_id']}/download").status_code == 202
+
+    # A failed job is not cached: the next request renders again
+    report_jobs["error"] = None
+    retry = client.post(f"/export_pdf/{serial}").get_json()
+    assert retry["job_id"] != job["job_id"]
+    assert finished(client, retry["job_id"])["status"] == "done"
+
+
+def test_unknown_job_and_serial_are_404(client, report_jobs):
+    assert client.get("/export_pdf/jobs/no-such-job").status_code == 404
+    assert client.get("/export_pdf/jobs/no-such-job/download").status_code == 404
+    assert client.get("/export_pdf/no-such-serial").status_code == 404
+    assert client.post("/export_pdf/no-such-serial").status_code == 404
+    assert report_jobs["calls"] == 0
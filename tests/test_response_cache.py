@@ -0,0 +1,46 @@
+from response_cache import ResponseCache
+
+
+def put(cache, key, body, tag="t"):
+    return cache.put(key, body, tag, cache.generation(tag))
+
+
+def test_hit_miss_and_stable_etag():
+    cache = ResponseCache()
+    assert cache.get("k") is None
+    entry = put(cache, "k", b"body")
+    assert cache.get("k").body == b"body"
+    assert put(cache, "k2", b"body").etag == entry.etag
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_invalidate_drops_the_tag_and_stale_fills():
+    cache = ResponseCache()
+    put(cache, "a", b"1", tag="settings:x")
+    put(cache, "b", b"2", tag="settings:y")
+    stale = cache.generation("settings:x")
+    cache.invalidate("settings:x")
+    assert cache.get("a") is None and cache.get("b") is not None
+    cache.put("a", b"old", "settings:x", stale)
+    assert cache.get("a") is None
+
+
+def test_clear_discards_fills_started_before_it():
+    cache = ResponseCache()
+    stale = cache.generation("t")
+    cache.clear()
+    cache.put("k", b"old", "t", stale)
+    assert cache.get("k") is None
+
+
+def test_lru_eviction_and_ttl():
+    cache = ResponseCache(max_entries=2)
+    put(cache, "a", b"1")
+    put(cache, "b", b"2")
+    cache.get("a")
+    put(cache, "c", b"3")
+    assert cache.get("b") is None and cache.get("a") is not None
+    assert cache.stats()["evicted"] == 1
+    expired = ResponseCache(ttl=0)
+    put(expired, "k", b"1")
+    assert expired.get("k") is None
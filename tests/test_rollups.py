@@ -0,0 +1,72 @@
+import sqlite3
+
+import pytest
+
+from frame_codec import decode_frame
+from rollups import ROLLUP_SCHEMA, bucket_start, read_fleet_rollups, read_rollups, update_rollups
+
+TELEMETRY = "*,141025,141025,1300,1400,1,4,5,8,5,4,2,9,1,8,7,3,9,3,5,2,1,2,3,{serial},#"
+SETTINGS = "*,S,141025,1300,{mode},A,{pressure},1,I,1,2,3,4,5,6,7,{serial},#"
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    for statement in ROLLUP_SCHEMA:
+        conn.execute(statement)
+    yield conn
+    conn.close()
+
+
+def settings(serial, pressure, mode="MANUALMODE"):
+    return decode_frame(SETTINGS.format(serial=serial, pressure=pressure, mode=mode))
+
+
+def telemetry(serial):
+    return decode_frame(TELEMETRY.format(serial=serial))
+
+
+def test_bucket_start():
+    assert bucket_start("2025-03-04 05:06:07", "hour") == "2025-03-04 05:00:00"
+    assert bucket_start("2025-03-04 05:06:07.123", "day") == "2025-03-04 00:00:00"
+    assert bucket_start("2025-03-04 05:06:07", "month") == "2025-03-01 00:00:00"
+
+
+def test_counts_changes_and_modes(conn):
+    update_rollups(conn, [
+        ("11111111", "2025-03-04 05:00:00", settings("11111111", 10)),
+        ("11111111", "2025-03-04 05:10:00", telemetry("11111111")),
+    ])
+    # Split over two batches: the previous signature comes from rollup_state
+    update_rollups(conn, [
+        ("11111111", "2025-03-04 06:00:00", settings("11111111", 10)),
+        ("11111111", "2025-03-04 07:00:00", settings("11111111", 12)),
+        ("11111111", "2025-03-05 01:00:00", None),
+    ])
+    [day1, day2] = read_rollups(conn, "11111111", "day", "", "9999", 10)
+    assert day1["bucket_start"] == "2025-03-04 00:00:00"
+    assert (day1["frames"], day1["settings_frames"], day1["telemetry_frames"], day1["settings_changes"]) == (4, 3, 1, 1)
+    assert (day1["first_seen"], day1["last_seen"]) == ("2025-03-04 05:00:00", "2025-03-04 07:00:00")
+    assert day1["modes"] == {"CPAP": 4}
+    assert (day2["frames"], day2["settings_changes"], day2["modes"]) == (1, 0, {"CPAP": 1})
+    assert len(read_rollups(conn, "11111111", "hour", "", "9999", 10)) == 4
+    assert [r["bucket_start"] for r in read_rollups(conn, "11111111", "hour", "", "9999", 2)] == \
+        ["2025-03-04 07:00:00", "2025-03-05 01:00:00"]
+
+
+def test_telemetry_before_any_settings_is_unknown_mode(conn):
+    update_rollups(conn, [("22222222", "2025-03-04 05:00:00", telemetry("22222222"))])
+    [day] = read_rollups(conn, "22222222", "day", "", "9999", 10)
+    assert day["modes"] == {"unknown": 1}
+
+
+def test_fleet_totals(conn):
+    update_rollups(conn, [
+        ("11111111", "2025-03-04 05:00:00", settings("11111111", 10)),
+        ("11111111", "2025-03-04 06:00:00", settings("11111111", 11)),
+        ("22222222", "2025-03-04 05:00:00", telemetry("22222222")),
+    ])
+    [day] = read_fleet_rollups(conn, "day", "2025-03-04 12:00:00", "2025-03-05", 10)
+    assert (day["active_devices"], day["changed_devices"], day["frames"], day["settings_changes"]) == (2, 1, 3, 1)
+    assert day["modes"] == {"CPAP": 2, "unknown": 1}
+    assert read_fleet_rollups(conn, "day", "2025-03-05", "2025-03-06", 10) == []
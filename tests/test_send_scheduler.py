@@ -0,0 +1,70 @@
+import queue
+
+import pytest
+
+from send_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, PRIORITY_REPLAY, PrioritySendQueue
+
+
+def drain(q):
+    out = []
+    while True:
+        try:
+            out.append(q.get_nowait())
+        except queue.Empty:
+            return out
+
+
+def test_interactive_goes_first():
+    q = PrioritySendQueue()
+    q.put("r", PRIORITY_REPLAY)
+    q.put("b", PRIORITY_BULK)
+    q.put("i", PRIORITY_INTERACTIVE)
+    assert q.get_nowait() == (PRIORITY_INTERACTIVE, "i")
+
+
+def test_weighted_round_robin_between_bulk_and_replay():
+    q = PrioritySendQueue(weights={PRIORITY_INTERACTIVE: 8, PRIORITY_BULK: 3, PRIORITY_REPLAY: 1},
+                          max_wait={})
+    for n in range(8):
+        q.put(n, PRIORITY_BULK)
+        q.put(n, PRIORITY_REPLAY)
+    lanes = [lane for lane, _ in drain(q)[:8]]
+    assert lanes.count(PRIORITY_BULK) == 6 and lanes.count(PRIORITY_REPLAY) == 2
+
+
+def test_overdue_lane_is_served_before_interactive():
+    q = PrioritySendQueue(max_wait={PRIORITY_REPLAY: 0.001})
+    q.put("r", PRIORITY_REPLAY)
+    q._lanes[PRIORITY_REPLAY][0] = (0.0, "r")  # enqueued long ago
+    q.put("i", PRIORITY_INTERACTIVE)
+    assert q.get_nowait() == (PRIORITY_REPLAY, "r")
+
+
+def test_put_front_discard_and_depths():
+    q = PrioritySendQueue()
+    q.put("a", PRIORITY_REPLAY)
+    q.put_front("z", PRIORITY_REPLAY)
+    assert q.depths()[PRIORITY_REPLAY] == 2 and q.has_pending(PRIORITY_REPLAY)
+    assert q.get_nowait() == (PRIORITY_REPLAY, "z")
+    assert q.discard(PRIORITY_REPLAY) == 1
+    assert q.empty()
+
+
+def test_get_times_out_and_rejects_unknown_lanes():
+    q = PrioritySendQueue()
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+    with pytest.raises(ValueError):
+        q.put("x", "urgent")
+
+
+def test_put_front_keeps_the_age_of_a_preempted_item():
+    q = PrioritySendQueue(max_wait={PRIORITY_REPLAY: 30.0})
+    q.put("r", PRIORITY_REPLAY)
+    q._lanes[PRIORITY_REPLAY][0] = (0.0, "r")  # enqueued long ago
+    priority, item, enqueued_at = q.get_entry_nowait()
+    assert (priority, item, enqueued_at) == (PRIORITY_REPLAY, "r", 0.0)
+    q.put_front(item, priority, enqueued_at)
+    q.put("i", PRIORITY_INTERACTIVE)
+    # Still overdue, so it is not parked behind the new interactive send
+    assert q.get_nowait() == (PRIORITY_REPLAY, "r")
@@ -0,0 +1,42 @@
+from serial_index import SerialIndex, normalize_serial
+
+
+def test_normalize_strips_the_machine_type_suffix():
+    assert normalize_serial("12345678B") == "12345678"
+    assert normalize_serial(" 12345678C ") == "12345678"
+    assert normalize_serial("ABCB") == "ABCB"
+    assert normalize_serial("") == ""
+
+
+def test_prefix_then_substring_then_one_edit_away():
+    index = SerialIndex()
+    for serial in ("12345678", "12349999", "99123456", "12345679"):
+        index.add(serial, seen_at=0)
+    assert index.suggest("1234", limit=3, now=0)[:3] == ["12345678", "12345679", "12349999"]
+    assert index.suggest("23456", now=0) == ["12345678", "12345679", "99123456"]
+    assert index.suggest("1235678", now=0) == ["12345678"]
+
+
+def test_substring_tier_matches_a_full_scan():
+    index = SerialIndex()
+    serials = [f"{n * 7919 % 10 ** 8:08d}" for n in range(2000)]
+    for serial in serials:
+        index.add(serial, seen_at=0)
+    for query in ("7", "79", "919", "7919", "0007919"):
+        assert index._containing(query) == {s for s in serials if query in s}
+
+
+def test_frecency_ranks_used_and_recent_serials_first():
+    index = SerialIndex(half_life_days=1)
+    index.add("11110000", seen_at=0)
+    index.add("11112222", seen_at=0, count=50)
+    index.add("11113333", seen_at=10 * 86400)
+    assert index.suggest("1111", now=10 * 86400) == ["11112222", "11113333", "11110000"]
+    assert index.most_used(1, now=10 * 86400) == ["11112222"]
+
+
+def test_type_suffix_variants_share_one_key():
+    index = SerialIndex()
+    index.add("12345678B")
+    index.add("12345678C")
+    assert len(index) == 1 and "12345678" in index
@@ -0,0 +1,13 @@
+USER = {"name": "Asha", "contact": "555-0100", "address": "1 Main St", "password": "s3cret",
+        "email": "asha@example.com", "serial_no": "30000001"}
+
+
+def test_user_endpoints_never_return_the_password_hash(client):
+    assert client.post("/register", json=USER).status_code == 201
+    profile = {k: v for k, v in USER.items() if k != "password"}
+    for _ in range(2):  # the second round is served from the response cache
+        by_email = client.get(f"/user/{USER['email']}")
+        by_serial = client.get(f"/user/serial/{USER['serial_no']}")
+        assert by_email.status_code == by_serial.status_code == 200
+        assert by_email.get_json() == by_serial.get_json() == profile
+    assert client.post("/login", json={"email": USER["email"], "password": USER["password"]}).status_code == 200
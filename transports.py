@@ -0,0 +1,187 @@
+
+import asyncio
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, List, Optional
+
+
+class Transport(ABC):
+    """
+    How OfflineQueue moves serialized payloads towards the device.
+
+    publish() returns True once the broker/server accepted the payload; the
+    device ACK still arrives separately via OfflineQueue.acknowledge().
+    publish_batch() sends several payloads in one round trip where the
+    underlying protocol allows it and returns one result per payload.
+    publish_batch_async() is the awaitable form used by AsyncOfflineQueue;
+    the default runs the blocking publish_batch() in the loop's default
+    executor so a slow round trip never stalls the event loop.
+    """
+
+    @abstractmethod
+    def publish(self, payload_str: str) -> bool:
+        ...
+
+    def publish_batch(self, payload_strs: List[str]) -> List[bool]:
+        return [self.publish(p) for p in payload_strs]
+
+    async def publish_batch_async(self, payload_strs: List[str]) -> List[bool]:
+        return await asyncio.get_running_loop().run_in_executor(None, self.publish_batch, payload_strs)
+
+    def close(self):
+        pass
+
+
+class MqttTransport(Transport):
+    """Publishes on an awscrt mqtt.Connection (or a LocalMqttConnection)"""
+
+    def __init__(self, connection, topic: str, qos=None, timeout: float = 10.0):
+        self.connection = connection
+        self.topic = topic
+        self.timeout = timeout
+        if qos is None:
+            try:
+                from awscrt import mqtt
+                qos = mqtt.QoS.AT_LEAST_ONCE
+            except ImportError:
+                qos = 1
+        self.qos = qos
+
+    def publish(self, payload_str: str) -> bool:
+        return self.publish_batch([payload_str])[0]
+
+    def publish_batch(self, payload_strs: List[str]) -> List[bool]:
+        # Pipeline every PUBLISH first, then wait for the PUBACKs together
+        futures = self._publish_all(payload_strs)
+        deadline = time.monotonic() + self.timeout
+        results = []
+        for future in futures:
+            try:
+                future.result(timeout=max(0.0, deadline - time.monotonic()))
+                results.append(True)
+            except Exception as e:
+                if future is not None:
+                    print(f"[MqttTransport] Publish not confirmed: {e}")
+                results.append(False)
+        return results
+
+    async def publish_batch_async(self, payload_strs: List[str]) -> List[bool]:
+        # PUBACK futures are concurrent.futures completed by the awscrt thread
+        futures = [asyncio.wrap_future(f) if f is not None else None for f in self._publish_all(payload_strs)]
+        pending = [f for f in futures if f is not None]
+        if pending:
+            await asyncio.wait(pending, timeout=self.timeout)
+        results = []
+        for future in futures:
+            ok = future is not None and future.done() and not future.cancelled() and future.exception() is None
+            if future is not None and not ok:
+                print("[MqttTransport] Publish not confirmed")
+                if not future.done():
+                    future.cancel()
+            results.append(ok)
+        return results
+
+    def _publish_all(self, payload_strs: List[str]) -> list:
+        futures = []
+        for payload_str in payload_strs:
+            try:
+                future, _ = self.connection.publish(
+                    topic=self.topic,
+                    payload=payload_str.encode('utf-8'),
+                    qos=self.qos
+                )
+                futures.append(future)
+            except Exception as e:
+                print(f"[MqttTransport] Publish failed: {e}")
+                futures.append(None)
+        return futures
+
+
+class HttpTransport(Transport):
+    """POSTs payloads to an HTTP endpoint; batches go to batch_url as one JSON array"""
+
+    def __init__(self, url: str, batch_url: Optional[str] = None, timeout: float = 10.0, session=None):
+        import requests
+        self.url = url
+        self.batch_url = batch_url
+        self.timeout = timeout
+        self.session = session or requests.Session()
+
+    def publish(self, payload_str: str) -> bool:
+        try:
+            response = self.session.post(
+                self.url,
+                data=payload_str.encode('utf-8'),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            return response.ok
+        except Exception as e:
+            print(f"[HttpTransport] POST failed: {e}")
+            return False
+
+    def publish_batch(self, payload_strs: List[str]) -> List[bool]:
+        if not self.batch_url or len(payload_strs) == 1:
+            return super().publish_batch(payload_strs)
+        body = "[" + ",".join(payload_strs) + "]"
+        try:
+            response = self.session.post(
+                self.batch_url,
+                data=body.encode('utf-8'),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            return [response.ok] * len(payload_strs)
+        except Exception as e:
+            print(f"[HttpTransport] Batch POST failed: {e}")
+            return [False] * len(payload_strs)
+
+    def close(self):
+        self.session.close()
+
+
+class InMemoryTransport(Transport):
+    """
+    Fake transport for tests and benchmarks. Records every accepted payload,
+    fails with probability fail_rate, and calls on_publish(payload_str) for
+    each accepted payload (e.g. to ACK it straight back into the queue).
+    """
+
+    def __init__(
+        self,
+        fail_rate: float = 0.0,
+        latency: float = 0.0,
+        on_publish: Optional[Callable[[str], None]] = None
+    ):
+        self.fail_rate = fail_rate
+        self.latency = latency
+        self.on_publish = on_publish
+        self.sent: List[str] = []
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def publish(self, payload_str: str) -> bool:
+        return self.publish_batch([payload_str])[0]
+
+    def publish_batch(self, payload_strs: List[str]) -> List[bool]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._deliver(payload_strs)
+
+    async def publish_batch_async(self, payload_strs: List[str]) -> List[bool]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._deliver(payload_strs)
+
+    def _deliver(self, payload_strs: List[str]) -> List[bool]:
+        results = [random.random() >= self.fail_rate for _ in payload_strs]
+        with self._lock:
+            self.round_trips += 1
+            self.sent.extend(p for p, ok in zip(payload_strs, results) if ok)
+        if self.on_publish:
+            for payload_str, ok in zip(payload_strs, results):
+                if ok:
+                    self.on_publish(payload_str)
+        return results
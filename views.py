@@ -1,19 +1,30 @@
 import os
 import json
+import base64
 import time
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import partial, wraps
 from concurrent.futures import Future
 from threading import Thread
-from flask import Flask, request, jsonify, send_file
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Response, request, jsonify, send_file
 from awscrt import io, mqtt, auth, http
 from awsiot import mqtt_connection_builder
 import io as python_io  
 import csv
-from fpdf import FPDF
-
-from mqtt import get_db_connection  
+from local_broker import local_connection_from_env
+from db_pool import SQLitePool
+from ingest_writer import BatchedWriter
+from migrations import check_query_plans, migrate
+from report_jobs import ReportJobs
+from response_cache import ResponseCache
+from credentials import HasherBusy, PasswordHasher, SessionTokens
+from partitions import MonthlyPartitions, PartitionRetention
+from frame_codec import SECTION_FIELDS, decode_frame, section_rows
+from rollups import (
+    BUCKETS, ROLLUP_SCHEMA, SQL_FLEET_ROLLUPS, SQL_SERIAL_ROLLUPS,
+    read_fleet_rollups, read_rollups, rebuild_rollups, update_rollups
+)
 
 #---------- Configuration ----------
 app = Flask(__name__)
@@ -31,17 +42,187 @@ ACK_TOPIC = "esp32/data"
 
 # Database Configuration
 DB_FILE = "bipap_backend.db"
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+
+# Connections are opened once (WAL, synchronous=NORMAL, mmap/cache pragmas) and reused
+db_pool = SQLitePool(DB_FILE, size=DB_POOL_SIZE)
+
+# Serialized JSON of hot GET endpoints; entries are dropped on the writes that change them
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "30"))
+)
+
+# PBKDF2 runs on a bounded pool, not the request thread; later calls authenticate with a signed token
+password_hasher = PasswordHasher(
+    workers=int(os.environ.get("HASH_WORKERS", "4")),
+    max_pending=int(os.environ.get("HASH_MAX_PENDING", "64"))
+)
+session_tokens = SessionTokens(
+    os.environ.get("SESSION_SECRET"),
+    ttl=float(os.environ.get("SESSION_TTL", str(12 * 3600)))
+)
+# When set, per-user endpoints reject requests without a session token (otherwise tokens are optional)
+REQUIRE_SESSION = os.environ.get("REQUIRE_SESSION", "0") == "1"
 
 # Global variables for IoT
 is_connected = False
 mqtt_connection = None
 
 # ---------- Database Setup ----------
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    # Users table
-    c.execute('''
+class DatabaseUnavailable(Exception):
+    """No pooled connection within the pool timeout (or the database could not be opened)"""
+
+def get_db_connection():
+    """Pooled connection (conn.close() returns it to the pool); raises DatabaseUnavailable on error"""
+    try:
+        return db_pool.acquire()
+    except sqlite3.Error as e:
+        print(f"Database connection failed: {e}")
+        raise DatabaseUnavailable(str(e)) from e
+
+# device_data is a view over one table per month (device_data_YYYYMM); hot paths go to the partitions
+device_partitions = MonthlyPartitions("device_data")
+# Partitions older than RETENTION_MONTHS are archived to ARCHIVE_DIR (0 keeps everything)
+RETENTION_MONTHS = int(os.environ.get("RETENTION_MONTHS", "0"))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "device_data_archive")
+
+# Typed copy of every settings section in a frame (one row per device_data row and mode)
+CREATE_FRAME_SETTINGS_SQL = '''
+    CREATE TABLE IF NOT EXISTS frame_settings (
+        data_id INTEGER NOT NULL REFERENCES device_data(id),
+        serial_no TEXT NOT NULL,
+        timestamp DATETIME NOT NULL,
+        machine_type TEXT,
+        mode TEXT NOT NULL,
+        active INTEGER NOT NULL DEFAULT 0,
+        {columns},
+        PRIMARY KEY (data_id, mode)
+    )
+'''.format(columns=",\n        ".join(f"{field} REAL" for field in SECTION_FIELDS))
+INSERT_FRAME_SETTINGS_SQL = '''
+    INSERT OR REPLACE INTO frame_settings (data_id, serial_no, timestamp, machine_type, mode, active, {columns})
+    VALUES (?, ?, ?, ?, ?, ?, {marks})
+'''.format(columns=", ".join(SECTION_FIELDS), marks=", ".join("?" for _ in SECTION_FIELDS))
+
+def frame_settings_params(data_id, serial_no, timestamp, frame):
+    machine_type = frame.get("machine_type") if frame else None
+    return [
+        (data_id, serial_no, timestamp, machine_type, row["mode"], row["active"], *[row[f] for f in SECTION_FIELDS])
+        for row in section_rows(frame)
+    ]
+
+def backfill_frame_settings(conn):
+    """Decode frames captured before frame_settings existed"""
+    cursor = conn.execute("SELECT id, serial_no, timestamp, device_data FROM device_data")
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        params = []
+        for data_id, serial_no, timestamp, device_data in rows:
+            params += frame_settings_params(data_id, serial_no, timestamp, decode_frame(device_data))
+        conn.executemany(INSERT_FRAME_SETTINGS_SQL, params)
+
+# Newest decoded settings (and last contact) per serial; read with one primary-key lookup
+CREATE_DEVICE_LATEST_SQL = '''
+    CREATE TABLE IF NOT EXISTS device_latest (
+        serial_no TEXT PRIMARY KEY,
+        data_id INTEGER,
+        settings_at TEXT,
+        machine_type TEXT,
+        active_mode TEXT,
+        frame_json TEXT,
+        device_data TEXT,
+        last_seen TEXT,
+        device_status INTEGER
+    )
+'''
+# Both upserts only move forward in time, so a late batch cannot overwrite newer state
+UPSERT_LATEST_SETTINGS_SQL = '''
+    INSERT INTO device_latest (serial_no, data_id, settings_at, machine_type, active_mode, frame_json, device_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (serial_no) DO UPDATE SET
+        data_id = excluded.data_id,
+        settings_at = excluded.settings_at,
+        machine_type = excluded.machine_type,
+        active_mode = excluded.active_mode,
+        frame_json = excluded.frame_json,
+        device_data = excluded.device_data
+    WHERE device_latest.settings_at IS NULL OR excluded.settings_at >= device_latest.settings_at
+'''
+UPSERT_LATEST_SEEN_SQL = '''
+    INSERT INTO device_latest (serial_no, last_seen, device_status) VALUES (?, ?, ?)
+    ON CONFLICT (serial_no) DO UPDATE SET
+        last_seen = excluded.last_seen,
+        device_status = excluded.device_status
+    WHERE device_latest.last_seen IS NULL OR excluded.last_seen >= device_latest.last_seen
+'''
+# max_id: no row of the serial has a larger id, and it grows whenever the serial's rows change,
+# so report_jobs can key cached PDFs off it with one primary-key lookup
+UPSERT_LATEST_MAX_ID_SQL = '''
+    INSERT INTO device_latest (serial_no, max_id) VALUES (?, ?)
+    ON CONFLICT (serial_no) DO UPDATE SET max_id = MAX(COALESCE(device_latest.max_id, 0), excluded.max_id)
+'''
+
+def latest_settings_params(data_id, serial_no, timestamp, device_data, frame):
+    return (serial_no, data_id, str(timestamp)[:19], frame.get("machine_type"), frame.get("active_mode"),
+            json.dumps(frame), device_data)
+
+def backfill_device_latest(conn):
+    """Seed device_latest from the newest settings frame and newest row of every serial"""
+    # With MAX() the bare columns come from the row holding the maximum (SQLite guarantees this)
+    rows = conn.execute('''
+        SELECT d.id, d.serial_no, d.timestamp, d.device_data
+        FROM device_data d JOIN (
+            SELECT data_id, MAX(timestamp) FROM frame_settings GROUP BY serial_no
+        ) f ON d.id = f.data_id
+    ''').fetchall()
+    params = []
+    for data_id, serial_no, timestamp, device_data in rows:
+        frame = decode_frame(device_data)
+        if frame:
+            params.append(latest_settings_params(data_id, serial_no, timestamp, device_data, frame))
+    conn.executemany(UPSERT_LATEST_SETTINGS_SQL, params)
+    conn.executemany(UPSERT_LATEST_SEEN_SQL, [
+        (serial_no, str(timestamp)[:19], device_status)
+        for serial_no, timestamp, device_status in conn.execute(
+            "SELECT serial_no, MAX(timestamp), device_status FROM device_data GROUP BY serial_no"
+        )
+    ])
+
+def prune_archived_partition(conn, table):
+    """
+    PartitionRetention on_drop hook, inside the transaction that drops table: remove the
+    frame_settings rows of its frames and keep device_latest pointing at stored rows only
+    """
+    conn.execute(f"DELETE FROM frame_settings WHERE data_id IN (SELECT id FROM {table})")
+    # Newer partitions hold no settings frame of these serials, or it would be the latest one
+    conn.execute(f'''
+        UPDATE device_latest SET data_id = NULL, settings_at = NULL, machine_type = NULL,
+            active_mode = NULL, frame_json = NULL, device_data = NULL
+        WHERE data_id IN (SELECT id FROM {table})
+    ''')
+    remaining = [t for t in device_partitions.tables(conn) if t != table]
+    gone, changed = [], []
+    for (serial_no,) in conn.execute(f"SELECT DISTINCT serial_no FROM {table}").fetchall():
+        if any(conn.execute(f"SELECT 1 FROM {t} WHERE serial_no = ? LIMIT 1", (serial_no,)).fetchone()
+               for t in remaining):
+            changed.append((serial_no,))
+        else:
+            gone.append((serial_no,))
+    conn.executemany("DELETE FROM device_latest WHERE serial_no = ?", gone)
+    if changed:
+        # The serials' rows changed, so max_id must grow: take a fresh id from the shared sequence
+        conn.execute(f"UPDATE {device_partitions.sequence} SET next_id = next_id + 1")
+        max_id = conn.execute(f"SELECT next_id - 1 FROM {device_partitions.sequence}").fetchone()[0]
+        conn.executemany(UPSERT_LATEST_MAX_ID_SQL, [(serial_no, max_id) for (serial_no,) in changed])
+
+# Schema history: append new (version, description, statements) entries, never edit old ones
+SCHEMA_MIGRATIONS = [
+    (1, "base tables", [
+        # Users table
+        '''
         CREATE TABLE IF NOT EXISTS users (
             email TEXT PRIMARY KEY,
             name TEXT NOT NULL,
@@ -50,17 +231,17 @@ def init_db():
             password TEXT NOT NULL,
             serial_no TEXT NOT NULL
         )
-    ''')
-    # Settings table (per user, JSON blob for flexibility)
-    c.execute('''
+        ''',
+        # Settings table (per user, JSON blob for flexibility)
+        '''
         CREATE TABLE IF NOT EXISTS settings (
             email TEXT PRIMARY KEY,
             settings_json TEXT NOT NULL,
             FOREIGN KEY (email) REFERENCES users(email)
         )
-    ''')
-    # Device data table (captured from IoT)
-    c.execute('''
+        ''',
+        # Device data table (captured from IoT)
+        '''
         CREATE TABLE IF NOT EXISTS device_data (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             serial_no TEXT NOT NULL,
@@ -69,12 +250,157 @@ def init_db():
             device_data TEXT,
             parsed_data JSON
         )
-    ''')
-    conn.commit()
-    conn.close()
+        ''',
+    ]),
+    (2, "serial lookup indexes", [
+        # Serves WHERE serial_no = ? ORDER BY timestamp [DESC] LIMIT ? without a sort
+        "CREATE INDEX IF NOT EXISTS idx_device_data_serial_ts ON device_data (serial_no, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_users_serial ON users (serial_no)",
+        "ANALYZE",
+    ]),
+    (3, "typed frame_settings table", [
+        CREATE_FRAME_SETTINGS_SQL,
+        "CREATE INDEX IF NOT EXISTS idx_frame_settings_mode_ipap ON frame_settings (mode, ipap)",
+        "CREATE INDEX IF NOT EXISTS idx_frame_settings_serial_ts ON frame_settings (serial_no, timestamp)",
+    ]),
+    (4, "backfill frame_settings", backfill_frame_settings),
+    (5, "hourly/daily/monthly rollup tables", ROLLUP_SCHEMA),
+    (6, "backfill rollups", rebuild_rollups),
+    (7, "device_latest table", [CREATE_DEVICE_LATEST_SQL]),
+    (8, "backfill device_latest", backfill_device_latest),
+    (9, "monthly device_data partitions", device_partitions.migrate_table),
+    (10, "device_latest.max_id", ["ALTER TABLE device_latest ADD COLUMN max_id INTEGER"]),
+    (11, "backfill device_latest.max_id", [
+        # WHERE true: lets SQLite parse the upsert clause after a SELECT
+        '''
+        INSERT INTO device_latest (serial_no, max_id)
+        SELECT serial_no, MAX(id) FROM device_data WHERE true GROUP BY serial_no
+        ON CONFLICT (serial_no) DO UPDATE SET max_id = excluded.max_id
+        ''',
+    ]),
+]
+
+# Hot queries, shared by the handlers and the startup plan check
+SQL_USER_BY_EMAIL = "SELECT * FROM users WHERE email = ?"
+# What the user endpoints return (and cache): never the password hash
+USER_PROFILE_COLUMNS = "email, name, contact, address, serial_no"
+SQL_USER_PROFILE_BY_EMAIL = f"SELECT {USER_PROFILE_COLUMNS} FROM users WHERE email = ?"
+SQL_USER_PROFILE_BY_SERIAL = f"SELECT {USER_PROFILE_COLUMNS} FROM users WHERE serial_no = ?"
+SQL_SETTINGS_BY_EMAIL = "SELECT settings_json FROM settings WHERE email = ?"
+SQL_DEVICE_LATEST = '''
+    SELECT data_id, settings_at, machine_type, active_mode, frame_json, device_data, last_seen, device_status
+    FROM device_latest WHERE serial_no = ?
+'''
+# Every serial that ever sent a frame, keyset-paged by serial
+SQL_DEVICE_SERIALS = "SELECT serial_no, last_seen FROM device_latest WHERE serial_no > ? ORDER BY serial_no LIMIT ?"
+MAX_DEVICE_SERIALS_PAGE = 5000
+# Keyset pages over (timestamp, id): newest first before a cursor, or oldest first after one
+# {table} is a monthly partition; handlers walk device_partitions.tables() until the page is full
+SQL_DEVICE_DATA_PAGE = '''
+    SELECT {columns} FROM {table}
+    WHERE serial_no = ? AND (timestamp, id) < (?, ?)
+    ORDER BY timestamp DESC, id DESC LIMIT ?
+'''
+SQL_DEVICE_DATA_SINCE = '''
+    SELECT {columns} FROM {table}
+    WHERE serial_no = ? AND (timestamp, id) > (?, ?)
+    ORDER BY timestamp, id LIMIT ?
+'''
+DEVICE_DATA_FIELDS = ("id", "timestamp", "device_status", "device_data", "parsed_data")
+DEFAULT_DEVICE_DATA_FIELDS = ("timestamp", "device_status", "device_data", "parsed_data")
+MAX_PAGE_SIZE = 1000
+# e.g. every device whose S-mode IPAP was ever set above 20
+SQL_SERIALS_BY_MODE_IPAP = "SELECT DISTINCT serial_no FROM frame_settings WHERE mode = ? AND ipap > ?"
+# Time window bounds default to EXPORT_MIN_TS / EXPORT_MAX_TS (i.e. everything)
+# Read in keyset pages after (timestamp, id), so no read transaction outlives one page
+SQL_EXPORT_DEVICE_DATA = '''
+    SELECT * FROM {table}
+    WHERE serial_no = ? AND (timestamp, id) > (?, ?) AND timestamp < ?
+    ORDER BY timestamp, id LIMIT ?
+'''
+EXPORT_MIN_TS = ""
+EXPORT_MAX_TS = "9999-12-31 23:59:59"  # must not look numeric: timestamp has NUMERIC affinity
+EXPORT_CHUNK_ROWS = 1000
+
+# Plans are checked against the current month's partition; the others share its schema
+HOT_PARTITION = device_partitions.table_for(datetime.now())
+HOT_QUERIES = {
+    "user_by_email": (SQL_USER_BY_EMAIL, ("",)),
+    "user_profile_by_email": (SQL_USER_PROFILE_BY_EMAIL, ("",)),
+    "user_by_serial": (SQL_USER_PROFILE_BY_SERIAL, ("",)),
+    "settings_by_email": (SQL_SETTINGS_BY_EMAIL, ("",)),
+    "device_latest": (SQL_DEVICE_LATEST, ("",)),
+    "device_serials": (SQL_DEVICE_SERIALS, ("", 10)),
+    "device_data_page": (SQL_DEVICE_DATA_PAGE.format(columns="*", table=HOT_PARTITION), ("", EXPORT_MAX_TS, 0, 10)),
+    "device_data_since": (SQL_DEVICE_DATA_SINCE.format(columns="*", table=HOT_PARTITION), ("", EXPORT_MIN_TS, 0, 10)),
+    "export_device_data": (SQL_EXPORT_DEVICE_DATA.format(table=HOT_PARTITION), ("", EXPORT_MIN_TS, 0, EXPORT_MAX_TS, 10)),
+    "serials_by_mode_ipap": (SQL_SERIALS_BY_MODE_IPAP, ("S", 20)),
+    "serial_rollups": (SQL_SERIAL_ROLLUPS, ("", "day", EXPORT_MIN_TS, EXPORT_MAX_TS, 10)),
+    "fleet_rollups": (SQL_FLEET_ROLLUPS, ("day", EXPORT_MIN_TS, EXPORT_MAX_TS, 10)),
+}
+MAX_STATS_BUCKETS = 1000
+
+def init_db():
+    conn = get_db_connection()
+    try:
+        version = migrate(conn, SCHEMA_MIGRATIONS)
+        print(f"Database schema at version {version}")
+        if device_partitions.ensure(conn, HOT_PARTITION):
+            conn.commit()
+        # Refuse to start if a hot query would scan a whole table
+        check_query_plans(conn, HOT_QUERIES)
+    finally:
+        conn.close()
 
 init_db()
 
+partition_retention = PartitionRetention(
+    db_pool,
+    device_partitions,
+    ARCHIVE_DIR,
+    keep_months=RETENTION_MONTHS,
+    interval=float(os.environ.get("RETENTION_INTERVAL", str(24 * 3600))),
+    on_drop=prune_archived_partition
+)
+partition_retention.start()
+
+# Device frames are written in batches (one transaction per batch) off the MQTT callback thread
+def write_device_frames(conn, rows):
+    """
+    BatchedWriter callback: raw frame into its monthly device_data partition, its decoded
+    sections into frame_settings and device_latest, and the batch folded into the rollup tables
+    """
+    data_ids = device_partitions.insert(conn, [row[:5] for row in rows])
+    latest_settings = {}
+    latest_seen = {}
+    max_ids = {}
+    for data_id, row in zip(data_ids, rows):
+        max_ids[row[0]] = max(max_ids.get(row[0], 0), data_id)
+        frame = row[5]
+        if not frame or frame["kind"] != "settings":
+            continue
+        conn.executemany(INSERT_FRAME_SETTINGS_SQL, frame_settings_params(data_id, row[0], row[1], frame))
+        params = latest_settings_params(data_id, row[0], row[1], row[3], frame)
+        if row[0] not in latest_settings or params[2] >= latest_settings[row[0]][2]:
+            latest_settings[row[0]] = params
+    # Newest timestamp per serial wins, also within a batch
+    for row in rows:
+        seen = (row[0], str(row[1])[:19], row[2])
+        if row[0] not in latest_seen or seen[1] >= latest_seen[row[0]][1]:
+            latest_seen[row[0]] = seen
+    conn.executemany(UPSERT_LATEST_SETTINGS_SQL, list(latest_settings.values()))
+    conn.executemany(UPSERT_LATEST_SEEN_SQL, list(latest_seen.values()))
+    conn.executemany(UPSERT_LATEST_MAX_ID_SQL, list(max_ids.items()))
+    update_rollups(conn, [(row[0], row[1], row[5]) for row in rows])
+
+device_data_writer = BatchedWriter(
+    db_pool,
+    write=write_device_frames,
+    max_batch=int(os.environ.get("INGEST_MAX_BATCH", "500")),
+    max_delay=float(os.environ.get("INGEST_MAX_DELAY", "0.05")),
+    name="DeviceDataWriter"
+)
+
 def fetch_new_user_data(email):
     """
     Try to fetch user row from the local database and return it as a dict,
@@ -82,10 +408,8 @@ def fetch_new_user_data(email):
     """
     try:
         conn = get_db_connection()
-        if not conn:
-            return None
         cursor = conn.cursor()
-        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+        cursor.execute(SQL_USER_PROFILE_BY_EMAIL, (email,))
         row = cursor.fetchone()
         if not row:
             return None
@@ -110,48 +434,33 @@ def on_message_received(topic, payload, dup, qos, retain, **kwargs):
         # Extract data
         device_status = message.get("device_status")
         device_data = message.get("device_data")
-        serial_no = None
-        parsed_data = {}
-        
-        # Parse device_data if present (based on sample: "*,141025,141025,1300,1400,1,1,5,8,5,4,2,9,1,8,12345678,#")
-        if device_data:
-            parts = device_data.strip("*,#").split(",")
-            if len(parts) >= 16:  
-                
-                parsed_data = {
-                    "field1": parts[0], 
-                    "field2": parts[1],  
-                    "field3": parts[2],  
-                    "field4": parts[3],  
-                    "serial_no": parts[-1]  
-                }
-                serial_no = parsed_data["serial_no"]
+        # Telemetry ("*,141025,141025,1300,1400,1,1,5,8,5,4,2,9,1,8,12345678,#") or a settings frame
+        frame = decode_frame(device_data)
+        serial_no = frame["serial_no"] if frame else None
         
         if not serial_no:
             print("No serial_no found in data. Skipping save.")
             return
         
-        # Save to DB
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO device_data (serial_no, timestamp, device_status, device_data, parsed_data)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (serial_no, datetime.now(), device_status, device_data, json.dumps(parsed_data)))
-        conn.commit()
-        conn.close()
-        
-        print(f"Data captured and saved for serial_no: {serial_no}")
-        
-        # Optionally send ACK
-        if mqtt_connection and is_connected:
-            ack_message = {"acknowledgment": 1}
-            mqtt_connection.publish(topic=ACK_TOPIC, payload=json.dumps(ack_message), qos=mqtt.QoS.AT_LEAST_ONCE)
-            print("ACK sent.")
+        # Save to DB; the ACK goes out only once the batch holding this row has committed
+        row = (serial_no, datetime.now(), device_status, device_data, json.dumps(frame), frame)
+        if device_data_writer.submit(row, on_commit=partial(frame_committed, serial_no)):
+            print(f"Data captured and queued for serial_no: {serial_no}")
+        else:
+            print(f"Ingest queue full, frame for serial_no {serial_no} not saved")
         
     except Exception as e:
         print(f"Error processing captured message: {e}")
 
+def frame_committed(serial_no):
+    response_cache.invalidate(f"device_data:{serial_no}")
+    send_ack()
+
+def send_ack():
+    if mqtt_connection and is_connected:
+        ack_message = {"acknowledgment": 1}
+        mqtt_connection.publish(topic=ACK_TOPIC, payload=json.dumps(ack_message), qos=mqtt.QoS.AT_LEAST_ONCE)
+
 def on_connection_interrupted(connection, error, **kwargs):
     global is_connected
     is_connected = False
@@ -170,18 +479,21 @@ def setup_iot_connection():
     host_resolver = io.DefaultHostResolver(event_loop_group)
     client_bootstrap = io.ClientBootstrap(event_loop_group, host_resolver)
 
-    mqtt_connection = mqtt_connection_builder.mtls_from_path(
-        endpoint=ENDPOINT,
-        cert_filepath=PATH_TO_CERTIFICATE,
-        pri_key_filepath=PATH_TO_PRIVATE_KEY,
-        client_bootstrap=client_bootstrap,
-        ca_filepath=PATH_TO_AMAZON_ROOT_CA,
-        on_connection_interrupted=on_connection_interrupted,
-        on_connection_resumed=on_connection_resumed,
-        client_id=CLIENT_ID,
-        clean_session=False,
-        keep_alive_secs=30
-    )
+    # LOCAL_MQTT_BROKER=host:port ingests from device_simulator.py instead of AWS IoT
+    mqtt_connection = local_connection_from_env(CLIENT_ID, on_connection_interrupted, on_connection_resumed)
+    if mqtt_connection is None:
+        mqtt_connection = mqtt_connection_builder.mtls_from_path(
+            endpoint=ENDPOINT,
+            cert_filepath=PATH_TO_CERTIFICATE,
+            pri_key_filepath=PATH_TO_PRIVATE_KEY,
+            client_bootstrap=client_bootstrap,
+            ca_filepath=PATH_TO_AMAZON_ROOT_CA,
+            on_connection_interrupted=on_connection_interrupted,
+            on_connection_resumed=on_connection_resumed,
+            client_id=CLIENT_ID,
+            clean_session=False,
+            keep_alive_secs=30
+        )
 
     # Connect with retry
     while not is_connected:
@@ -209,6 +521,68 @@ iot_thread.daemon = True
 iot_thread.start()
 
 # ---------- API Endpoints ----------
+# Headers of a cached response that are replayed with its body
+CACHED_HEADERS = ("X-Next-Cursor", "X-Latest-Cursor")
+
+def requires_session(owner):
+    """
+    Check the "Authorization: Bearer <token>" session against owner(**view_args),
+    the email the resource belongs to. A missing token is only rejected when
+    REQUIRE_SESSION is set; an invalid or foreign one always is.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            header = request.headers.get("Authorization", "")
+            if not header:
+                if REQUIRE_SESSION:
+                    return jsonify({"error": "Session token required"}), 401
+                return view(**kwargs)
+            scheme, _, token = header.partition(" ")
+            email = session_tokens.verify(token.strip()) if scheme.lower() == "bearer" else None
+            if not email:
+                return jsonify({"error": "Invalid or expired session token"}), 401
+            if email != owner(**kwargs):
+                return jsonify({"error": "Session does not belong to this user"}), 403
+            return view(**kwargs)
+        return wrapper
+    return decorator
+
+def server_busy_response():
+    response = jsonify({"error": "Server busy, try again shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+@app.errorhandler(DatabaseUnavailable)
+def database_unavailable(e):
+    # Every connection is checked out: a retryable 503, not a 500 with a traceback
+    return server_busy_response()
+
+def cached_json(tag):
+    """
+    Serve a GET endpoint's 200 responses from response_cache with a strong ETag
+    (304 when If-None-Match matches). tag(**view_args) names the entry group that
+    the corresponding write invalidates.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            entry_tag = tag(**kwargs)
+            key = request.full_path
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation(entry_tag)
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                headers = {h: response.headers[h] for h in CACHED_HEADERS if h in response.headers}
+                entry = response_cache.put(key, response.get_data(), entry_tag, generation, headers)
+            response = Response(entry.body, status=200, mimetype="application/json", headers=entry.headers)
+            response.set_etag(entry.etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
 # User Registration
 @app.route('/register', methods=['POST'])
 def register():
@@ -221,9 +595,12 @@ def register():
         return jsonify({"error": "Missing required fields"}), 400
     
     email = data["email"]
-    password_hash = generate_password_hash(data["password"])
+    try:
+        password_hash = password_hasher.hash(data["password"])
+    except HasherBusy:
+        return server_busy_response()
     
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_db_connection()
     c = conn.cursor()
     try:
         c.execute('''
@@ -242,9 +619,11 @@ def register():
             VALUES (?, ?)
         ''', (email, json.dumps(default_settings)))
         conn.commit()
+        response_cache.invalidate(f"user_serial:{data['serial_no']}")
         
-        return jsonify({"message": "User registered successfully"}), 201
+        return jsonify({"message": "User registered successfully", **session_tokens.issue(email)}), 201
     except sqlite3.IntegrityError:
+        conn.rollback()
         return jsonify({"error": "User already exists"}), 409
     finally:
         conn.close()
@@ -256,31 +635,43 @@ def login():
     if not data or "email" not in data or "password" not in data:
         return jsonify({"error": "Missing email or password"}), 400
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE email = ?", (data["email"],))
-    user = c.fetchone()
-    conn.close()
+    conn = get_db_connection()
+    try:
+        user = conn.execute(SQL_USER_BY_EMAIL, (data["email"],)).fetchone()
+    finally:
+        conn.close()
 
-    if user and check_password_hash(user[4], data["password"]):  
+    try:
+        valid = bool(user) and password_hasher.check(user[4], data["password"])
+    except HasherBusy:
+        return server_busy_response()
+    if valid:
+        # Later calls send "Authorization: Bearer <token>" instead of the password
         return jsonify({
             "name": user[1],
             "contact": user[2],
             "address": user[3],
             "email": user[0],
-            "serial_no": user[5]
+            "serial_no": user[5],
+            **session_tokens.issue(user[0])
         }), 200
     return jsonify({"error": "Invalid credentials"}), 401
 
+# Password hashing pool queue metrics
+@app.route('/auth/stats', methods=['GET'])
+def auth_stats():
+    return jsonify(password_hasher.stats()), 200
+
 # Get Settings
 @app.route('/settings/<email>', methods=['GET'])
+@requires_session(lambda email: email)
+@cached_json(lambda email: f"settings:{email}")
 def get_settings(email):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT settings_json FROM settings WHERE email = ?", (email,))
-    settings = c.fetchone()
-    conn.close()
-    settings = c.fetchone()
+    conn = get_db_connection()
+    try:
+        settings = conn.execute(SQL_SETTINGS_BY_EMAIL, (email,)).fetchone()
+    finally:
+        conn.close()
 
     if settings:
         return jsonify(json.loads(settings[0])), 200
@@ -288,124 +679,494 @@ def get_settings(email):
 
 # Save Settings
 @app.route('/settings/<email>', methods=['POST'])
+@requires_session(lambda email: email)
 def save_settings(email):
     data = request.json
     if not data:
         return jsonify({"error": "No settings provided"}), 400
     
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("UPDATE settings SET settings_json = 1 WHERE email = 3", (json.dumps(data), email))
-    conn.commit()
-    conn.close()
+    conn = get_db_connection()
+    try:
+        conn.execute("UPDATE settings SET settings_json = ? WHERE email = ?", (json.dumps(data), email))
+        conn.commit()
+    finally:
+        conn.close()
+    response_cache.invalidate(f"settings:{email}")
     return jsonify({"message": "Settings saved"}), 200
 
+MAX_BULK_FRAMES = int(os.environ.get("MAX_BULK_FRAMES", "5000"))
+SQL_FRAME_EXISTS = "SELECT 1 FROM {table} WHERE serial_no = ? AND timestamp = ? AND device_data = ? LIMIT 1"
+# Entries without a timestamp: which of these frames of one serial are already stored (any time)
+SQL_FRAMES_STORED = "SELECT DISTINCT device_data FROM {table} WHERE serial_no = ? AND device_data IN ({marks})"
+
+def parse_bulk_item(item):
+    """
+    One bulk entry -> (device_status, device_data, timestamp or None). Accepts a raw
+    '*...#' frame, an OfflineQueue payload ({"device_status", "device_data"}, optionally
+    with "timestamp" as ISO text or epoch seconds), that payload JSON-encoded, or an
+    OfflineQueue file record ({"payload": ..., "enqueued_at": ...}).
+    Raises ValueError.
+    """
+    if isinstance(item, str):
+        text = item.strip()
+        if text.startswith("{"):
+            item = json.loads(text)
+        else:
+            return None, text, None
+    if isinstance(item, dict) and "device_data" not in item and "payload" in item:
+        device_status, device_data, timestamp = parse_bulk_item(item["payload"])
+        if timestamp is None:
+            timestamp = parse_bulk_timestamp(item.get("enqueued_at"))
+        return device_status, device_data, timestamp
+    if not isinstance(item, dict) or not isinstance(item.get("device_data"), str):
+        raise ValueError("expected a frame string or an object with device_data")
+    timestamp = parse_bulk_timestamp(item.get("timestamp", item.get("enqueued_at")))
+    return item.get("device_status"), item["device_data"], timestamp
+
+def parse_bulk_timestamp(value):
+    """ISO text or epoch seconds -> datetime (None stays None). Raises ValueError."""
+    if value is None:
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value)
+        return datetime.fromisoformat(str(value))
+    except (OverflowError, OSError) as e:
+        raise ValueError(f"timestamp out of range: {value!r}") from e
+
+def read_bulk_body():
+    """Request body -> list of entries: a JSON array (or {"frames": [...]}) or one entry per line"""
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("frames")
+        if not isinstance(data, list):
+            raise ValueError("JSON body must be an array of frames or {\"frames\": [...]}")
+        return data
+    return [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+
+def stored_untimed_frames(conn, rows):
+    """(serial_no, device_data) pairs of rows that are already stored, in any partition"""
+    frames = {}
+    for row in rows:
+        frames.setdefault(row[0], set()).add(row[3])
+    stored = set()
+    if not frames:
+        return stored
+    tables = device_partitions.tables(conn)
+    for serial_no, serial_frames in frames.items():
+        serial_frames = list(serial_frames)
+        # One pass over the serial's index range per chunk; stay below the bound-parameter limit
+        for i in range(0, len(serial_frames), 500):
+            chunk = serial_frames[i:i + 500]
+            marks = ", ".join("?" for _ in chunk)
+            for table in tables:
+                for (device_data,) in conn.execute(SQL_FRAMES_STORED.format(table=table, marks=marks),
+                                                   (serial_no, *chunk)):
+                    stored.add((serial_no, device_data))
+    return stored
+
+# Bulk ingest (replay of an offline backlog)
+@app.route('/device_data/bulk', methods=['POST'])
+def bulk_device_data():
+    """
+    Decode, dedup and store many frames in one transaction. Returns one status per
+    entry: inserted, duplicate (same serial/frame/timestamp earlier in the request or
+    already stored) or invalid (with the reason). Entries without a timestamp are
+    stored with the time of the request and count as duplicates when the same frame
+    of that serial is already stored at any time, so replaying a backlog is idempotent.
+    """
+    try:
+        items = read_bulk_body()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not items:
+        return jsonify({"error": "No frames provided"}), 400
+    if len(items) > MAX_BULK_FRAMES:
+        return jsonify({"error": f"At most {MAX_BULK_FRAMES} frames per request"}), 413
+
+    received_at = datetime.now()
+    results = []
+    candidates = []
+    seen = set()
+    for index, item in enumerate(items):
+        try:
+            device_status, device_data, timestamp = parse_bulk_item(item)
+        except (ValueError, TypeError) as e:
+            results.append({"index": index, "status": "invalid", "error": str(e)})
+            continue
+        frame = decode_frame(device_data)
+        if not frame or not frame.get("serial_no"):
+            results.append({"index": index, "status": "invalid", "error": "not a device frame"})
+            continue
+        serial_no = frame["serial_no"]
+        dedup_key = (serial_no, device_data, timestamp)
+        if dedup_key in seen:
+            results.append({"index": index, "status": "duplicate", "serial_no": serial_no})
+            continue
+        seen.add(dedup_key)
+        result = {"index": index, "status": "inserted", "serial_no": serial_no}
+        results.append(result)
+        row = (serial_no, timestamp or received_at, device_status, device_data, json.dumps(frame), frame)
+        candidates.append((result, row, timestamp is not None))
+
+    conn = get_db_connection()
+    try:
+        # IMMEDIATE: take the write lock before the duplicate check so nothing slips in between
+        conn.execute("BEGIN IMMEDIATE")
+        stored = stored_untimed_frames(conn, [row for _, row, has_timestamp in candidates if not has_timestamp])
+        rows = []
+        for result, row, has_timestamp in candidates:
+            if not has_timestamp:
+                if (row[0], row[3]) in stored:
+                    result["status"] = "duplicate"
+                    continue
+            # Only the partition of the row's month can hold a duplicate
+            elif device_partitions.tables(conn, start=row[1], end=row[1]):
+                exists = SQL_FRAME_EXISTS.format(table=device_partitions.table_for(row[1]))
+                if conn.execute(exists, (row[0], row[1], row[3])).fetchone():
+                    result["status"] = "duplicate"
+                    continue
+            rows.append(row)
+        rows.sort(key=lambda row: str(row[1]))
+        if rows:
+            write_device_frames(conn, rows)
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        return jsonify({"error": f"Bulk insert failed, nothing was stored: {e}"}), 500
+    finally:
+        conn.close()
+
+    for serial_no in {row[0] for row in rows}:
+        response_cache.invalidate(f"device_data:{serial_no}")
+    counts = {"inserted": 0, "duplicate": 0, "invalid": 0}
+    for result in results:
+        counts[result["status"]] += 1
+    return jsonify({**counts, "results": results}), 200
+
+def encode_cursor(timestamp, row_id):
+    raw = json.dumps([str(timestamp), row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(token):
+    """Cursor token -> (timestamp, id). An ISO datetime is accepted too (as id 0). Raises ValueError."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        timestamp, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(timestamp), int(row_id)
+    except Exception:
+        return str(datetime.fromisoformat(token)), 0
+
 # Get Device Data 
 @app.route('/device_data/<serial_no>', methods=['GET'])
+@cached_json(lambda serial_no: f"device_data:{serial_no}")
 def get_device_data(serial_no):
-    limit = request.args.get('limit', default=10, type=int)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT timestamp, device_status, device_data, parsed_data 
-        FROM device_data WHERE serial_no = ? 
-        ORDER BY timestamp DESC LIMIT ?
-    ''', (serial_no, limit))
-    data = c.fetchall()
-    conn.close()
-    
-    if data:
-        result = []
-        for row in data:
-            timestamp, device_status, device_data, parsed_data = row
-            parsed = None
+    """
+    Newest rows first, `limit` per page (max MAX_PAGE_SIZE).
+      ?cursor=<X-Next-Cursor>  next (older) page
+      ?since=<X-Latest-Cursor or ISO time>  only rows newer than that, oldest first
+      ?fields=timestamp,device_status  columns to return (id, timestamp, device_status,
+                                       device_data, parsed_data)
+    The body stays a JSON list; cursors come back in the X-Next-Cursor / X-Latest-Cursor headers.
+    """
+    limit = max(1, min(request.args.get('limit', default=10, type=int), MAX_PAGE_SIZE))
+    fields = request.args.get('fields')
+    fields = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else DEFAULT_DEVICE_DATA_FIELDS
+    unknown = [f for f in fields if f not in DEVICE_DATA_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}", "allowed": list(DEVICE_DATA_FIELDS)}), 400
+    since = request.args.get('since')
+    cursor = request.args.get('cursor')
+    try:
+        if since:
+            sql, bound = SQL_DEVICE_DATA_SINCE, decode_cursor(since)
+        else:
+            sql, bound = SQL_DEVICE_DATA_PAGE, decode_cursor(cursor) if cursor else (EXPORT_MAX_TS, 0)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor/since"}), 400
+
+    # Field names are whitelisted above; id and timestamp are always read for the cursors
+    columns = ", ".join(("id", "timestamp") + tuple(f for f in fields if f not in ("id", "timestamp")))
+    conn = get_db_connection()
+    try:
+        # Walk partitions away from the bound (older for pages, newer for since) until the page is full
+        if since:
+            tables = device_partitions.tables(conn, start=bound[0])
+        else:
+            tables = device_partitions.tables(conn, newest_first=True, end=bound[0])
+        rows = []
+        for table in tables:
+            rows += conn.execute(sql.format(columns=columns, table=table),
+                                 (serial_no, bound[0], bound[1], limit - len(rows))).fetchall()
+            if len(rows) >= limit:
+                break
+    finally:
+        conn.close()
+
+    if not rows and not since and not cursor:
+        return jsonify({"error": "No data found"}), 404
+
+    names = ("id", "timestamp") + tuple(f for f in fields if f not in ("id", "timestamp"))
+    result = []
+    for row in rows:
+        record = dict(zip(names, row))
+        if "parsed_data" in record:
             try:
-                if parsed_data:
-                    parsed = json.loads(parsed_data)
+                if record["parsed_data"]:
+                    record["parsed_data"] = json.loads(record["parsed_data"])
             except Exception:
-               
-                parsed = parsed_data
-            result.append({
-                "timestamp": timestamp,
-                "device_status": device_status,
-                "device_data": device_data,
-                "parsed_data": parsed
-            })
-        return jsonify(result), 200
-    
-    return jsonify({"error": "No data found"}), 404
+                pass
+        result.append({f: record[f] for f in fields})
+
+    response = jsonify(result)
+    if since:
+        newest = rows[-1] if rows else None
+        response.headers["X-Latest-Cursor"] = encode_cursor(newest[1], newest[0]) if newest else since
+    elif rows:
+        if len(rows) == limit:
+            response.headers["X-Next-Cursor"] = encode_cursor(rows[-1][1], rows[-1][0])
+        if not cursor:
+            response.headers["X-Latest-Cursor"] = encode_cursor(rows[0][1], rows[0][0])
+    return response, 200
+
+
+def parse_time_window():
+    """
+    ?from=&to= as ISO dates or datetimes -> (lower, upper) bounds comparable with the
+    stored timestamps. A date-only 'to' includes that whole day. Raises ValueError.
+    """
+    lower, upper = EXPORT_MIN_TS, EXPORT_MAX_TS
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if start:
+        lower = str(datetime.fromisoformat(start))
+    if end:
+        upper_dt = datetime.fromisoformat(end)
+        if len(end) <= 10:
+            upper_dt += timedelta(days=1)
+        upper = str(upper_dt)
+    return lower, upper
+
+# Latest decoded settings of a device
+@app.route('/devices/<serial_no>/latest', methods=['GET'])
+def get_device_latest(serial_no):
+    """
+    Newest settings frame of serial_no, already decoded (sections per mode with
+    typed values), plus when the device was last heard from. No frame parsing needed.
+    """
+    conn = get_db_connection()
+    try:
+        row = conn.execute(SQL_DEVICE_LATEST, (serial_no,)).fetchone()
+    finally:
+        conn.close()
+    if not row or row[4] is None:
+        return jsonify({"error": "No settings found for this serial"}), 404
+
+    data_id, settings_at, machine_type, active_mode, frame_json, device_data, last_seen, device_status = row
+    frame = json.loads(frame_json)
+    return jsonify({
+        "serial_no": serial_no,
+        "data_id": data_id,
+        "settings_at": settings_at,
+        "machine_type": machine_type,
+        "active_mode": active_mode,
+        "date": frame.get("date"),
+        "time": frame.get("time"),
+        "sections": frame.get("sections", {}),
+        "device_data": device_data,
+        "last_seen": last_seen,
+        "device_status": device_status,
+    }), 200
+
+# Known device serials (e.g. to seed the GUI's serial type-ahead)
+@app.route('/devices', methods=['GET'])
+def list_devices():
+    """
+    {"devices": [{"serial_no", "last_seen"}], "next_after"} in serial order, `limit` per
+    page (max MAX_DEVICE_SERIALS_PAGE); pass next_after back as ?after= for the next page.
+    """
+    after = request.args.get('after', '')
+    limit = max(1, min(request.args.get('limit', default=1000, type=int), MAX_DEVICE_SERIALS_PAGE))
+    conn = get_db_connection()
+    try:
+        rows = conn.execute(SQL_DEVICE_SERIALS, (after, limit)).fetchall()
+    finally:
+        conn.close()
+    return jsonify({
+        "devices": [{"serial_no": serial_no, "last_seen": last_seen} for serial_no, last_seen in rows],
+        "next_after": rows[-1][0] if len(rows) == limit else None,
+    }), 200
+
+def stats_query_args():
+    """?bucket=&from=&to=&limit= of the /stats endpoints. Raises ValueError."""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    try:
+        lower, upper = parse_time_window()
+    except ValueError:
+        raise ValueError("from/to must be ISO dates, e.g. 2025-01-31 or 2025-01-31T12:00:00")
+    limit = max(1, min(request.args.get('limit', default=31, type=int), MAX_STATS_BUCKETS))
+    return bucket, lower, upper, limit
+
+# Usage stats per serial, read from the incrementally maintained rollups
+@app.route('/stats/<serial_no>', methods=['GET'])
+def get_stats(serial_no):
+    """Frames, settings changes and mode distribution per hour/day/month bucket (?bucket=day)"""
+    try:
+        bucket, lower, upper, limit = stats_query_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = get_db_connection()
+    try:
+        buckets = read_rollups(conn, serial_no, bucket, lower, upper, limit)
+    finally:
+        conn.close()
+    return jsonify({"serial_no": serial_no, "bucket": bucket, "buckets": buckets}), 200
 
+# Fleet-wide usage stats (active / changed devices per bucket)
+@app.route('/stats', methods=['GET'])
+def get_fleet_stats():
+    try:
+        bucket, lower, upper, limit = stats_query_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    conn = get_db_connection()
+    try:
+        buckets = read_fleet_rollups(conn, bucket, lower, upper, limit)
+    finally:
+        conn.close()
+    return jsonify({"bucket": bucket, "buckets": buckets}), 200
 
 # Export CSV
 @app.route('/export_csv/<serial_no>', methods=['GET'])
 def export_csv(serial_no):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM device_data WHERE serial_no = ?", (serial_no,))
-    data = c.fetchall()
-    connect = "pending_json_file"
-    conn.close()
-    
-    if not data:
+    try:
+        lower, upper = parse_time_window()
+    except ValueError:
+        return jsonify({"error": "from/to must be ISO dates, e.g. 2025-01-31 or 2025-01-31T12:00:00"}), 400
+
+    conn = get_db_connection()
+    try:
+        # Only the monthly partitions overlapping the window, oldest first
+        tables = device_partitions.tables(conn, start=lower, end=upper)
+    finally:
+        conn.close()
+
+    def chunks():
+        # A pooled connection is held for one page only, never while the client reads,
+        # so slow downloads neither starve the pool nor pin a WAL snapshot
+        for table in tables:
+            sql = SQL_EXPORT_DEVICE_DATA.format(table=table)
+            after = (lower, 0)
+            while True:
+                conn = get_db_connection()
+                try:
+                    chunk = conn.execute(sql, (serial_no, *after, upper, EXPORT_CHUNK_ROWS)).fetchall()
+                except sqlite3.OperationalError as e:
+                    if "no such table" not in str(e):
+                        raise
+                    chunk = []  # archived by PartitionRetention meanwhile
+                finally:
+                    conn.close()
+                if not chunk:
+                    break
+                yield chunk
+                if len(chunk) < EXPORT_CHUNK_ROWS:
+                    break
+                after = (chunk[-1][2], chunk[-1][0])
+
+    rows = chunks()
+    first_chunk = next(rows, None)
+    if not first_chunk:
         return jsonify({"error": "No data found"}), 404
-    
-    output = python_io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id", "serial_no", "timestamp", "device_status", "device_data", "parsed_data"])
-    writer.writerows(data)
-    output.seek(0)
-    
-    return send_file(
-        python_io.BytesIO(output.getvalue().encode()),
+
+    def generate():
+        # One chunk of rows in memory at a time
+        buffer = python_io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "serial_no", "timestamp", "device_status", "device_data", "parsed_data"])
+        chunk = first_chunk
+        while chunk:
+            writer.writerows(chunk)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            chunk = next(rows, None)
+
+    return Response(
+        generate(),
         mimetype='text/csv',
-        as_attachment=True,
-        download_name=f"{serial_no}_data.csv"
+        headers={"Content-Disposition": f'attachment; filename="{serial_no}_data.csv"'}
     )
 
 # Export PDF
-@app.route('/export_pdf/<serial_no>', methods=['GET'])
-def export_pdf(serial_no):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT * FROM device_data WHERE serial_no = ?", (serial_no,))
-    data = c.fetchall()
-    conn.close()
-    
-    if not data:
-        return jsonify({"error": "No data found"}), 404
-    
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt=f"Device Data Report for Serial: {serial_no}", ln=1, align='C')
-    for row in data:
-        pdf.cell(200,10,txt =f"ID: {row[0]}"),
-        pdf.cell(200,20,txt =f"timestamp: {row[2]}, {serial_no}", ln=2, align='D')
-
-    for row in data:
-        pdf.cell(200, 10, txt=str(row), ln=1)
-
-    output = python_io.BytesIO()
-    pdf_bytes = pdf.output(dest='S').encode('latin1')
-    output.write(pdf_bytes)
-    output.seek(0)
+# Reports render on background workers; finished PDFs are cached per (serial, newest row, template)
+report_jobs = ReportJobs(
+    db_pool,
+    cache_dir=os.environ.get("REPORT_CACHE_DIR", "report_cache"),
+    workers=int(os.environ.get("REPORT_WORKERS", "2"))
+)
 
+def send_report(path, serial_no):
     return send_file(
-        output,
+        path,
         mimetype='application/pdf',
         as_attachment=True,
         download_name=f"{serial_no}_data.pdf"
     )
+
+def report_job_response(job):
+    body = job.to_dict()
+    body["status_url"] = f"/export_pdf/jobs/{job.job_id}"
+    if job.status == "done":
+        body["download_url"] = f"/export_pdf/jobs/{job.job_id}/download"
+    return jsonify(body), 200 if job.status == "done" else 202
+
+@app.route('/export_pdf/<serial_no>', methods=['GET'])
+def export_pdf(serial_no):
+    """Cached report is sent right away; otherwise a render job is started (202 + job status)"""
+    cached = report_jobs.cached(serial_no)
+    if cached:
+        return send_report(cached, serial_no)
+    job = report_jobs.submit(serial_no)
+    if not job:
+        return jsonify({"error": "No data found"}), 404
+    return report_job_response(job)
+
+@app.route('/export_pdf/<serial_no>', methods=['POST'])
+def create_pdf_job(serial_no):
+    job = report_jobs.submit(serial_no)
+    if not job:
+        return jsonify({"error": "No data found"}), 404
+    return report_job_response(job)
+
+@app.route('/export_pdf/jobs/<job_id>', methods=['GET'])
+def get_pdf_job(job_id):
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return report_job_response(job)
+
+@app.route('/export_pdf/jobs/<job_id>/download', methods=['GET'])
+def download_pdf_job(job_id):
+    job = report_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != "done" or not os.path.exists(job.path):
+        return report_job_response(job)
+    return send_report(job.path, job.serial_no)
     
 # Endpoint to get user info by email
 @app.route('/user/<email>', methods=['GET'])
+@requires_session(lambda email: email)
+@cached_json(lambda email: f"user:{email}")
 def get_user(email):
     conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM users WHERE email = ?", (email,))
+        cursor.execute(SQL_USER_PROFILE_BY_EMAIL, (email,))
         row = cursor.fetchone()
         if not row:
             # Try to fetch from external/source DB if available
@@ -425,20 +1186,18 @@ def get_user(email):
 
 # Endpoint to get user info by serial number
 @app.route('/user/serial/<serial_no>', methods=['GET'])
+@cached_json(lambda serial_no: f"user_serial:{serial_no}")
 def get_user_by_serial(serial_no):
     conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM users WHERE serial_no = ?", (serial_no,))
+        cursor.execute(SQL_USER_PROFILE_BY_SERIAL, (serial_no,))
         row = cursor.fetchone()
         if not row:
             return jsonify({"error": "User not found"}), 404
         
         columns = [col[0] for col in cursor.description]
         user = dict(zip(columns, row)) 
-        user = save(save_user.json)
         return jsonify(user), 200
     except sqlite3.Error as e:
         return jsonify({"error": str(e)}), 500
@@ -446,11 +1205,9 @@ def get_user_by_serial(serial_no):
         conn.close()
 def get_user_by_machine(serial_no):
     conn = get_db_connection()
-    if not conn:
-        return jsonify({"error": "Database connection failed"}), 500
     cursor = conn.cursor()
     try:
-        cursor.execute("SELECT * FROM users WHERE serial_no = ?", (serial_no,))
+        cursor.execute(SQL_USER_PROFILE_BY_SERIAL, (serial_no,))
         row = cursor.fetchone()
         if not row:
             return jsonify({"error": "User not found"}), 404
@@ -461,19 +1218,4 @@ def get_user_by_machine(serial_no):
     except sqlite3.Error as e:
         return jsonify({"error": str(e)}), 500
     finally:
-        conn.close() 
-    get_user_by_machine
-# Get Device Data 
-@app.route('/device_data/<serial_no>', methods=['GET'])
-def get_device_data(serial_no):
-    limit = request.args.get('limit', default=10, type=int)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        SELECT timestamp, device_status, device_data, parsed_data 
-        FROM device_data WHERE serial_no = ? 
-        ORDER BY timestamp DESC LIMIT ?
-    ''', (serial_no, limit))
-    data = c.fetchall()
-    conn.close()
-    
\ No newline at end of file
+        conn.close()